@@ -0,0 +1,43 @@
+"""Product seller_id foreign key
+
+Revision ID: 18_10_2026_12_00_00
+Revises: 18_10_2026_11_00_00
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_12_00_00'
+down_revision: Union[str, None] = '18_10_2026_11_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.add_column(sa.Column('seller_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_products_seller_id_users', 'users', ['seller_id'], ['id'])
+
+    # Backfill from the username the rows were linked by until now. Products
+    # whose seller no longer matches any user keep a NULL seller_id.
+    op.execute(
+        "UPDATE products SET seller_id = "
+        "(SELECT users.id FROM users WHERE users.username = products.seller) "
+        "WHERE seller_id IS NULL"
+    )
+
+    op.create_index('ix_products_seller_id_id', 'products', ['seller_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_seller_id_id', table_name='products')
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_constraint('fk_products_seller_id_users', type_='foreignkey')
+        batch_op.drop_column('seller_id')
@@ -0,0 +1,28 @@
+"""Product (updated_at, id) index for incremental exports
+
+Revision ID: 18_10_2026_13_00_00
+Revises: 18_10_2026_12_00_00
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_13_00_00'
+down_revision: Union[str, None] = '18_10_2026_12_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_updated_at_id', 'products', ['updated_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_updated_at_id', table_name='products')
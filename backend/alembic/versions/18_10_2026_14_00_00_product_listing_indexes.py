@@ -0,0 +1,43 @@
+"""Product listing sort and filter indexes
+
+Revision ID: 18_10_2026_14_00_00
+Revises: 18_10_2026_13_00_00
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_14_00_00'
+down_revision: Union[str, None] = '18_10_2026_13_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Expression indexes must match the ORDER BY in views/product.py PRODUCT_SORTS
+    op.create_index('ix_products_sold_id', 'products', [sa.text('coalesce(sold, 0)'), 'id'], unique=False)
+    op.create_index('ix_products_price_id', 'products', ['price', 'id'], unique=False)
+    op.create_index('ix_products_rating_id', 'products', [sa.text('coalesce(rating, 0)'), 'id'], unique=False)
+    op.create_index(
+        'ix_products_in_stock_sold_id', 'products', [sa.text('coalesce(sold, 0)'), 'id'], unique=False,
+        postgresql_where=sa.text('stock > 0'), sqlite_where=sa.text('stock > 0'),
+    )
+    op.create_index(
+        'ix_products_on_sale_id', 'products', ['id'], unique=False,
+        postgresql_where=sa.text('original_price > price'), sqlite_where=sa.text('original_price > price'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_on_sale_id', table_name='products')
+    op.drop_index('ix_products_in_stock_sold_id', table_name='products')
+    op.drop_index('ix_products_rating_id', table_name='products')
+    op.drop_index('ix_products_price_id', table_name='products')
+    op.drop_index('ix_products_sold_id', table_name='products')
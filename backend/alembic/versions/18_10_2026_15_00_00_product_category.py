@@ -0,0 +1,41 @@
+"""Product category and per-category counts
+
+Revision ID: 18_10_2026_15_00_00
+Revises: 18_10_2026_14_00_00
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_15_00_00'
+down_revision: Union[str, None] = '18_10_2026_14_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('products', sa.Column('category', sa.String(length=100), nullable=True))
+    op.create_index('ix_products_category_id', 'products', ['category', 'id'], unique=False)
+    op.create_table('categories',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('product_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Existing rows have no category yet, but keep this right if data was loaded by hand
+    op.execute(
+        "INSERT INTO categories (name, product_count) "
+        "SELECT category, count(*) FROM products WHERE category IS NOT NULL GROUP BY category"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('categories')
+    op.drop_index('ix_products_category_id', table_name='products')
+    op.drop_column('products', 'category')
@@ -0,0 +1,49 @@
+"""Unique cart per user and unique product per cart
+
+Revision ID: 18_10_2026_16_00_00
+Revises: 18_10_2026_15_00_00
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_16_00_00'
+down_revision: Union[str, None] = '18_10_2026_15_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Concurrent requests could create duplicates until now. Merge them first:
+    # every user's items move to their oldest cart, then duplicate lines are
+    # folded into the oldest line with the quantities summed.
+    op.execute(
+        "UPDATE cart_items SET cart_id = ("
+        "SELECT MIN(c2.id) FROM carts c1 JOIN carts c2 ON c2.user_id = c1.user_id "
+        "WHERE c1.id = cart_items.cart_id)"
+    )
+    op.execute("DELETE FROM carts WHERE id NOT IN (SELECT MIN(id) FROM carts GROUP BY user_id)")
+    op.execute(
+        "UPDATE cart_items SET quantity = ("
+        "SELECT SUM(c2.quantity) FROM cart_items c2 "
+        "WHERE c2.cart_id = cart_items.cart_id AND c2.product_id = cart_items.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute("DELETE FROM cart_items WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id)")
+
+    op.drop_index('ix_carts_user_id', table_name='carts')
+    op.create_index('ix_carts_user_id', 'carts', ['user_id'], unique=True)
+    op.create_index('uq_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_cart_items_cart_id_product_id', table_name='cart_items')
+    op.drop_index('ix_carts_user_id', table_name='carts')
+    op.create_index('ix_carts_user_id', 'carts', ['user_id'], unique=False)
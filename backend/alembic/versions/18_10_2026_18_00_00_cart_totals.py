@@ -0,0 +1,36 @@
+"""Denormalized cart totals
+
+Revision ID: 18_10_2026_18_00_00
+Revises: 18_10_2026_17_00_00
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '18_10_2026_18_00_00'
+down_revision: Union[str, None] = '18_10_2026_17_00_00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('carts', sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('carts', sa.Column('grand_total', sa.Float(), server_default='0', nullable=False))
+    # Backfill from the existing lines; from here on the application keeps them current
+    op.execute(
+        "UPDATE carts SET "
+        "item_count = (SELECT COALESCE(SUM(quantity), 0) FROM cart_items WHERE cart_items.cart_id = carts.id), "
+        "grand_total = (SELECT COALESCE(SUM(price_at_add * quantity), 0) FROM cart_items WHERE cart_items.cart_id = carts.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('carts', 'grand_total')
+    op.drop_column('carts', 'item_count')
@@ -0,0 +1,134 @@
+# benchmarks/add_to_cart.py
+"""
+Add-to-cart under concurrent load: the original read-check-write flow
+against the single-statement upserts of ecommerce/carts.py.
+
+    python -m benchmarks.add_to_cart --threads 8 --adds 1200
+
+Each thread runs adds of one unit for random (user, product) pairs drawn
+from --users buyers and --products hot products, one transaction per add,
+and each add ends by loading and serializing the cart, as the view does.
+Both flows run below the WSGI layer on the same schema, so the difference
+is the statements. Failed adds are counted by exception: the original flow
+can lose a race on the unique (cart_id, product_id) and carts.user_id
+indexes, which is the duplicate line it used to create. On SQLite the tail
+is set by the database-wide write lock in both cases.
+"""
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ecommerce.carts import ensure_cart_id, upsert_cart_item
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.product import Product
+from ecommerce.models.user import User
+from ecommerce.schemas.cart import CartSchema
+from ecommerce.views.cart import load_cart
+
+from .common import benchmark_parser, scratch_engine, scratch_url, seed_products, summarize
+
+
+def original_add(session, user_id, product_id, quantity):
+    """The view before the upserts: read the product, the cart and the line, check stock in Python, write."""
+    product = session.get(Product, product_id)
+    if product is None or product.price is None or (product.stock is not None and product.stock < quantity):
+        return None
+    cart = session.query(Cart).filter(Cart.user_id == user_id).first()
+    if cart is None:
+        cart = Cart(user_id=user_id)
+        session.add(cart)
+        session.flush()
+    item = session.query(CartItem).filter_by(cart_id=cart.id, product_id=product_id).first()
+    if item is not None:
+        if product.stock is not None and product.stock < item.quantity + quantity:
+            return None
+        item.quantity = item.quantity + quantity
+    else:
+        session.add(CartItem(cart_id=cart.id, product_id=product_id, quantity=quantity, price_at_add=product.price))
+    session.flush()
+    return CartSchema().dump(load_cart(session, cart.id))
+
+
+def upsert_add(session, user_id, product_id, quantity):
+    """Today's view: the cart upsert, the stock-guarded line upsert, the cart reload."""
+    cart_id = ensure_cart_id(session, user_id)
+    if upsert_cart_item(session, cart_id, product_id, quantity) is None:
+        return None
+    return CartSchema().dump(load_cart(session, cart_id))
+
+
+def seed_users(engine, count):
+    with engine.begin() as connection:
+        connection.execute(insert(User), [
+            {'username': f'buyer{i}', 'email': f'buyer{i}@example.com', 'password': '-'} for i in range(count)
+        ])
+
+
+def run(engine, add, threads, adds, users, products, seed):
+    """Run `adds` concurrent adds; returns (per-add seconds, Counter of failures, wall seconds)."""
+    with engine.begin() as connection:
+        connection.execute(delete(CartItem))
+        connection.execute(delete(Cart))
+    rng = random.Random(seed)
+    work = queue.Queue()
+    for _ in range(adds):
+        work.put((rng.randint(1, users), rng.randint(1, products)))
+    timings, failures = [], Counter()
+
+    def worker():
+        while True:
+            try:
+                user_id, product_id = work.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            try:
+                with Session(bind=engine) as session, session.begin():
+                    if add(session, user_id, product_id, 1) is None:
+                        failures['rejected'] += 1
+            except SQLAlchemyError as e:
+                failures[type(getattr(e, 'orig', None) or e).__name__] += 1
+            timings.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return timings, failures, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--adds', type=int, default=1200, help='adds per flow')
+    parser.add_argument('--users', type=int, default=200, help='distinct buyers')
+    parser.add_argument('--products', type=int, default=20, help='hot products the adds go to')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    engine = scratch_engine(scratch_url(args.url, 'add_to_cart'), pool_size=args.threads)
+    seed_products(engine, args.products)
+    with engine.begin() as connection:
+        # Carts don't take stock out, but every add must pass the stock check
+        connection.execute(update(Product).values(stock=1_000_000))
+    seed_users(engine, args.users)
+    print(f'{engine.dialect.name}, {args.threads} threads, {args.adds} adds over '
+          f'{args.users} buyers x {args.products} products')
+    for label, add in (('original read-check-write', original_add), ('single-statement upserts', upsert_add)):
+        timings, failures, wall = run(engine, add, args.threads, args.adds, args.users, args.products, args.seed)
+        print(f'  {label:<26} {summarize(timings)}  {len(timings) / wall:.0f} adds/s')
+        for name, count in failures.most_common():
+            print(f'    {count} failed: {name}')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/auth.py
+"""
+Auth overhead per request, before and after: the login/signup path (tween
+plus view each verifying the token) and an authenticated view, with and
+without the verified-token cache.
+
+    python -m benchmarks.auth --requests 20000
+
+No database: this is the token check alone, in microseconds per request.
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+from ecommerce.security import JWT_SECRET, AppRequest, VerifiedTokenCache, get_user_id_from_jwt, is_authenticated
+
+
+class Registry:
+    jwt_cache = None
+
+
+def per_request(func, requests):
+    """Microseconds per call of func(), over `requests` calls."""
+    started = time.perf_counter()
+    for _ in range(requests):
+        func()
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000, help='timed requests per case')
+    args = parser.parse_args(argv)
+
+    token = jwt.encode({'user_id': 1, 'exp': datetime.now() + timedelta(hours=1)}, JWT_SECRET, algorithm='HS256')
+    header = f'Bearer {token}'
+
+    def old_decode():
+        scheme, token_part = header.split(' ', 1)
+        return jwt.decode(token_part, JWT_SECRET, algorithms=['HS256'])
+
+    cases = [
+        ('before: view only (1 decode)', old_decode),
+        ('before: tween + view (2 decodes)', lambda: (old_decode(), old_decode())),
+    ]
+    for cached in (False, True):
+        registry = Registry()
+        if cached:
+            registry.jwt_cache = VerifiedTokenCache()
+
+        def handle(registry=registry):
+            request = AppRequest.blank('/api/cart', headers={'Authorization': header})
+            request.registry = registry
+            is_authenticated(request)       # tween
+            get_user_id_from_jwt(request)   # view
+            get_user_id_from_jwt(request)   # helper called again
+        cases.append(('after: tween + view' + (' + verified-token cache' if cached else ''), handle))
+    cases.append(('(AppRequest.blank alone, included above)',
+                  lambda: AppRequest.blank('/api/cart', headers={'Authorization': header})))
+
+    for label, func in cases:
+        print(f'{label:<44} {per_request(func, args.requests):7.2f}µs/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/cart_patch.py
+"""
+Editing a 20-line cart: one PATCH /api/cart against twenty
+PUT /api/cart/items/{id}, with stock reservations off and on.
+
+    python -m benchmarks.cart_patch --lines 20
+
+Each edit sets every line's quantity, alternately growing and shrinking
+all of them, so no operation is a no-op. The run reports the time and
+the SQL statements per whole-cart edit: growing lines are stock checked
+in the write, shrinking ones are not.
+"""
+import contextlib
+import io
+
+from sqlalchemy import update
+
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+
+from .common import (
+    benchmark_parser, captured_statements, make_app, scratch_engine, scratch_url, seed_products, summarize, timed,
+)
+
+
+def signup(app, name):
+    """A buyer's Authorization header."""
+    email = f'{name}@example.com'
+    app.post_json('/signup', {'username': name, 'email': email, 'password': 'password1'})
+    token = app.post_json('/login', {'email': email, 'password': 'password1'}).json['token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def edits(app, auth, item_ids):
+    """The two ways to set every line: (name, function(quantity))."""
+    def puts(quantity):
+        for item_id in item_ids:
+            app.put_json(f'/api/cart/items/{item_id}', {'quantity': quantity}, headers=auth)
+
+    def patch(quantity):
+        operations = [{'op': 'set', 'item_id': item_id, 'quantity': quantity} for item_id in item_ids]
+        app.patch_json('/api/cart', {'operations': operations}, headers=auth)
+
+    return [(f'{len(item_ids)} x PUT /api/cart/items/{{id}}', puts), ('1 x PATCH /api/cart', patch)]
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20, help='cart lines')
+    parser.add_argument('--repeat', type=int, default=50, help='timed whole-cart edits')
+    args = parser.parse_args(argv)
+
+    url = scratch_url(args.url, 'cart_patch')
+    engine = scratch_engine(url)
+    seed_products(engine, args.lines)
+    with engine.begin() as connection:
+        # Every edit must pass the stock check, holds included
+        connection.execute(update(Product).values(stock=1_000_000, price=10.0))
+    print(f'{engine.dialect.name}, a {args.lines}-line cart')
+
+    for reservations in ('false', 'true'):
+        app = make_app(url, **{'stock_reservations.enabled': reservations, 'passwords.bcrypt_rounds': '4'})
+        with contextlib.redirect_stdout(io.StringIO()):
+            auth = signup(app, f'buyer{reservations}')
+            for product_id in range(1, args.lines + 1):
+                app.post_json('/api/cart/items', {'product_id': product_id, 'quantity': 1}, headers=auth)
+            item_ids = [item['id'] for item in app.get('/api/cart', headers=auth).json['items']]
+        print(f'\nstock_reservations.enabled = {reservations}')
+        quantity = 1
+        for name, edit in edits(app, auth, item_ids):
+            counts = []
+            for quantity in (quantity + 1, quantity):
+                with captured_statements(DBSession.get_bind()) as statements, contextlib.redirect_stdout(io.StringIO()):
+                    edit(quantity)
+                counts.append(len(statements))
+            quantities = iter([quantity + 1, quantity] * args.repeat)
+            print(f'  {name:<32} {summarize(timed(lambda: edit(next(quantities)), args.repeat))}  '
+                  f'statements: {counts[0]} growing, {counts[1]} shrinking')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/checkout.py
+"""
+Checkout under contention: many buyers placing orders for the same few
+hot products at once.
+
+    python -m benchmarks.checkout --threads 32 --checkouts 5000 --skus 5
+
+--threads buyers check out --checkouts carts between them, every cart
+holding 1-2 units of each of the same --skus products, so every checkout
+competes for the same rows. Stock is sized to run out near the end, so
+both outcomes are exercised. The run reports orders/s and checks that
+stock never went negative and that what was sold equals what was ordered.
+"""
+import random
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ecommerce.carts import delete_cart_items, ensure_cart_id, upsert_cart_item
+from ecommerce.models.order import OrderItem
+from ecommerce.models.product import Product
+from ecommerce.models.user import User
+from ecommerce.orders import CheckoutError, place_order
+
+from .common import benchmark_parser, scratch_engine, scratch_url, summarize
+
+
+def buyer(engine, user_id, product_ids, count, seed, outcomes, timings):
+    """Fill the cart and check it out `count` times; a failed checkout empties the cart."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        with Session(bind=engine) as session, session.begin():
+            cart_id = ensure_cart_id(session, user_id)
+            for product_id in product_ids:
+                upsert_cart_item(session, cart_id, product_id, rng.randint(1, 2), check_stock=False)
+        started = time.perf_counter()
+        outcome = 'placed'
+        session = Session(bind=engine)
+        try:
+            with session.begin():
+                place_order(session, user_id, 'standard', 'credit')
+        except CheckoutError:
+            outcome = 'short'
+        except OperationalError:  # deadlock or lock timeout
+            outcome = 'errors'
+        finally:
+            session.close()
+        if outcome != 'placed':
+            with Session(bind=engine) as session, session.begin():
+                delete_cart_items(session, user_id)
+        outcomes.append(outcome)
+        timings.append(time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--checkouts', type=int, default=2000, help='checkouts across all threads')
+    parser.add_argument('--skus', type=int, default=5, help='hot products in every cart')
+    parser.add_argument('--stock', type=int, help='units of each hot product (default: 1.4 x --checkouts)')
+    args = parser.parse_args(argv)
+
+    engine = scratch_engine(scratch_url(args.url, 'checkout'), pool_size=args.threads)
+    stock = args.stock if args.stock is not None else int(args.checkouts * 1.4)
+    with Session(bind=engine) as session, session.begin():
+        users = [User(username=f'buyer{i}', email=f'buyer{i}@example.com', password='-') for i in range(args.threads)]
+        products = [Product(name=f'hot {i}', seller='bench', description='', price=1.0 + i, stock=stock)
+                    for i in range(args.skus)]
+        session.add_all(users + products)
+        session.flush()
+        user_ids = [user.id for user in users]
+        product_ids = [product.id for product in products]
+
+    outcomes = []
+    timings = []
+    per_thread, extra = divmod(args.checkouts, args.threads)
+    workers = [
+        threading.Thread(target=buyer, args=(
+            engine, user_id, product_ids, per_thread + (1 if i < extra else 0), i, outcomes, timings,
+        ))
+        for i, user_id in enumerate(user_ids)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    outcomes = Counter(outcomes)
+
+    with Session(bind=engine) as session:
+        stocks = dict(session.query(Product.id, Product.stock).filter(Product.id.in_(product_ids)))
+        sold = dict(session.query(Product.id, Product.sold).filter(Product.id.in_(product_ids)))
+        ordered = dict(
+            session.query(OrderItem.product_id, func.sum(OrderItem.quantity))
+            .filter(OrderItem.product_id.in_(product_ids))
+            .group_by(OrderItem.product_id)
+        )
+    consistent = all(
+        stocks[product_id] >= 0
+        and stocks[product_id] + sold[product_id] == stock
+        and ordered.get(product_id, 0) == sold[product_id]
+        for product_id in product_ids
+    )
+    print(f'{engine.dialect.name}, {args.checkouts} checkouts of {args.skus} shared SKUs over {args.threads} threads')
+    print(f'  {elapsed:.2f}s ({outcomes["placed"] / elapsed:.0f} orders/s): {outcomes["placed"]} placed, '
+          f'{outcomes["short"]} out of stock, {outcomes["errors"]} lock errors')
+    print(f'  checkout transaction {summarize(timings)}; stock left {sorted(stocks.values())}, '
+          f'{"consistent" if consistent else "OVERSOLD OR LOST UNITS"}')
+    engine.dispose()
+    return 0 if consistent and not outcomes['errors'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,132 @@
+# benchmarks/common.py
+"""
+Shared setup for the benchmark scripts: a scratch database, a synthetic
+catalog, the app to drive and latency summaries. Run a script from
+backend/ as a module:
+
+    python -m benchmarks.product_list --sizes 10000,100000
+    python -m benchmarks.product_list --url postgresql://.../scratch
+
+Without --url each run gets a throwaway SQLite file. A --url database is
+wiped (drop_all/create_all): point it at a scratch database only.
+"""
+import argparse
+import contextlib
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert
+from webtest import TestApp
+
+from ecommerce import main
+from ecommerce.models.meta import Base, DBSession
+from ecommerce.models.product import Product
+
+WORDS = (
+    'phone case charger cable wireless bluetooth speaker headphones laptop stand keyboard mouse monitor '
+    'camera lens tripod watch strap fitness tracker backpack bottle lamp desk chair mug kettle blender '
+    'knife pan towel pillow blanket shoe sneaker jacket shirt dress scarf glove wallet belt sunglasses '
+    'drone router tablet stylus battery adapter hub dock microphone webcam printer ink notebook pen'
+).split()
+CATEGORIES = ('electronics', 'home', 'fashion', 'sports', 'office', None)
+
+
+def benchmark_parser(description):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--url', help='scratch database URL, wiped first (default: a throwaway SQLite file)')
+    return parser
+
+
+def scratch_url(url=None, name='benchmark'):
+    """`url`, or a new SQLite file under the temp directory."""
+    if url:
+        return url
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='ecommerce-bench-'), f'{name}.db')
+
+
+def scratch_engine(url, **kwargs):
+    """An engine on an emptied schema; SQLite waits on its write lock instead of failing."""
+    if url.startswith('sqlite'):
+        kwargs.setdefault('connect_args', {'timeout': 60})
+    engine = create_engine(url, **kwargs)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def product_rows(count, seed=1):
+    """`count` synthetic products as insert() parameter dicts."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        price = round(rng.uniform(1, 500), 2)
+        yield {
+            # The model number makes a rare term; WORDS are all common
+            'name': ' '.join(rng.choices(WORDS, k=rng.randint(2, 4))) + f' x{rng.randint(100, 9999)}',
+            'seller': 'bench',
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(20, 60))),
+            'price': price,
+            'original_price': round(price * rng.uniform(1.05, 1.5), 2) if rng.random() < 0.2 else None,
+            'rating': round(rng.uniform(0, 5), 1),
+            'sold': rng.randint(0, 10000),
+            'stock': rng.randint(0, 200) if rng.random() < 0.9 else 0,
+            'category': rng.choice(CATEGORIES),
+        }
+
+
+def seed_products(engine, count, seed=1, batch_size=10000):
+    """Bulk insert `count` synthetic products; returns the seconds it took."""
+    started = time.perf_counter()
+    rows = product_rows(count, seed)
+    with engine.begin() as connection:
+        while True:
+            batch = [row for _, row in zip(range(batch_size), rows)]
+            if not batch:
+                break
+            connection.execute(insert(Product), batch)
+    return time.perf_counter() - started
+
+
+def make_app(url, **settings):
+    """The WSGI app on `url` (schema already in place), wrapped for WebTest."""
+    DBSession.remove()
+    return TestApp(main({}, **{'sqlalchemy.url': url, **settings}))
+
+
+@contextlib.contextmanager
+def captured_statements(engine):
+    """(statement, parameters) pairs sent to `engine` while the block runs."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+def timed(func, repeat):
+    """Seconds taken by each of `repeat` calls of func(); the views' debug prints go to /dev/null."""
+    timings = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(timings):
+    """'p50 1.23ms p99 4.56ms' for a list of durations in seconds."""
+    return (f'p50 {percentile(timings, 0.5) * 1e3:.2f}ms '
+            f'p99 {percentile(timings, 0.99) * 1e3:.2f}ms (n={len(timings)})')
+
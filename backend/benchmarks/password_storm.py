@@ -0,0 +1,96 @@
+# benchmarks/password_storm.py
+"""
+A login storm against catalog reads: bcrypt on the request threads
+against bcrypt through a PasswordHasher pool.
+
+    python -m benchmarks.password_storm --seconds 5 --logins-per-second 40
+
+A waitress-like server of --server-threads threads serves cheap catalog
+reads (a few ms of work each, 100/s) while logins arrive at random at
+--logins-per-second. For each setup the run reports catalog read latency
+and how many logins were served or turned away with a 503. No database.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from ecommerce.passwords import DEFAULT_BCRYPT_ROUNDS, PasswordHasher, PasswordHasherBusy
+
+from .common import percentile, summarize
+
+PRODUCT = {'id': 1, 'name': 'Phone', 'description': 'x' * 200, 'price': 9.99, 'stock': 3}
+
+
+def catalog_read():
+    for _ in range(50):
+        json.dumps(PRODUCT)
+
+
+def storm(hasher, hashed, seconds, server_threads, logins_per_second):
+    """Run the mixed load once; returns (read latencies in seconds, {'ok': n, 'busy': n})."""
+    server = ThreadPoolExecutor(max_workers=server_threads)
+    outcomes = {'ok': 0, 'busy': 0}
+    reads = []
+    lock = threading.Lock()
+
+    def login():
+        try:
+            if hasher is None:
+                bcrypt.checkpw(b'password1', hashed.encode('utf-8'))
+            else:
+                hasher.verify('password1', hashed)
+            outcome = 'ok'
+        except PasswordHasherBusy:
+            outcome = 'busy'
+        with lock:
+            outcomes[outcome] += 1
+
+    def read(submitted):
+        catalog_read()
+        with lock:
+            reads.append(time.perf_counter() - submitted)
+
+    rng = random.Random(1)
+    futures = []
+    started = time.perf_counter()
+    next_login = next_read = started
+    while time.perf_counter() - started < seconds:
+        now = time.perf_counter()
+        if now >= next_login:
+            futures.append(server.submit(login))
+            next_login += rng.expovariate(logins_per_second)
+        if now >= next_read:
+            futures.append(server.submit(read, now))
+            next_read += 0.01
+        time.sleep(0.0005)
+    for future in futures:
+        future.result()
+    server.shutdown()
+    return reads, outcomes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0, help='length of each run')
+    parser.add_argument('--server-threads', type=int, default=4, help='request threads (waitress: 4)')
+    parser.add_argument('--logins-per-second', type=float, default=40)
+    parser.add_argument('--rounds', type=int, default=DEFAULT_BCRYPT_ROUNDS, help='bcrypt cost')
+    args = parser.parse_args(argv)
+
+    hashed = bcrypt.hashpw(b'password1', bcrypt.gensalt(args.rounds)).decode('utf-8')
+    pool = PasswordHasher(rounds=args.rounds, workers=1, max_pending=max(args.server_threads // 2, 1))
+    for label, hasher in (('inline bcrypt', None), ('hasher pool', pool)):
+        reads, outcomes = storm(hasher, hashed, args.seconds, args.server_threads, args.logins_per_second)
+        print(f'{label:>14}: catalog reads {summarize(reads)} max {percentile(reads, 1.0) * 1e3:.2f}ms; '
+              f'logins {outcomes["ok"]} served, {outcomes["busy"]} turned away (503)')
+        if hasher is not None:
+            print(f'{"":>14}  {hasher.stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/product_filters.py
+"""
+GET /api/get-products filters and sorts: the query plan of each listing
+query and its latency, on a synthetic catalog.
+
+    python -m benchmarks.product_filters --size 100000
+
+The statements explained are the ones the view actually sends (captured
+from a request), so a sort key or filter that drifts away from its index in
+models/product.py shows up here as a table scan plus a sort: "SCAN
+products" / "USE TEMP B-TREE FOR ORDER BY" on SQLite, "Seq Scan" / "Sort"
+on PostgreSQL.
+"""
+import contextlib
+import io
+
+from ecommerce.models.meta import DBSession
+
+from .common import (
+    benchmark_parser, captured_statements, make_app, scratch_engine, scratch_url, seed_products, summarize, timed,
+)
+
+CASES = (
+    'sort=id',
+    'sort=sold',
+    'sort=rating',
+    'sort=price',
+    'sort=price_desc',
+    'in_stock=1&sort=sold',
+    'on_sale=1',
+    'category=home',
+    'category=home&sort=price',
+    'category=home&sort=sold',
+    'min_price=50&max_price=100&sort=price',
+    'in_stock=1&sort=sold&facets=1',
+)
+EXPLAIN_PREFIX = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}
+
+
+def listing_statement(app, path):
+    """The products query behind GET `path`, with its parameters."""
+    engine = DBSession.get_bind()
+    with captured_statements(engine) as statements, contextlib.redirect_stdout(io.StringIO()):
+        app.get(path)
+    return next((statement, parameters) for statement, parameters in statements if 'FROM products' in statement)
+
+
+def explain(engine, statement, parameters):
+    """The database's plan for `statement`, one line per node."""
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(EXPLAIN_PREFIX[engine.dialect.name] + statement, parameters)
+        # SQLite: (id, parent, notused, detail); PostgreSQL: one text column
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100_000, help='catalog size')
+    parser.add_argument('--limit', type=int, default=24, help='page size')
+    parser.add_argument('--repeat', type=int, default=100, help='timed requests per page')
+    args = parser.parse_args(argv)
+
+    url = scratch_url(args.url, 'product_filters')
+    engine = scratch_engine(url)
+    print(f'{args.size} products (seeded in {seed_products(engine, args.size):.1f}s), {engine.dialect.name}')
+    if engine.dialect.name not in EXPLAIN_PREFIX:
+        parser.error(f'no EXPLAIN support for {engine.dialect.name}')
+    app = make_app(url)
+
+    for case in CASES:
+        first = f'/api/get-products?limit={args.limit}&{case}'
+        cursor = app.get(first).json['next_cursor']
+        second = f'{first}&cursor={cursor}'
+        print(f'\n{case}')
+        for line in explain(engine, *listing_statement(app, second)):
+            print(f'    {line}')
+        print(f'  {"page 1":<8} {summarize(timed(lambda: app.get(first), args.repeat))}')
+        print(f'  {"page 2":<8} {summarize(timed(lambda: app.get(second), args.repeat))}')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
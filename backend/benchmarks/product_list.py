@@ -0,0 +1,92 @@
+# benchmarks/product_list.py
+"""
+GET /api/get-products: the original full-table listing against keyset
+pages, at several catalog sizes.
+
+    python -m benchmarks.product_list --sizes 10000,100000,1000000
+
+For every size it times
+- the original view: DBSession.query(Product).all() plus a dict per row;
+- today's unpaged list (selected columns only, no description);
+- the first keyset page and a page from the middle of the catalog,
+  sorted by id and by sold.
+"""
+import json
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ecommerce.models.product import Product
+from ecommerce.pagination import encode_cursor
+
+from .common import benchmark_parser, make_app, scratch_engine, scratch_url, seed_products, summarize, timed
+
+
+def original_listing(engine):
+    """The view as it was before keyset pagination, minus the WSGI layer."""
+    with Session(bind=engine) as session:
+        result = []
+        for p in session.query(Product).all():
+            result.append({
+                'id': p.id,
+                'name': p.name,
+                'price': p.price,
+                'originalPrice': p.original_price,
+                'image': p.image_url or '/api/placeholder/300/200',
+                'rating': p.rating,
+                'sold': p.sold,
+                'seller': p.seller,
+                'stock': p.stock,
+            })
+        return json.dumps(result)
+
+
+def middle_cursors(engine, size):
+    """Cursors that resume the id and sold orderings halfway through the catalog."""
+    with Session(bind=engine) as session:
+        row = (
+            session.query(func.coalesce(Product.sold, 0).label('sold'), Product.id)
+            .order_by(func.coalesce(Product.sold, 0).desc(), Product.id.desc())
+            .offset(size // 2)
+            .first()
+        )
+    return {'id': encode_cursor([size // 2]), 'sold': encode_cursor([row.sold, row.id])}
+
+
+def run(url, size, full_repeat, page_repeat, limit):
+    engine = scratch_engine(url)
+    print(f'\n{size} products (seeded in {seed_products(engine, size):.1f}s)')
+    app = make_app(url)
+    cursors = middle_cursors(engine, size)
+
+    body = original_listing(engine)
+    print(f'  {"original full table (ORM, all columns)":<44} {summarize(timed(lambda: original_listing(engine), full_repeat))}'
+          f'  {len(body) / 1e6:.1f}MB')
+    response = app.get('/api/get-products')
+    print(f'  {"unpaged list (selected columns)":<44} '
+          f'{summarize(timed(lambda: app.get("/api/get-products"), full_repeat))}  {len(response.body) / 1e6:.1f}MB')
+    for sort in ('id', 'sold'):
+        first = f'/api/get-products?limit={limit}&sort={sort}'
+        middle = f'{first}&cursor={cursors[sort]}'
+        response = app.get(first)
+        assert len(response.json['items']) == limit
+        print(f'  {f"keyset page 1, sort={sort}":<44} {summarize(timed(lambda: app.get(first), page_repeat))}'
+              f'  {len(response.body) / 1e3:.1f}kB')
+        print(f'  {f"keyset page at {size // 2}, sort={sort}":<44} {summarize(timed(lambda: app.get(middle), page_repeat))}')
+    engine.dispose()
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma separated catalog sizes')
+    parser.add_argument('--limit', type=int, default=24, help='keyset page size')
+    parser.add_argument('--page-repeat', type=int, default=200, help='timed requests per keyset page')
+    args = parser.parse_args(argv)
+    for size in [int(size) for size in args.sizes.split(',')]:
+        # Whole-catalog reads get slow fast; keep each size to a few seconds of them
+        full_repeat = max(3, min(50, 500_000 // size))
+        run(scratch_url(args.url, f'products_{size}'), size, full_repeat, args.page_repeat, args.limit)
+
+
+if __name__ == '__main__':
+    main()
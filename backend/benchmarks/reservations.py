@@ -0,0 +1,111 @@
+# benchmarks/reservations.py
+"""
+Flash-sale stock holds: reservation throughput on one hot SKU, optimistic
+(one products row) against sharded (stock spread over stock_shards rows).
+
+    python -m benchmarks.reservations --threads 16 --stock 2000 --shards 8
+
+For each mode, --threads buyers reserve one unit at a time, one
+transaction each, until the SKU sells out. The run reports
+reservations/s and checks that exactly --stock units were held with no
+counter below zero. It then times releasing every hold through the
+expired-hold sweep and checks the stock came back. tests/test_reservations.py
+asserts the same invariants on every test run.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from ecommerce.models.product import Product
+from ecommerce.models.reservation import StockHold, StockShard
+from ecommerce.models.user import User
+from ecommerce.reservations import StockReservations, release_expired_holds, split_stock, utcnow
+
+from .common import benchmark_parser, scratch_engine, scratch_url
+
+
+def sell_out(engine, reservations, user_id, product_id, threads):
+    """Reserve one unit at a time from `threads` threads until none is left; returns (units per thread, seconds)."""
+    held = Counter()
+    lock_timeouts = Counter()
+
+    def buyer(worker):
+        while True:
+            try:
+                with Session(bind=engine) as session, session.begin():
+                    if reservations.reserve(session, user_id, product_id, 1) is None:
+                        return
+            except OperationalError:
+                lock_timeouts[worker] += 1  # SQLite's write lock; nothing was taken
+                continue
+            held[worker] += 1
+
+    workers = [threading.Thread(target=buyer, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return held, sum(lock_timeouts.values()), time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--stock', type=int, default=2000, help='units of each hot SKU')
+    parser.add_argument('--shards', type=int, default=8, help='stock_shards rows for the sharded SKU')
+    args = parser.parse_args(argv)
+
+    engine = scratch_engine(scratch_url(args.url, 'reservations'), pool_size=args.threads)
+    reservations = StockReservations()
+    with Session(bind=engine) as session, session.begin():
+        user_id = session.execute(
+            insert(User).values(username='buyer', email='buyer@example.com', password='-').returning(User.id)
+        ).scalar_one()
+        skus = {}
+        for mode in ('optimistic', 'sharded'):
+            product = Product(name=f'hot {mode}', seller='bench', description='', price=1.0, stock=args.stock)
+            session.add(product)
+            session.flush()
+            if mode == 'sharded':
+                split_stock(session, product.id, args.shards)
+            skus[mode] = product.id
+
+    print(f'{engine.dialect.name}, {args.threads} threads, {args.stock} units per SKU')
+    failed = False
+    for mode, product_id in skus.items():
+        held, lock_timeouts, elapsed = sell_out(engine, reservations, user_id, product_id, args.threads)
+        with Session(bind=engine) as session:
+            total_held = session.query(func.sum(StockHold.quantity)).filter(StockHold.product_id == product_id).scalar()
+            if mode == 'sharded':
+                left = session.query(func.sum(StockShard.stock)).filter(StockShard.product_id == product_id).scalar()
+            else:
+                left = session.query(Product.stock).filter(Product.id == product_id).scalar()
+            negative = (session.query(StockShard).filter(StockShard.stock < 0).count()
+                        + session.query(Product).filter(Product.stock < 0).count())
+        ok = total_held == sum(held.values()) == args.stock and left == 0 and not negative
+        failed = failed or not ok
+        print(f'  {mode:<10} {args.stock / elapsed:.0f} reservations/s ({elapsed:.2f}s), {left} left, '
+              f'{lock_timeouts} lock timeouts, {"OK" if ok else "OVERSOLD OR LOST UNITS"}')
+
+    with Session(bind=engine) as session, session.begin():
+        session.execute(update(StockHold).values(expires_at=utcnow() - timedelta(seconds=1)))
+    started = time.perf_counter()
+    released = release_expired_holds(engine, reservations=reservations)
+    elapsed = time.perf_counter() - started
+    with Session(bind=engine) as session:
+        restored = [session.query(Product.stock).filter(Product.id == product_id).scalar() for product_id in skus.values()]
+    failed = failed or restored != [args.stock] * len(skus)
+    print(f'  released {released} expired holds in {elapsed:.2f}s, stock back to {restored}')
+    print(f'  {reservations.stats()}')
+    engine.dispose()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
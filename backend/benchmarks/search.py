@@ -0,0 +1,74 @@
+# benchmarks/search.py
+"""
+/api/search/products: the original unindexed LIKE scan against the ranked
+full-text search (tsvector/GIN on PostgreSQL, FTS5 on SQLite) and the
+in-memory index (search_index.enabled).
+
+    python -m benchmarks.search --size 100000
+
+The queries cover a term in about half the catalog, two common words, a
+rare model number, a word that matches nothing and a typo that only the
+in-memory index forgives. For the index it also times the bare lookup,
+without loading the page's rows.
+"""
+import json
+import time
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from ecommerce.models.product import Product
+from ecommerce.schemas.product import ProductSchema
+
+from .common import benchmark_parser, make_app, scratch_engine, scratch_url, seed_products, summarize, timed
+
+QUERIES = ('phone', 'wireless charger', 'x4242', 'zebra', 'wirelss chargr')
+
+
+def original_search(engine, text):
+    """The view before full-text search, minus the WSGI layer: every match, unranked."""
+    term = f'%{text.lower()}%'
+    with Session(bind=engine) as session:
+        products = session.query(Product).filter(
+            or_(func.lower(Product.name).like(term), func.lower(Product.description).like(term))
+        ).all()
+        return json.dumps(ProductSchema(many=True).dump(products))
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=100_000, help='catalog size')
+    parser.add_argument('--repeat', type=int, default=50, help='timed requests per ranked query')
+    parser.add_argument('--limit', type=int, default=24, help='ranked page size')
+    args = parser.parse_args(argv)
+
+    url = scratch_url(args.url, 'search')
+    engine = scratch_engine(url)
+    print(f'{args.size} products (seeded in {seed_products(engine, args.size):.1f}s), '
+          f'{engine.dialect.name} full-text backend')
+    app = make_app(url)
+    started = time.perf_counter()
+    indexed_app = make_app(url, **{'search_index.enabled': 'true'})
+    search_index = indexed_app.app.registry.search_index
+    print(f'in-memory index built in {time.perf_counter() - started:.1f}s: {search_index.memory_stats()}')
+    scan_repeat = max(3, min(20, 1_000_000 // args.size))
+
+    for text in QUERIES:
+        matches = len(json.loads(original_search(engine, text)))
+        ranked = f'/api/search/products?q={text}&limit={args.limit}'
+        best = f'/api/search/products?q={text}'
+        print(f'\nq={text!r}: {matches} LIKE matches')
+        print(f'  {"original LIKE scan, every match":<36} {summarize(timed(lambda: original_search(engine, text), scan_repeat))}')
+        print(f'  {f"ranked page of {args.limit}":<36} {summarize(timed(lambda: app.get(ranked), args.repeat))}')
+        print(f'  {"ranked best 100 (Search page)":<36} {summarize(timed(lambda: app.get(best), args.repeat))}')
+        hits, _ = search_index.search(text, args.limit)
+        print(f'  {f"index: page of {args.limit} ({len(hits)} hits)":<36} '
+              f'{summarize(timed(lambda: indexed_app.get(ranked), args.repeat))}')
+        print(f'  {"index: best 100 (Search page)":<36} {summarize(timed(lambda: indexed_app.get(best), args.repeat))}')
+        print(f'  {"index: lookup only, no rows":<36} '
+              f'{summarize(timed(lambda: search_index.search(text, args.limit), args.repeat))}')
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/suggest.py
+"""
+Search-as-you-type: the in-memory prefix index at a million names, and
+/api/search/suggest served from it against the database fallback.
+
+    python -m benchmarks.suggest --names 1000000 --catalog 100000
+
+The first part fills a ProductSuggestIndex directly with --names synthetic
+names and times lookups for random 1-6 character prefixes of them (cold,
+then with the ranked prefix cache warm), sold updates and additions. The
+second seeds a --catalog product table and times the endpoint with
+suggest_index.enabled on and off (0 skips it).
+"""
+import random
+import string
+import time
+
+from ecommerce.suggest import ProductSuggestIndex
+
+from .common import (
+    WORDS, benchmark_parser, make_app, percentile, scratch_engine, scratch_url, seed_products, summarize, timed,
+)
+
+
+def microseconds(timings):
+    return (f'p50 {percentile(timings, 0.5) * 1e6:.1f}µs p99 {percentile(timings, 0.99) * 1e6:.1f}µs '
+            f'max {max(timings) * 1e6:.1f}µs')
+
+
+def index_benchmark(count, queries, seed):
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(5000)]
+    names = [' '.join(rng.choices(words, k=rng.randint(1, 4))) for _ in range(count)]
+    index = ProductSuggestIndex()
+
+    started = time.perf_counter()
+    index._load((product_id, name, rng.randint(0, 10000)) for product_id, name in enumerate(names, 1))
+    print(f'built {count} names in {time.perf_counter() - started:.2f}s: {index.memory_stats()}')
+
+    prefixes = [name[:rng.randint(1, 6)] for name in rng.choices(names, k=queries)]
+    for label in ('cold', 'warm'):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.suggest(prefix)
+            timings.append(time.perf_counter() - started)
+        print(f'  {label:<12} {microseconds(timings)} ({index.memory_stats()["cached_prefixes"]} cached prefixes)')
+
+    started = time.perf_counter()
+    for product_id in rng.sample(range(1, count + 1), 1000):
+        index.update_sold(product_id, rng.randint(0, 10000))
+    print(f'  {"update_sold":<12} {(time.perf_counter() - started) * 1e3:.1f}µs avg')
+    started = time.perf_counter()
+    for product_id in range(count + 1, count + 1001):
+        index.add(product_id, rng.choice(names), 0)
+    print(f'  {"add":<12} {(time.perf_counter() - started) * 1e3:.1f}µs avg')
+
+
+def endpoint_benchmark(url, size, repeat, seed):
+    engine = scratch_engine(url)
+    print(f'\n{size} products (seeded in {seed_products(engine, size):.1f}s), {engine.dialect.name}')
+    rng = random.Random(seed)
+    prefixes = [word[:rng.randint(1, 4)] for word in rng.choices(WORDS, k=repeat)]
+    for label, enabled in (('database fallback', 'false'), ('suggest index', 'true')):
+        app = make_app(url, **{'suggest_index.enabled': enabled})
+        queue = iter(prefixes)
+        print(f'  {label:<18} {summarize(timed(lambda: app.get(f"/api/search/suggest?prefix={next(queue)}"), repeat))}')
+    engine.dispose()
+
+
+def main(argv=None):
+    parser = benchmark_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--names', type=int, default=1_000_000, help='names in the bare index')
+    parser.add_argument('--queries', type=int, default=20_000, help='lookups against the bare index')
+    parser.add_argument('--catalog', type=int, default=100_000, help='products behind the endpoint (0: skip)')
+    parser.add_argument('--repeat', type=int, default=500, help='timed endpoint requests')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    index_benchmark(args.names, args.queries, args.seed)
+    if args.catalog:
+        endpoint_benchmark(scratch_url(args.url, 'suggest'), args.catalog, args.repeat, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,18 @@
 from pyramid.config import Configurator
 from sqlalchemy import engine_from_config
 from pyramid.renderers import JSON
+from pyramid.settings import asbool
 
 from .models.meta import Base, DBSession
+from .search_index import build_search_index
+from .suggest import build_suggest_index
+from .cache import product_cache_from_settings
+from .singleflight import SingleFlight
+from .reservations import StockReservations
+from .security import AppRequest, VerifiedTokenCache
+from .identity import IdentityCache
+from .passwords import password_hasher_from_settings
+from .upserts import check_upsert_support
 # Assuming your security tweens are correctly defined and imported
 # from .security import cors_tween_factory, prevent_logged_in_user_tween_factory 
 
@@ -12,9 +22,48 @@ def main(global_config, **settings):
 
     # Database setup
     engine = engine_from_config(settings, 'sqlalchemy.')
+    check_upsert_support(engine)
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
 
+    # Optional in-memory product search index (typo tolerant), kept current by the product views
+    if asbool(settings.get('search_index.enabled', False)):
+        config.registry.search_index = build_search_index(DBSession)
+
+    # Optional in-memory prefix index of product names for /api/search/suggest
+    if asbool(settings.get('suggest_index.enabled', False)):
+        config.registry.suggest_index = build_suggest_index(DBSession)
+
+    # Read-through cache for product detail/list payloads (product_cache.backend = none|memory|redis)
+    config.registry.product_cache = product_cache_from_settings(settings)
+
+    # Collapse identical concurrent product reads into one query
+    if asbool(settings.get('single_flight.enabled', True)):
+        config.registry.single_flight = SingleFlight(timeout=float(settings.get('single_flight.timeout', 5.0)))
+
+    # Flash-sale mode: adding to the cart holds stock for stock_reservations.hold_ttl seconds
+    if asbool(settings.get('stock_reservations.enabled', False)):
+        config.registry.stock_reservations = StockReservations(
+            hold_ttl=int(settings.get('stock_reservations.hold_ttl', 15 * 60)))
+
+    # request.jwt_claims: the bearer token verified once per request, and
+    # recently verified tokens remembered until they expire
+    config.set_request_factory(AppRequest)
+    if asbool(settings.get('jwt_cache.enabled', True)):
+        config.registry.jwt_cache = VerifiedTokenCache(max_entries=int(settings.get('jwt_cache.max_entries', 1024)))
+
+    # request.user can skip its query for users seen in the last identity_cache.ttl seconds
+    if asbool(settings.get('identity_cache.enabled', False)):
+        config.registry.identity_cache = IdentityCache(
+            ttl=float(settings.get('identity_cache.ttl', 30)),
+            max_entries=int(settings.get('identity_cache.max_entries', 10000)))
+
+    # bcrypt runs on its own small pool with its own admission limit (passwords.*)
+    config.registry.password_hasher = password_hasher_from_settings(settings)
+
+    # /api/metrics exposes cache, token and pool internals: off unless metrics.enabled
+    config.registry.metrics_enabled = asbool(settings.get('metrics.enabled', False))
+
     # Tweens: CORS and block logged-in users from login/signup
     config.add_tween('ecommerce.security.cors_tween_factory')
     config.add_tween('ecommerce.security.prevent_logged_in_user_tween_factory')
@@ -35,23 +84,39 @@ def main(global_config, **settings):
 
     # Products routes
     config.add_route('create_product', '/api/products', request_method='POST') 
+    config.add_route('import_products', '/api/products/import', request_method='POST')
+    # Must be registered before /api/products/{product_id}, which would swallow it
+    config.add_route('export_products', '/api/products/export', request_method='GET')
     config.add_route('get_products', '/api/get-products', request_method='GET') 
+    # Several products in one request: GET ?ids=1,2,3 or POST {"ids": [...]} for long lists
+    config.add_route('get_products_batch', '/api/products', request_method='GET')
+    config.add_route('post_products_batch', '/api/products/batch', request_method='POST')
     config.add_route('get_product_detail', '/api/products/{product_id}', request_method='GET') 
     config.add_route('edit_product', '/api/products/{product_id}', request_method='PUT') 
     config.add_route('delete_product', '/api/products/{product_id}', request_method='DELETE') 
     
+    # Category routes
+    config.add_route('get_categories', '/api/categories', request_method='GET')
+
     # Seller routes
     config.add_route('get_seller_products', '/api/seller/products') 
 
     # --- Add Cart Routes Below ---
     # Cart
     config.add_route('get_cart', '/api/cart', request_method='GET')
+    config.add_route('get_cart_summary', '/api/cart/summary', request_method='GET') # Navbar badge: counts only
+    config.add_route('patch_cart', '/api/cart', request_method='PATCH') # Several add/set/remove operations at once
     config.add_route('add_item_to_cart', '/api/cart/items', request_method='POST') # Add item to cart
     # For specific cart items, include an item_id placeholder. \d+ ensures it's an integer.
     config.add_route('update_cart_item_quantity', '/api/cart/items/{item_id:\d+}', request_method='PUT')
     config.add_route('remove_cart_item', '/api/cart/items/{item_id:\d+}', request_method='DELETE')
     config.add_route('clear_cart', '/api/cart', request_method='DELETE') # Clears all items from the cart
+    config.add_route('checkout', '/api/checkout', request_method='POST') # Turns the cart into an order
     config.add_route('search_products', '/api/search/products', request_method='GET')
+    config.add_route('search_suggest', '/api/search/suggest', request_method='GET')
+
+    # Runtime counters (caches, indexes); 404 unless metrics.enabled
+    config.add_route('metrics', '/api/metrics', request_method='GET')
     
 
     config.add_renderer('json', JSON())
@@ -0,0 +1,294 @@
+# cache.py
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from .transactions import run_after_commit
+
+
+class CacheStats:
+    """Counters shared by every backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class MemoryCache:
+    """
+    In-process LRU with a per-entry TTL, bounded by entry count and by the
+    total size of the stored bytes. Values must be bytes.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._bytes = 0
+        self._generation = 0
+
+    def _drop(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(key) + len(value)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.incr('misses')
+                return None
+            if entry[0] <= now:
+                self._drop(key)
+                self.stats.incr('expirations')
+                self.stats.incr('misses')
+                return None
+            self._entries.move_to_end(key)
+        self.stats.incr('hits')
+        return entry[1]
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.stats.incr('evictions')
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._drop(key)
+        self.stats.incr('invalidations', len(keys))
+
+    def generation(self):
+        return self._generation
+
+    def bump_generation(self):
+        with self._lock:
+            self._generation += 1
+
+    def info(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+            }
+
+
+class RedisCache:
+    """
+    Same interface as MemoryCache on top of a Redis-compatible server
+    (Redis, Valkey, KeyDB...). Eviction and the memory bound are the
+    server's job: run it with maxmemory and maxmemory-policy allkeys-lru.
+    """
+
+    def __init__(self, url, ttl=60, prefix='ecommerce:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("product_cache.backend = redis needs the 'redis' package installed")
+        self.ttl = ttl
+        self.prefix = prefix
+        self.stats = CacheStats()
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._client.get(self.prefix + key)
+        self.stats.incr('hits' if value is not None else 'misses')
+        return value
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        values = self._client.mget([self.prefix + key for key in keys])
+        hits = sum(value is not None for value in values)
+        self.stats.incr('hits', hits)
+        self.stats.incr('misses', len(values) - hits)
+        return values
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, value, ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+        self.stats.incr('invalidations', len(keys))
+
+    def generation(self):
+        # Shared by every app process talking to this server
+        return int(self._client.get(self.prefix + 'generation') or 0)
+
+    def bump_generation(self):
+        self._client.incr(self.prefix + 'generation')
+
+    def info(self):
+        memory = self._client.info('memory')
+        stats = self._client.info('stats')
+        return {
+            'backend': 'redis',
+            'bytes': memory.get('used_memory'),
+            'max_bytes': memory.get('maxmemory'),
+            'evicted_keys': stats.get('evicted_keys'),
+            'ttl': self.ttl,
+        }
+
+
+class ProductCache:
+    """
+    Read-through cache of serialized (JSON bytes) product payloads.
+
+    Detail payloads live under product:<id> and are dropped one by one.
+    List pages depend on many products, so their keys embed the backend's
+    generation number and any product write moves to a new generation; old
+    pages then simply age out.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; a load that started before a write
+        # must not store what it read (it may predate the commit)
+        self._epoch = 0
+
+    @staticmethod
+    def detail_key(product_id):
+        return f'product:{int(product_id)}'
+
+    def list_key(self, params):
+        query = '&'.join(f'{k}={v}' for k, v in sorted(params.items()))
+        return f'products:{self.backend.generation()}:{query}'
+
+    def get_or_load(self, key, loader):
+        """
+        Return (validators, body) for key, calling loader() on a miss.
+
+        loader returns (payload, validators) with a JSON-serializable payload
+        and the dict from conditional.validators(), or None for "not found"
+        which is never cached. Entries keep the validators in front of the
+        body so ETags can be answered without touching the payload.
+        """
+        cached = self.backend.get(key)
+        if cached is not None:
+            header, _, body = cached.partition(b'\n')
+            return json.loads(header), body
+        epoch = self._epoch
+        loaded = loader()
+        if loaded is None:
+            return None
+        payload, validators = loaded
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        if epoch == self._epoch:
+            header = json.dumps(validators, separators=(',', ':')).encode('utf-8')
+            self.backend.set(key, header + b'\n' + body)
+        return validators, body
+
+    def get_or_load_many(self, keys, loader):
+        """
+        Batch form of get_or_load: one backend round trip for all keys and
+        a single loader(missing_keys) call returning {key: (payload, validators)}
+        for the keys that exist. Returns {key: (validators, body)}.
+        """
+        found = {}
+        missing = []
+        for key, cached in zip(keys, self.backend.get_many(keys)):
+            if cached is None:
+                missing.append(key)
+                continue
+            header, _, body = cached.partition(b'\n')
+            found[key] = (json.loads(header), body)
+        if not missing:
+            return found
+        epoch = self._epoch
+        for key, (payload, validators) in loader(missing).items():
+            body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+            if epoch == self._epoch:
+                header = json.dumps(validators, separators=(',', ':')).encode('utf-8')
+                self.backend.set(key, header + b'\n' + body)
+            found[key] = (validators, body)
+        return found
+
+    def invalidate_product(self, *product_ids):
+        with self._lock:
+            self._epoch += 1
+        self.backend.bump_generation()
+        self.backend.delete(*[self.detail_key(pid) for pid in product_ids])
+
+    def stats(self):
+        result = self.backend.stats.as_dict()
+        result.update(self.backend.info())
+        return result
+
+
+def product_cache_from_settings(settings):
+    """Build the ProductCache configured under product_cache.*, or None."""
+    backend_name = settings.get('product_cache.backend', 'none').strip().lower()
+    if backend_name in ('', 'none'):
+        return None
+    ttl = int(settings.get('product_cache.ttl', 60))
+    if backend_name == 'memory':
+        backend = MemoryCache(
+            ttl=ttl,
+            max_entries=int(settings.get('product_cache.max_entries', 10000)),
+            max_bytes=int(settings.get('product_cache.max_bytes', 64 * 1024 * 1024)),
+        )
+    elif backend_name == 'redis':
+        backend = RedisCache(settings['product_cache.redis_url'], ttl=ttl)
+    else:
+        raise ValueError(f"Unknown product_cache.backend '{backend_name}'")
+    return ProductCache(backend)
+
+
+def get_product_cache(request):
+    """The registry's ProductCache, or None when caching is off."""
+    return getattr(request.registry, 'product_cache', None)
+
+
+def invalidate_products(request, *product_ids):
+    """
+    Drop cached payloads for these products once the transaction commits.
+    Called without ids it only retires the cached list pages.
+    """
+    product_cache = get_product_cache(request)
+    if product_cache is None:
+        return
+    run_after_commit(request, product_cache.invalidate_product, *product_ids)
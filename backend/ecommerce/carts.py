@@ -0,0 +1,324 @@
+# carts.py
+from collections import defaultdict
+
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, select, update
+
+from .models.cart import Cart, CartItem
+from .models.product import Product
+from .upserts import upsert
+
+
+def ensure_cart_id(dbsession, user_id):
+    """
+    The user's cart id, creating the cart if needed, in one statement.
+    Touching updated_at on conflict is what makes RETURNING give us the
+    existing row; carts.user_id is unique, so racing requests share a cart.
+    """
+    statement = (
+        upsert(dbsession)(Cart)
+        .values(user_id=user_id)
+        .on_conflict_do_update(index_elements=[Cart.user_id], set_={'updated_at': func.now()})
+        .returning(Cart.id)
+    )
+    return dbsession.execute(statement).scalar_one()
+
+
+def adjust_cart_totals(dbsession, deltas):
+    """
+    Apply {cart_id: (item count change, total change)} to the carts' stored
+    item_count and grand_total. The increments happen in SQL, one UPDATE per
+    cart in id order, so concurrent writers never lose each other's changes.
+    A cart dropping to zero items gets a clean 0.0 total rather than the
+    float residue of its history.
+    """
+    for cart_id, (count_delta, total_delta) in sorted(deltas.items()):
+        if not count_delta and not total_delta:
+            continue
+        new_count = Cart.item_count + count_delta
+        dbsession.query(Cart).filter(Cart.id == cart_id).update({
+            Cart.item_count: new_count,
+            Cart.grand_total: case((new_count == 0, 0.0), else_=Cart.grand_total + total_delta),
+        }, synchronize_session=False)
+
+
+def _stock_allows(quantity):
+    return or_(Product.stock.is_(None), Product.stock >= quantity)
+
+
+def _add_to_line(dbsession, cart_id, product_id, quantity, check_stock):
+    """upsert_cart_item's statement; the (id, quantity, price_at_add) row it wrote, or None."""
+    conditions = [Product.id == product_id, Product.price.isnot(None)]
+    if check_stock:
+        conditions.append(_stock_allows(quantity))
+    source = select(literal(cart_id), Product.id, literal(quantity), Product.price).where(*conditions)
+    statement = upsert(dbsession)(CartItem).from_select(
+        [CartItem.cart_id, CartItem.product_id, CartItem.quantity, CartItem.price_at_add], source,
+    )
+    new_quantity = CartItem.quantity + statement.excluded.quantity
+    on_conflict = {'index_elements': [CartItem.cart_id, CartItem.product_id], 'set_': {'quantity': new_quantity}}
+    if check_stock:
+        stock = select(Product.stock).where(Product.id == statement.excluded.product_id).scalar_subquery()
+        on_conflict['where'] = or_(stock.is_(None), stock >= new_quantity)
+    statement = statement.on_conflict_do_update(**on_conflict).returning(
+        CartItem.id, CartItem.quantity, CartItem.price_at_add,
+    )
+    return dbsession.execute(statement).first()
+
+
+def upsert_cart_item(dbsession, cart_id, product_id, quantity, check_stock=True):
+    """
+    Add `quantity` of a product to a cart as a single INSERT ... SELECT ...
+    ON CONFLICT (cart_id, product_id) DO UPDATE. The stock check is part of
+    the statement: the insert only selects the product when it has a price
+    and enough stock, and the conflict update only fires when the summed
+    quantity still fits. Returns (item id, new quantity), or None when the
+    product is missing, unpriced or short of stock (see explain_rejected_add).
+    With check_stock=False (the units are already held, see reservations.py)
+    only the product and its price are checked. The cart's totals move by
+    the units added at the line's price.
+    """
+    row = _add_to_line(dbsession, cart_id, product_id, quantity, check_stock)
+    if row is None:
+        return None
+    adjust_cart_totals(dbsession, {cart_id: (quantity, row.price_at_add * quantity)})
+    return row.id, row.quantity
+
+
+def explain_rejected_add(dbsession, cart_id, product_id, quantity):
+    """
+    Why upsert_cart_item returned None, as (reason, message) with reason one
+    of 'not_found', 'no_price' or 'stock'; None if it would succeed now.
+    Only runs on the failure path.
+    """
+    product = (
+        dbsession.query(Product.name, Product.price, Product.stock)
+        .filter(Product.id == product_id)
+        .first()
+    )
+    if product is None:
+        return 'not_found', f'Product with ID {product_id} not found.'
+    if product.price is None:
+        return 'no_price', f'Cannot add product {product.name} to cart as it has no price.'
+    in_cart = (
+        dbsession.query(CartItem.quantity)
+        .filter(and_(CartItem.cart_id == cart_id, CartItem.product_id == product_id))
+        .scalar()
+    )
+    if in_cart:
+        if product.stock is not None and product.stock < in_cart + quantity:
+            return 'stock', (f'Cannot add {quantity} more of {product.name}. Total would exceed stock. '
+                    f'In cart: {in_cart}, Available: {product.stock}')
+    elif product.stock is not None and product.stock < quantity:
+        return 'stock', f'Not enough stock for {product.name}. Available: {product.stock}'
+    return None
+
+
+def delete_cart_items(dbsession, user_id, item_id=None):
+    """
+    Delete one line (item_id) or every line of the user's cart with a single
+    DELETE ... WHERE cart_id = (SELECT id FROM carts WHERE user_id = ?), so
+    ownership is part of the statement and no ORM objects are loaded.
+    Returns the deleted lines as rows with cart_id, product_id, quantity and
+    price_at_add; a line can only be deleted once, so of two concurrent
+    callers (e.g. checkouts) only one gets it.
+    """
+    owned_cart = select(Cart.id).where(Cart.user_id == user_id).scalar_subquery()
+    statement = delete(CartItem).where(CartItem.cart_id == owned_cart)
+    if item_id is not None:
+        statement = statement.where(CartItem.id == item_id)
+    statement = statement.returning(CartItem.cart_id, CartItem.product_id, CartItem.quantity, CartItem.price_at_add)
+    rows = dbsession.execute(statement.execution_options(synchronize_session=False)).all()
+    _subtract_deleted_lines(dbsession, rows)
+    return rows
+
+
+def delete_product_lines(dbsession, product_ids):
+    """
+    Drop every cart line for products that are going away, taking them off
+    the totals of whichever carts held them. Returns the number of lines.
+    """
+    statement = (
+        delete(CartItem)
+        .where(CartItem.product_id.in_(product_ids))
+        .returning(CartItem.cart_id, CartItem.quantity, CartItem.price_at_add)
+    )
+    rows = dbsession.execute(statement.execution_options(synchronize_session=False)).all()
+    _subtract_deleted_lines(dbsession, rows)
+    return len(rows)
+
+
+def _subtract_deleted_lines(dbsession, rows):
+    deltas = defaultdict(lambda: (0, 0.0))
+    for row in rows:
+        count, total = deltas[row.cart_id]
+        deltas[row.cart_id] = (count - row.quantity, total - row.price_at_add * row.quantity)
+    adjust_cart_totals(dbsession, deltas)
+
+
+def cart_summary(dbsession, user_id):
+    """
+    {'total_items_count', 'grand_total'} for the user's cart, read from the
+    stored totals on its carts row. Never creates a cart: no cart means zeros.
+    """
+    row = dbsession.query(Cart.item_count, Cart.grand_total).filter(Cart.user_id == user_id).first()
+    if row is None:
+        return {'total_items_count': 0, 'grand_total': 0.0}
+    return {'total_items_count': row.item_count, 'grand_total': round(row.grand_total, 2)}
+
+
+def _line_sums():
+    """Per-cart SUM(quantity) and SUM(price_at_add * quantity) over cart_items."""
+    return (
+        func.coalesce(func.sum(CartItem.quantity), 0),
+        func.coalesce(func.sum(CartItem.price_at_add * CartItem.quantity), 0.0),
+    )
+
+
+def check_cart_totals(dbsession, repair=False, tolerance=0.005):
+    """
+    Find carts whose stored item_count/grand_total disagree with their lines
+    (raw SQL edits, a bug, float drift beyond `tolerance`) with one grouped
+    query. Returns [(cart_id, stored count, actual count, stored total,
+    actual total)]. With repair=True the drifted carts are recomputed by a
+    single UPDATE that re-sums the lines itself, so a cart changed since the
+    check still ends up right.
+    """
+    actual_count, actual_total = _line_sums()
+    drifted = (
+        dbsession.query(Cart.id, Cart.item_count, actual_count, Cart.grand_total, actual_total)
+        .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+        .group_by(Cart.id, Cart.item_count, Cart.grand_total)
+        .having(or_(Cart.item_count != actual_count, func.abs(Cart.grand_total - actual_total) > tolerance))
+        .order_by(Cart.id)
+        .all()
+    )
+    drifted = [tuple(row) for row in drifted]
+    if repair and drifted:
+        count_query, total_query = (
+            select(column).where(CartItem.cart_id == Cart.id).scalar_subquery() for column in _line_sums()
+        )
+        dbsession.query(Cart).filter(Cart.id.in_([row[0] for row in drifted])).update(
+            {Cart.item_count: count_query, Cart.grand_total: total_query}, synchronize_session=False,
+        )
+    return drifted
+
+
+class CartOperationError(Exception):
+    """A PATCH /api/cart operation that cannot be applied; `index` is its position."""
+
+    def __init__(self, index, message, not_found=False):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+        self.not_found = not_found
+
+
+def plan_cart_operations(operations, lines, products):
+    """
+    Run validated operations (schemas.cart.CartOperationSchema) against the
+    cart in memory. `lines` is {product_id: (item_id, quantity, price_at_add)} for the
+    current cart, `products` {product_id: row with name, price, stock} for
+    every product involved. Returns ({product_id: final quantity},
+    {product_id: index of the last operation touching it}); nothing is
+    written. Raises CartOperationError for the first bad operation.
+    """
+    by_item = {line[0]: product_id for product_id, line in lines.items()}
+    quantities = {}
+    last_index = {}
+    for index, operation in enumerate(operations):
+        if 'item_id' in operation:
+            product_id = by_item.get(operation['item_id'])
+            if product_id is None:
+                raise CartOperationError(index, f"Cart item {operation['item_id']} not found.", not_found=True)
+        else:
+            product_id = operation['product_id']
+        current = quantities.get(product_id, lines[product_id][1] if product_id in lines else 0)
+
+        if operation['op'] == 'remove':
+            quantity = 0
+        elif operation['op'] == 'add':
+            quantity = current + operation['quantity']
+        else:
+            quantity = operation['quantity']
+
+        if quantity and product_id not in lines:
+            product = products.get(product_id)
+            if product is None:
+                raise CartOperationError(index, f'Product with ID {product_id} not found.', not_found=True)
+            if product.price is None:
+                raise CartOperationError(index, f'Cannot add product {product.name} to cart as it has no price.')
+        quantities[product_id] = quantity
+        last_index[product_id] = index
+    return quantities, last_index
+
+
+def apply_cart_quantities(dbsession, cart_id, lines, quantities, products, check_stock=False):
+    """
+    Write planned quantities with at most three statements: one DELETE for
+    the dropped lines, one executemany UPDATE by primary key for changed
+    lines and one multi-row INSERT for new ones, plus the cart's totals.
+
+    With check_stock=True growing lines are written one stock-guarded
+    upsert each instead (as upsert_cart_item does), since stock read before
+    the write may be gone by then. Returns ({product_id: change}, the
+    product_id of the first growing line stock no longer covers, or None);
+    on a refusal the writes already made must be rolled back by the caller.
+    """
+    deletes, updates, inserts, grown = [], [], [], []
+    changes = {}
+    total_change = 0.0
+    for product_id, quantity in quantities.items():
+        item_id, old, price = lines.get(product_id, (None, 0, None))
+        if quantity == old:
+            continue
+        changes[product_id] = quantity - old
+        if check_stock and quantity > old:
+            grown.append(product_id)
+            continue
+        if item_id is None:
+            price = products[product_id].price
+            inserts.append({
+                'cart_id': cart_id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'price_at_add': price,
+            })
+        elif quantity == 0:
+            deletes.append(product_id)
+        else:
+            updates.append({'id': item_id, 'quantity': quantity})
+        total_change += price * (quantity - old)
+    if deletes:
+        dbsession.query(CartItem).filter(
+            CartItem.cart_id == cart_id, CartItem.product_id.in_(deletes),
+        ).delete(synchronize_session=False)
+    if updates:
+        dbsession.execute(update(CartItem), updates)
+    if inserts:
+        dbsession.execute(insert(CartItem), inserts)
+    for product_id in grown:
+        row = _add_to_line(dbsession, cart_id, product_id, changes[product_id], check_stock=True)
+        if row is None:
+            return changes, product_id
+        total_change += row.price_at_add * changes[product_id]
+    adjust_cart_totals(dbsession, {cart_id: (sum(changes.values()), total_change)})
+    return changes, None
+
+if __name__ == '__main__':
+    import sys
+
+    usage = 'usage: python -m ecommerce.carts check-totals <config.ini> [--repair]'
+    if len(sys.argv) < 3 or sys.argv[1] != 'check-totals':
+        sys.exit(usage)
+    from pyramid.paster import get_appsettings
+    from sqlalchemy import engine_from_config
+    from sqlalchemy.orm import Session
+
+    repair = '--repair' in sys.argv[3:]
+    engine = engine_from_config(get_appsettings(sys.argv[2]), 'sqlalchemy.')
+    with Session(bind=engine) as session, session.begin():
+        drifted = check_cart_totals(session, repair=repair)
+    for cart_id, count, actual_count, total, actual_total in drifted:
+        print(f'cart {cart_id}: item_count {count} -> {actual_count}, grand_total {total:.2f} -> {actual_total:.2f}')
+    print(f'{len(drifted)} carts {"repaired" if repair else "out of step"}')
+    sys.exit(1 if drifted and not repair else 0)
@@ -0,0 +1,53 @@
+# categories.py
+from collections import Counter
+
+from sqlalchemy import func
+
+from .models.category import Category
+from .models.product import Product
+from .upserts import upsert
+
+
+def category_delta(before=None, after=None):
+    """Counter of count changes for a product moving from `before` to `after`."""
+    deltas = Counter()
+    if before != after:
+        if before:
+            deltas[before] -= 1
+        if after:
+            deltas[after] += 1
+    return deltas
+
+
+def adjust_category_counts(dbsession, deltas):
+    """
+    Apply {category: +/-n} to categories.product_count with one upsert per
+    category: the increment happens in SQL, so concurrent writers never
+    lose each other's updates.
+    """
+    deltas = {name: delta for name, delta in deltas.items() if name and delta}
+    if not deltas:
+        return
+    insert = upsert(dbsession)
+    for name, delta in sorted(deltas.items()):  # fixed order, no lock-order deadlocks
+        statement = insert(Category).values(name=name, product_count=max(delta, 0))
+        statement = statement.on_conflict_do_update(
+            index_elements=[Category.name],
+            set_={'product_count': Category.product_count + delta},
+        )
+        dbsession.execute(statement)
+
+
+def rebuild_category_counts(dbsession):
+    """Recount from products; repairs drift (e.g. after raw SQL edits)."""
+    counts = (
+        dbsession.query(Product.category, func.count())
+        .filter(Product.category.isnot(None))
+        .group_by(Product.category)
+        .all()
+    )
+    dbsession.query(Category).delete(synchronize_session=False)
+    for name, count in counts:
+        dbsession.add(Category(name=name, product_count=count))
+    dbsession.flush()
+    return len(counts)
@@ -0,0 +1,79 @@
+# conditional.py
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from pyramid.httpexceptions import HTTPNotModified
+from pyramid.response import Response
+
+# Per-route Cache-Control. Product pages show live stock, so browsers keep
+# them but must revalidate (a 304 costs next to nothing); lists and search
+# results may be a little stale.
+CACHE_CONTROL = {
+    'get_products': 'public, max-age=30',
+    'get_product_detail': 'no-cache',
+    'get_products_batch': 'no-cache',
+    'search_products': 'public, max-age=60',
+}
+
+
+def make_etag(*parts):
+    """Strong ETag from the version data a payload was built from."""
+    raw = json.dumps(parts, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def validators(etag, last_modified=None):
+    if isinstance(last_modified, datetime):
+        last_modified = last_modified.isoformat()
+    return {'etag': etag, 'last_modified': last_modified}
+
+
+def _last_modified(validators):
+    value = validators.get('last_modified')
+    if not value:
+        return None
+    last_modified = datetime.fromisoformat(value)
+    if last_modified.tzinfo is None:
+        # SQLite hands back naive timestamps; func.now() there is UTC
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole-second precision
+    return last_modified.replace(microsecond=0)
+
+
+def _apply(response, request, validators):
+    response.etag = validators['etag']
+    last_modified = _last_modified(validators)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    cache_control = CACHE_CONTROL.get(getattr(request.matched_route, 'name', None))
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def is_not_modified(request, validators):
+    # If-None-Match wins over If-Modified-Since when both are sent (RFC 7232)
+    if request.if_none_match:
+        return validators['etag'] in request.if_none_match
+    last_modified = _last_modified(validators)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def not_modified_response(request, validators):
+    return _apply(HTTPNotModified(), request, validators)
+
+
+def conditional_json_response(request, validators, body=None, payload=None):
+    """
+    304 when the client's copy is current, otherwise the JSON body (given
+    already serialized, or as a payload that is only serialized here).
+    """
+    if is_not_modified(request, validators):
+        return not_modified_response(request, validators)
+    if body is None:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    response = Response(body=body, content_type='application/json', charset='utf-8')
+    return _apply(response, request, validators)
@@ -0,0 +1,114 @@
+# exporter.py
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import select
+
+from .models.product import Product
+from .pagination import keyset_filter
+
+EXPORT_COLUMNS = [
+    Product.id,
+    Product.name,
+    Product.description,
+    Product.price,
+    Product.original_price,
+    Product.image_url,
+    Product.rating,
+    Product.sold,
+    Product.stock,
+    Product.seller,
+    Product.seller_id,
+    Product.version,
+    Product.updated_at,
+]
+EXPORT_FIELDS = [column.key for column in EXPORT_COLUMNS]
+
+# Rows fetched per server-side cursor round trip, and roughly how much output
+# is gathered before handing it to the server
+FETCH_SIZE = 1000
+CHUNK_BYTES = 64 * 1024
+
+
+def parse_watermark(params):
+    """
+    (since, after_id) from ?since=<ISO timestamp>&after_id=<id>. An
+    incremental export resumes from the updated_at/id of the last row of
+    the previous one.
+    """
+    since = params.get('since')
+    after_id = params.get('after_id')
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        raise ValueError('since must be an ISO 8601 timestamp')
+    try:
+        after_id = int(after_id) if after_id else None
+    except ValueError:
+        raise ValueError('after_id must be an integer')
+    return since, after_id
+
+
+def export_statement(since=None, after_id=None):
+    statement = select(*EXPORT_COLUMNS)
+    if since is not None:
+        # Served by ix_products_updated_at_id
+        order = [(Product.updated_at, False), (Product.id, False)]
+        statement = statement.where(keyset_filter(order, [since, after_id or 0]))
+        return statement.order_by(Product.updated_at, Product.id)
+    if after_id is not None:
+        statement = statement.where(Product.id > after_id)
+    return statement.order_by(Product.id)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(row._mapping), default=_json_default, separators=(',', ':')) + '\n'
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+        yield buffer.getvalue()
+
+
+def iter_export(engine, statement, export_format):
+    """
+    WSGI app_iter producing the export as bytes.
+
+    Runs after the view has returned (and pyramid_tm has closed the request
+    session), so it reads through a connection of its own with a
+    server-side cursor: memory stays at one fetch batch however big the
+    catalog is.
+    """
+    with engine.connect() as connection:
+        rows = connection.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(statement)
+        lines = _csv_lines(rows) if export_format == 'csv' else _ndjson_lines(rows)
+        chunk = []
+        size = 0
+        first = True
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            # Send the first line straight away so the client sees bytes immediately
+            if first or size >= CHUNK_BYTES:
+                yield ''.join(chunk).encode('utf-8')
+                chunk = []
+                size = 0
+                first = False
+        if chunk:
+            yield ''.join(chunk).encode('utf-8')
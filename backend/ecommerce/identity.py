@@ -0,0 +1,92 @@
+# identity.py
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models.user import User
+from .transactions import run_after_commit
+
+# What the cache keeps of a user: enough for the views and UserSchema,
+# never the password hash (it is loaded from the database when needed)
+IDENTITY_FIELDS = ('id', 'username', 'email')
+
+
+class IdentityCache:
+    """
+    Recently seen users' identity fields, by user id, for `ttl` seconds.
+    Bounded LRU. Each process has its own, so a rename or account deletion
+    on another process shows up here within `ttl` at the latest; this
+    process's own changes invalidate immediately after commit.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # user id -> (expires_at, fields)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        fields = {name: getattr(user, name) for name in IDENTITY_FIELDS}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, fields)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+def get_identity_cache(request):
+    """The registry's IdentityCache, or None when identity_cache.enabled is off."""
+    return getattr(request.registry, 'identity_cache', None)
+
+
+def load_user(dbsession, user_id, identity_cache=None):
+    """
+    The User for `user_id` in `dbsession`, or None. A cache hit costs no
+    query: the cached fields are merged into the session as an already
+    persistent, unmodified object, so it behaves like a loaded User (it can
+    be updated or deleted) and any field not cached, such as the password
+    hash, is loaded on first access.
+    """
+    if identity_cache is not None:
+        fields = identity_cache.get(user_id)
+        if fields is not None:
+            user = User(**fields)
+            make_transient_to_detached(user)
+            return dbsession.merge(user, load=False)
+    user = dbsession.get(User, user_id)
+    if user is not None and identity_cache is not None:
+        identity_cache.put(user)
+    return user
+
+
+def forget_user(request, user_id):
+    """Drop a user from the identity cache once the transaction commits (rename, deletion)."""
+    identity_cache = get_identity_cache(request)
+    if identity_cache is not None:
+        run_after_commit(request, identity_cache.invalidate, user_id)
@@ -0,0 +1,136 @@
+# importer.py
+import csv
+import json
+from array import array
+from collections import Counter
+
+from marshmallow import ValidationError
+from sqlalchemy import insert
+
+from .categories import adjust_category_counts
+from .models.product import Product
+from .schemas.product import ProductSchema
+
+IMPORT_BATCH_SIZE = 500
+# The report keeps at most this many row errors so memory stays flat even
+# when every line of a huge file is bad; the counts are always exact.
+MAX_REPORTED_ERRORS = 1000
+
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def import_format(request):
+    """'csv' or 'ndjson' from ?format= or the Content-Type, else None."""
+    requested = request.params.get('format', '').lower()
+    if requested in ('csv', 'ndjson'):
+        return requested
+    if request.content_type in CSV_CONTENT_TYPES:
+        return 'csv'
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        return 'ndjson'
+    return None
+
+
+def iter_text_lines(stream):
+    """Decode a binary stream line by line without reading it all."""
+    first = True
+    for raw in stream:
+        line = raw.decode('utf-8')
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        yield line
+
+
+def iter_csv_records(lines):
+    """Yield (row_number, record, error); row 1 is the first line after the header."""
+    reader = csv.DictReader(lines)
+    for row_number, record in enumerate(reader, start=1):
+        if None in record:
+            yield row_number, None, {'_row': ['Row has more values than the header has columns.']}
+            continue
+        # Empty cells mean "not given" so optional numeric columns can be left blank
+        yield row_number, {k: v for k, v in record.items() if v not in ('', None)}, None
+
+
+def iter_ndjson_records(lines):
+    row_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, {'_row': [f'Invalid JSON: {e}']}
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, {'_row': ['Each line must be a JSON object.']}
+            continue
+        yield row_number, record, None
+
+
+class ProductImporter:
+    """
+    Validate product records one by one and insert the good ones in
+    batches of IMPORT_BATCH_SIZE with a single multi-row INSERT each.
+    Nothing but the current batch is held in memory.
+    """
+
+    def __init__(self, dbsession, seller, seller_id, batch_size=IMPORT_BATCH_SIZE):
+        self.dbsession = dbsession
+        self.seller = seller
+        self.seller_id = seller_id
+        self.batch_size = batch_size
+        self.schema = ProductSchema()
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.product_ids = array('I')
+
+    def _fail(self, row_number, messages):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': messages})
+
+    def _flush(self, batch):
+        result = self.dbsession.execute(insert(Product).returning(Product.id), batch)
+        self.product_ids.extend(result.scalars().all())
+        self.inserted += len(batch)
+        adjust_category_counts(self.dbsession, Counter(row.get('category') for row in batch))
+
+    def run(self, records):
+        batch = []
+        for row_number, record, error in records:
+            if error is None:
+                try:
+                    data = self.schema.load(record)
+                except ValidationError as err:
+                    error = err.messages
+                else:
+                    # products.description is NOT NULL; catch it here rather
+                    # than failing the whole batch in the database
+                    if data.get('description') is None:
+                        error = {'description': ['Missing data for required field.']}
+            if error is not None:
+                self._fail(row_number, error)
+                continue
+
+            data['seller'] = self.seller
+            data['seller_id'] = self.seller_id
+            batch.append(data)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+        return self.report()
+
+    def report(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+        }
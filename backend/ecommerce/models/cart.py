@@ -1,5 +1,5 @@
 # backend/ecommerce/models/cart.py
-from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func  # For server-side default timestamps
 from .meta import Base
@@ -9,8 +9,13 @@ class Cart(Base):
     __tablename__ = 'carts'
 
     id = Column(Integer, primary_key=True, index=True)
-    # Each cart must belong to a user.
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    # Each cart must belong to a user, and a user has at most one cart.
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True, unique=True)
+
+    # Running totals over the cart's items, kept in step by ecommerce/carts.py
+    # in the same transaction as every line change (check_cart_totals repairs drift)
+    item_count = Column(Integer, nullable=False, default=0, server_default='0')
+    grand_total = Column(Float, nullable=False, default=0.0, server_default='0')
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -50,5 +55,10 @@ class CartItem(Base):
     # This allows you to do `cart_item.product` to get product details.
     product = relationship("Product") # No back_populates needed in Product unless you want product.cart_items
 
+    __table_args__ = (
+        # One line per product per cart; add-to-cart upserts against it (ecommerce/carts.py)
+        Index('uq_cart_items_cart_id_product_id', 'cart_id', 'product_id', unique=True),
+    )
+
     def __repr__(self):
         return f"<CartItem(id={self.id}, cart_id={self.cart_id}, product_id={self.product_id}, quantity={self.quantity})>"
\ No newline at end of file
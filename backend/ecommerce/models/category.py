@@ -0,0 +1,18 @@
+# backend/ecommerce/models/category.py
+from sqlalchemy import Column, Integer, String
+from .meta import Base
+
+
+class Category(Base):
+    """
+    Product count per category, maintained incrementally by every product
+    write (see ecommerce/categories.py) so the Categories page never has to
+    GROUP BY the whole products table.
+    """
+    __tablename__ = 'categories'
+
+    name          = Column(String(100), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0, server_default='0')
+
+    def __repr__(self):
+        return f"<Category(name='{self.name}', product_count={self.product_count})>"
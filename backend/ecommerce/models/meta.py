@@ -9,4 +9,6 @@ Base = declarative_base()
 from .user import User
 from .product import Product
 from .cart import Cart, CartItem
-
+from .category import Category
+from .reservation import StockHold, StockShard
+from .order import Order, OrderItem
@@ -0,0 +1,49 @@
+# backend/ecommerce/models/order.py
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from .meta import Base
+
+
+class Order(Base):
+    """A checked-out cart (see ecommerce/orders.py). Amounts are fixed at checkout."""
+    __tablename__ = 'orders'
+
+    id              = Column(Integer, primary_key=True)
+    user_id         = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    status          = Column(String(20), nullable=False, default='placed', server_default='placed')
+    shipping_method = Column(String(20), nullable=False)
+    payment_method  = Column(String(20), nullable=False)
+    item_count      = Column(Integer, nullable=False)
+    subtotal        = Column(Float, nullable=False)
+    shipping_cost   = Column(Float, nullable=False)
+    tax             = Column(Float, nullable=False)
+    total           = Column(Float, nullable=False)
+    created_at      = Column(DateTime(timezone=True), server_default=func.now())
+
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # A user's order history, newest first
+        Index('ix_orders_user_id_id', 'user_id', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<Order(id={self.id}, user_id={self.user_id}, total={self.total})>"
+
+
+class OrderItem(Base):
+    __tablename__ = 'order_items'
+
+    id           = Column(Integer, primary_key=True)
+    order_id     = Column(Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False, index=True)
+    # The product may be deleted later; the name and price below keep the line readable
+    product_id   = Column(Integer, ForeignKey('products.id', ondelete='SET NULL'), nullable=True)
+    product_name = Column(String(255), nullable=False)
+    quantity     = Column(Integer, nullable=False)
+    unit_price   = Column(Float, nullable=False)
+
+    order = relationship("Order", back_populates="items")
+
+    def __repr__(self):
+        return f"<OrderItem(id={self.id}, order_id={self.order_id}, product_id={self.product_id}, quantity={self.quantity})>"
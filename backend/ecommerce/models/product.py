@@ -1,14 +1,42 @@
 # backend/ecommerce/models/product.py
-from sqlalchemy import Column, Integer, String, Float, Text
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, ForeignKey, Index, DDL, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import func
+from sqlalchemy.sql.functions import FunctionElement
 from .meta import Base
 
+
+class now_timestamp(FunctionElement):
+    """
+    now() for products.updated_at. SQLite's CURRENT_TIMESTAMP has whole
+    seconds and no fraction ('... 12:00:00'), while SQLAlchemy binds
+    datetimes as '... 12:00:00.000000'; the text comparison then puts a
+    stored row before an equal bound value, and the export watermark
+    (updated_at, id) skipped rows. There it is the current time in
+    SQLAlchemy's own format instead, to the millisecond.
+    """
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(now_timestamp)
+def _now_timestamp(element, compiler, **kw):
+    return compiler.process(func.now(), **kw)
+
+
+@compiles(now_timestamp, 'sqlite')
+def _sqlite_now_timestamp(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f000', 'now')"
+
+
 # backend/ecommerce/models/product.py
 class Product(Base):
     __tablename__ = 'products'
 
     id             = Column(Integer, primary_key=True)
     name           = Column(String(255), nullable=False)
-    seller         = Column(String(255), nullable=False)
+    seller         = Column(String(255), nullable=False)  # Seller's username, kept for display
+    seller_id      = Column(Integer, ForeignKey('users.id'), nullable=True)
     description    = Column(Text, nullable=False)
     price          = Column(Float, nullable=False)
     original_price = Column(Float, nullable=True)
@@ -16,4 +44,78 @@ class Product(Base):
     rating         = Column(Float, default=0.0)
     sold           = Column(Integer, default=0)
     stock          = Column(Integer, default=0)
-    # category       = Column(String(100), nullable=True, index=True)
\ No newline at end of file
+    category       = Column(String(100), nullable=True)
+    updated_at     = Column(DateTime(timezone=True), server_default=now_timestamp(), onupdate=now_timestamp())
+    # Bumped by the ORM on every UPDATE (and checked, so concurrent edits fail
+    # instead of overwriting each other). Bulk UPDATEs must bump it themselves.
+    version        = Column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+    __table_args__ = (
+        # Serves ownership lookups and the seller dashboard's keyset pages
+        Index('ix_products_seller_id_id', 'seller_id', 'id'),
+        # Category pages: equality on category, keyset on id
+        Index('ix_products_category_id', 'category', 'id'),
+        # Incremental catalog exports resume from an (updated_at, id) watermark
+        Index('ix_products_updated_at_id', 'updated_at', 'id'),
+        # Listing sorts (views/product.py PRODUCT_SORTS); btrees scan backwards
+        # just as well, so ascending indexes serve the DESC orderings too
+        Index('ix_products_sold_id', func.coalesce(sold, 0), 'id'),
+        Index('ix_products_price_id', 'price', 'id'),
+        Index('ix_products_rating_id', func.coalesce(rating, 0), 'id'),
+        # Partial indexes for the two common filters: "in stock, best sellers
+        # first" and the flash-sale page's "on sale"
+        Index(
+            'ix_products_in_stock_sold_id', func.coalesce(sold, 0), 'id',
+            postgresql_where=stock > 0, sqlite_where=stock > 0,
+        ),
+        Index(
+            'ix_products_on_sale_id', 'id',
+            postgresql_where=original_price > price, sqlite_where=original_price > price,
+        ),
+    )
+
+
+# --- Full-text search structures ---
+# These are not mapped columns, ecommerce/search.py queries them directly.
+# PostgreSQL: a generated tsvector column (the database keeps it current on
+# every insert/update) with a GIN index. SQLite: an external-content FTS5
+# table kept in sync by triggers, so search can be exercised locally.
+# Keep in sync with alembic/versions/18_10_2026_10_00_00_product_search.py
+
+PRODUCT_SEARCH_DDL = {
+    'postgresql': [
+        "ALTER TABLE products ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+        ") STORED",
+        "CREATE INDEX ix_products_search_vector ON products USING gin (search_vector)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE products_fts USING fts5("
+        "name, description, content='products', content_rowid='id', "
+        "tokenize='porter unicode61')",
+        "CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO products_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+    ],
+}
+
+for _dialect, _statements in PRODUCT_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Product.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+
+# The FTS table isn't in the metadata, drop it along with products
+event.listen(
+    Product.__table__, 'before_drop',
+    DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect='sqlite'),
+)
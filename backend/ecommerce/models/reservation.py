@@ -0,0 +1,47 @@
+# backend/ecommerce/models/reservation.py
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from .meta import Base
+
+
+class StockHold(Base):
+    """
+    Units taken out of a product's available stock for a user until
+    expires_at (see ecommerce/reservations.py). `shard` says which
+    stock_shards row the units came from; NULL means products.stock.
+    """
+    __tablename__ = 'stock_holds'
+
+    id         = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    user_id    = Column(Integer, ForeignKey('users.id'), nullable=False)
+    shard      = Column(Integer, nullable=True)
+    quantity   = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # The user's holds on a product (cart changes, checkout)
+        Index('ix_stock_holds_user_id_product_id', 'user_id', 'product_id'),
+        # The sweeper's range scan for expired holds
+        Index('ix_stock_holds_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f"<StockHold(id={self.id}, product_id={self.product_id}, user_id={self.user_id}, quantity={self.quantity})>"
+
+
+class StockShard(Base):
+    """
+    Part of a hot product's stock. Splitting a flash-sale SKU's stock over
+    several rows lets concurrent reservations update different rows instead
+    of queueing on the one products row.
+    """
+    __tablename__ = 'stock_shards'
+
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    shard      = Column(Integer, primary_key=True)
+    stock      = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<StockShard(product_id={self.product_id}, shard={self.shard}, stock={self.stock})>"
@@ -2,7 +2,6 @@
 from sqlalchemy import Column, Integer, String
 from sqlalchemy.orm import relationship # <--- Add this import
 from .meta import Base
-import bcrypt
 
 class User(Base):
     __tablename__ = 'users'
@@ -12,14 +11,5 @@ class User(Base):
     password = Column(String(255), nullable=False)
     carts = relationship("Cart", back_populates="user", cascade="all, delete-orphan") 
 
-    @staticmethod
-    def hash_password(password: str) -> str:
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed.decode('utf-8')
-
-    def verify_password(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode('utf-8'), self.password.encode('utf-8'))
-
     def __repr__(self): # Optional: Add a repr for easier debugging
         return f"<User(id={self.id}, username='{self.username}')>"
\ No newline at end of file
@@ -0,0 +1,166 @@
+# orders.py
+from sqlalchemy import Integer, column, func, insert, literal, or_, select, union_all, update, values
+
+from .carts import delete_cart_items
+from .models.order import Order, OrderItem
+from .models.product import Product
+from .models.reservation import StockShard
+from .schemas.order import SHIPPING_COSTS, TAX_RATE
+
+
+class CheckoutError(Exception):
+    """
+    The cart cannot be turned into an order. `shortages` lists the lines
+    stock could not cover as {'product_id', 'name', 'requested', 'available'}.
+    """
+
+    def __init__(self, message, shortages=()):
+        super().__init__(message)
+        self.message = message
+        self.shortages = list(shortages)
+
+
+def _stock_lines(dbsession, rows):
+    """
+    The (product_id, take, sold) rows as a derived table for UPDATE ... FROM:
+    a VALUES list on PostgreSQL; SQLite cannot name VALUES columns, so
+    there it is the same rows as a UNION ALL of one-row SELECTs.
+    """
+    if dbsession.get_bind().dialect.name == 'postgresql':
+        return values(
+            column('product_id', Integer), column('take', Integer), column('sold', Integer), name='lines',
+        ).data(rows)
+    return union_all(*[
+        select(
+            literal(product_id, Integer).label('product_id'),
+            literal(take, Integer).label('take'),
+            literal(sold, Integer).label('sold'),
+        )
+        for product_id, take, sold in rows
+    ]).subquery('lines')
+
+
+def decrement_stock(dbsession, lines):
+    """
+    Take stock for every line and add to sold with one
+    UPDATE products ... FROM (VALUES ...) statement. `lines` is
+    {product_id: (units to take from products.stock, units sold)}. A row
+    is only updated when its stock covers the take (NULL stock is not
+    tracked), so the caller compares the returned {product_id: (name, new
+    sold)} with `lines` to find shortages.
+
+    On PostgreSQL the rows are locked in id order first: the UPDATE's join
+    may visit them in any order, and two checkouts sharing SKUs must not
+    lock them in opposite orders and deadlock.
+    """
+    product_ids = sorted(lines)
+    if dbsession.get_bind().dialect.name == 'postgresql':
+        dbsession.execute(select(Product.id).where(Product.id.in_(product_ids)).order_by(Product.id).with_for_update())
+    source = _stock_lines(dbsession, [(product_id, *lines[product_id]) for product_id in product_ids])
+    statement = (
+        update(Product)
+        .where(Product.id == source.c.product_id, or_(Product.stock.is_(None), Product.stock >= source.c.take))
+        .values(
+            stock=Product.stock - source.c.take,
+            sold=func.coalesce(Product.sold, 0) + source.c.sold,
+            version=Product.version + 1,
+        )
+        .returning(Product.id, Product.name, Product.sold)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id: (row.name, row.sold) for row in dbsession.execute(statement)}
+
+
+def _reserved_takes(dbsession, user_id, quantities, stock_reservations):
+    """
+    With stock reservations on, most units were taken when they went into
+    the cart. Settle the holds against the cart and return how many units
+    each line still has to take from products.stock: excess holds are
+    released, sharded products cover any shortfall from their shards here
+    (their products.stock is only a display total), and the holds are then
+    consumed. Returns ({product_id: take}, [product ids short of stock]).
+    """
+    held = stock_reservations.held(dbsession, user_id, quantities)
+    sharded = {
+        product_id for (product_id,) in
+        dbsession.query(StockShard.product_id).filter(StockShard.product_id.in_(list(quantities))).distinct()
+    }
+    takes, short = {}, []
+    for product_id, quantity in sorted(quantities.items()):
+        have = held.get(product_id, 0)
+        if have > quantity:
+            stock_reservations.release(dbsession, user_id, product_id, have - quantity)
+        elif have < quantity and product_id in sharded:
+            if stock_reservations.reserve(dbsession, user_id, product_id, quantity - have) is None:
+                short.append(product_id)
+        takes[product_id] = 0 if product_id in sharded else max(quantity - have, 0)
+    stock_reservations.consume(dbsession, user_id, quantities)
+    return takes, short
+
+
+def _shortages(dbsession, quantities, product_ids):
+    rows = dbsession.query(Product.id, Product.name, Product.stock).filter(Product.id.in_(product_ids)).order_by(Product.id)
+    return [
+        {'product_id': row.id, 'name': row.name, 'requested': quantities[row.id], 'available': row.stock}
+        for row in rows
+    ]
+
+
+def place_order(dbsession, user_id, shipping_method, payment_method, stock_reservations=None):
+    """
+    Turn the user's cart into an order. The cart lines are deleted first
+    with DELETE ... RETURNING, which both reads them and makes sure a
+    concurrent checkout of the same cart gets nothing; then all stock is
+    taken and sold bumped by decrement_stock's single UPDATE, and the order
+    and its lines are inserted (one INSERT each). Returns (order, {product_id:
+    new sold}). Raises CheckoutError for an empty cart or missing stock;
+    the caller must then roll the transaction back, which also restores
+    the cart.
+    """
+    lines = delete_cart_items(dbsession, user_id)
+    if not lines:
+        raise CheckoutError('Your cart is empty.')
+    quantities = {line.product_id: line.quantity for line in lines}
+
+    short = []
+    if stock_reservations is not None:
+        takes, short = _reserved_takes(dbsession, user_id, quantities, stock_reservations)
+    else:
+        takes = quantities
+    updated = decrement_stock(dbsession, {product_id: (takes[product_id], quantity)
+                                          for product_id, quantity in quantities.items()})
+    short.extend(product_id for product_id in quantities if product_id not in updated and product_id not in short)
+    if short:
+        shortages = _shortages(dbsession, quantities, short)
+        first = shortages[0] if shortages else None
+        message = (f"Not enough stock for {first['name']}. Available: {first['available']}" if first
+                   else 'Some products in your cart are no longer available.')
+        raise CheckoutError(message, shortages)
+
+    subtotal = round(sum(line.price_at_add * line.quantity for line in lines), 2)
+    shipping_cost = SHIPPING_COSTS[shipping_method]
+    tax = round(subtotal * TAX_RATE, 2)
+    order = Order(
+        user_id=user_id,
+        shipping_method=shipping_method,
+        payment_method=payment_method,
+        item_count=sum(quantities.values()),
+        subtotal=subtotal,
+        shipping_cost=shipping_cost,
+        tax=tax,
+        total=round(subtotal + shipping_cost + tax, 2),
+    )
+    dbsession.add(order)
+    dbsession.flush()
+    dbsession.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': line.product_id,
+            'product_name': updated[line.product_id][0],
+            'quantity': line.quantity,
+            'unit_price': line.price_at_add,
+        }
+        for line in sorted(lines, key=lambda line: line.product_id)
+    ])
+    return order, {product_id: sold for product_id, (_, sold) in updated.items()}
+
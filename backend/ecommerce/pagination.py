@@ -0,0 +1,87 @@
+# pagination.py
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row of a page into an opaque string."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Reverse of encode_cursor. Raises ValueError on anything we didn't issue."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    if raw is None or raw == '':
+        return default
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be at least 1')
+    return min(limit, maximum)
+
+
+def keyset_filter(order, values):
+    """
+    Build the WHERE clause that continues a keyset scan after `values`.
+
+    `order` is a list of (expression, descending) pairs, the last one being a
+    unique column (normally the primary key) so the ordering is total.
+    Expands to (a > x) OR (a = x AND b > y) OR ... which every backend can
+    serve from a composite index, even when directions are mixed.
+    """
+    if len(values) != len(order):
+        raise ValueError('Invalid cursor')
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal_prefix = [order[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, step))
+    return or_(*clauses)
+
+
+def order_by_clauses(order):
+    return [column.desc() if descending else column.asc() for column, descending in order]
+
+
+def keyset_page(query, order, limit, cursor=None):
+    """
+    Run one page of a keyset-paginated query.
+
+    Returns (rows, next_cursor); next_cursor is None on the last page. The
+    ordering expressions are appended to each row as _k0, _k1, ... so the
+    cursor can be built from whatever the caller selected.
+    """
+    if cursor:
+        query = query.filter(keyset_filter(order, decode_cursor(cursor)))
+    keys = [expression.label(f'_k{i}') for i, (expression, _) in enumerate(order)]
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    rows = (
+        query.add_columns(*keys)
+        .order_by(*order_by_clauses(order))
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, f'_k{i}') for i in range(len(order))])
+    return rows, next_cursor
@@ -0,0 +1,165 @@
+# passwords.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+DEFAULT_BCRYPT_ROUNDS = 12
+_LATENCY_SAMPLES = 1000
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password operations in flight; the client should retry shortly."""
+
+
+def bcrypt_rounds(hashed):
+    """The cost factor a bcrypt hash was made with ("$2b$12$..." -> 12), or None."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000, 1)
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing and checking with their own concurrency limit.
+
+    The work runs on a pool of `workers` threads (0 runs it on the calling
+    thread) and at most `max_pending` operations are admitted at a time,
+    running or queued. The request thread still waits for its result, so
+    the limit is what protects the server: a login storm can tie up at
+    most `max_pending` request threads and `workers` cores, and every
+    login beyond that fails fast with PasswordHasherBusy instead of
+    queueing in front of catalog reads. bcrypt releases the GIL while it
+    works, so other requests keep running meanwhile.
+    """
+
+    def __init__(self, rounds=DEFAULT_BCRYPT_ROUNDS, workers=1, max_pending=2, wait_timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt') if workers else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0            # admitted and not finished
+        self.running = 0            # on a worker right now
+        self.completed = 0
+        self.rejected = 0           # turned away, max_pending reached
+        self.timeouts = 0           # gave up waiting after wait_timeout
+        self.rehashed = 0           # hashes upgraded to the current cost on login
+        self._waits = deque(maxlen=_LATENCY_SAMPLES)    # seconds queued before a worker picked it up
+        self._runs = deque(maxlen=_LATENCY_SAMPLES)     # seconds of bcrypt
+
+    def _call(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy()
+        queued_at = time.perf_counter()
+        with self._lock:
+            self.pending += 1
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.running -= 1
+                    self.pending -= 1
+                    self.completed += 1
+                    self._waits.append(started - queued_at)
+                    self._runs.append(finished - started)
+                self._slots.release()
+
+        if self._executor is None:
+            return run()
+        future = self._executor.submit(run)
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeout:
+            # The job still finishes (and frees its slot) in the background
+            with self._lock:
+                self.timeouts += 1
+            raise PasswordHasherBusy()
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def hash(self, password):
+        """A new bcrypt hash at the configured cost."""
+        return self._call(self._hash, password)
+
+    def verify(self, password, hashed):
+        return self._call(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        return bcrypt_rounds(hashed) != self.rounds
+
+    def verify_and_upgrade(self, user, password):
+        """
+        Check a login password. When it matches a hash made at another cost,
+        store a fresh hash at the current one; if the hasher is too busy for
+        that right now, the upgrade waits for the next login.
+        """
+        if not self.verify(password, user.password):
+            return False
+        if self.needs_rehash(user.password):
+            try:
+                user.password = self.hash(password)
+            except PasswordHasherBusy:
+                return True
+            with self._lock:
+                self.rehashed += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            waits, runs = list(self._waits), list(self._runs)
+            return {
+                'rounds': self.rounds,
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'queued': self.pending - self.running,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'rehashed': self.rehashed,
+                'wait_ms_p50': _percentile(waits, 0.5),
+                'wait_ms_p99': _percentile(waits, 0.99),
+                'run_ms_p50': _percentile(runs, 0.5),
+                'run_ms_p99': _percentile(runs, 0.99),
+            }
+
+
+def password_hasher_from_settings(settings):
+    return PasswordHasher(
+        rounds=int(settings.get('passwords.bcrypt_rounds', DEFAULT_BCRYPT_ROUNDS)),
+        workers=int(settings.get('passwords.workers', 1)),
+        max_pending=int(settings.get('passwords.max_pending', 2)),
+        wait_timeout=float(settings.get('passwords.wait_timeout', 10.0)),
+    )
+
+
+_inline_hasher = PasswordHasher(workers=0, max_pending=64)
+
+
+def get_password_hasher(request):
+    """The registry's PasswordHasher; outside the app, an inline one at the default cost."""
+    return getattr(request.registry, 'password_hasher', None) or _inline_hasher
+
@@ -0,0 +1,374 @@
+# reservations.py
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select, update
+
+from .models.product import Product
+from .models.reservation import StockHold, StockShard
+
+DEFAULT_HOLD_TTL = 15 * 60
+RELEASE_BATCH_SIZE = 1000
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _restock(dbsession, units):
+    """Put back {(product_id, shard): quantity}."""
+    to_products = Counter()
+    for (product_id, shard), quantity in units.items():
+        if shard is not None:
+            restocked = dbsession.execute(
+                update(StockShard)
+                .where(StockShard.product_id == product_id, StockShard.shard == shard)
+                .values(stock=StockShard.stock + quantity)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if restocked:
+                continue
+            # The shards were merged back since the hold was taken
+        to_products[product_id] += quantity
+    for product_id, quantity in sorted(to_products.items()):
+        dbsession.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(stock=Product.stock + quantity, version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def release_holds_where(dbsession, *criteria):
+    """
+    Delete the holds matching `criteria` with one DELETE ... RETURNING and
+    put their units back. Returns a Counter of {(product_id, shard): units}.
+    A hold can only be deleted once, so concurrent callers never restock
+    the same units twice.
+    """
+    rows = dbsession.execute(
+        delete(StockHold)
+        .where(*criteria)
+        .returning(StockHold.product_id, StockHold.shard, StockHold.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+    units = Counter()
+    for product_id, shard, quantity in rows:
+        units[(product_id, shard)] += quantity
+    _restock(dbsession, units)
+    return units
+
+
+def release_user_holds(dbsession, user_id):
+    """Give back everything a user holds (account deletion)."""
+    return sum(release_holds_where(dbsession, StockHold.user_id == user_id).values())
+
+
+def delete_product_stock_rows(dbsession, product_ids):
+    """Drop holds and shards of products about to be deleted; nothing to restock."""
+    product_ids = list(product_ids)
+    dbsession.query(StockHold).filter(StockHold.product_id.in_(product_ids)).delete(synchronize_session=False)
+    dbsession.query(StockShard).filter(StockShard.product_id.in_(product_ids)).delete(synchronize_session=False)
+
+
+class StockReservations:
+    """
+    Time-limited stock holds, taken without row locks.
+
+    Products are either plain, where a hold is one conditional
+    UPDATE products SET stock = stock - n, version = version + 1
+    WHERE id = ? AND stock >= n (optimistic: nothing is read first, a
+    losing writer just matches zero rows), or sharded: their stock is
+    spread over stock_shards rows and a hold takes units from one shard
+    picked at random, so concurrent buyers of a flash-sale SKU mostly
+    update different rows. For sharded products products.stock is only
+    a display total, refreshed by sync_shard_totals().
+
+    Every hold records where its units came from; releasing it (explicitly
+    or once expired) puts them back there.
+    """
+
+    def __init__(self, hold_ttl=DEFAULT_HOLD_TTL):
+        self.hold_ttl = hold_ttl
+        self._lock = threading.Lock()
+        self.reserved = 0       # holds created
+        self.rejected = 0       # not enough stock
+        self.released = 0       # units given back by release()
+        self.expired = 0        # units given back by release_expired()
+        self.shard_retries = 0  # shard drained by someone else between read and update
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    # --- Taking stock ---
+
+    def _take_from_shard(self, dbsession, product_id, shard, quantity):
+        taken = dbsession.execute(
+            update(StockShard)
+            .where(
+                StockShard.product_id == product_id,
+                StockShard.shard == shard,
+                StockShard.stock >= quantity,
+            )
+            .values(stock=StockShard.stock - quantity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not taken:
+            self._count('shard_retries')
+        return bool(taken)
+
+    def _take_from_shards(self, dbsession, product_id, quantity, shards):
+        """
+        [(shard, units)] adding up to `quantity`, or None. One random shard
+        that can cover the whole quantity is tried first; only when none
+        can are units gathered from several shards, largest first.
+        """
+        whole = [row.shard for row in shards if row.stock >= quantity]
+        random.shuffle(whole)
+        for shard in whole:
+            if self._take_from_shard(dbsession, product_id, shard, quantity):
+                return [(shard, quantity)]
+
+        taken = []
+        remaining = quantity
+        for row in sorted(shards, key=lambda row: row.stock, reverse=True):
+            units = min(row.stock, remaining)
+            if units > 0 and self._take_from_shard(dbsession, product_id, row.shard, units):
+                taken.append((row.shard, units))
+                remaining -= units
+                if not remaining:
+                    return taken
+        # Not enough overall (or raced): give back what was gathered
+        _restock(dbsession, Counter({(product_id, shard): units for shard, units in taken}))
+        return None
+
+    def _take_from_product(self, dbsession, product_id, quantity):
+        # A NULL stock means "not tracked": the row matches and stays NULL
+        return dbsession.execute(
+            update(Product)
+            .where(Product.id == product_id, (Product.stock.is_(None)) | (Product.stock >= quantity))
+            .values(stock=Product.stock - quantity, version=Product.version + 1)
+            .execution_options(synchronize_session=False)
+        ).rowcount > 0
+
+    def reserve(self, dbsession, user_id, product_id, quantity):
+        """
+        Hold `quantity` units for the user. Returns the new StockHolds (one
+        per shard the units came from), or None when there is not enough
+        stock (or no such product).
+        """
+        shards = (
+            dbsession.query(StockShard.shard, StockShard.stock)
+            .filter(StockShard.product_id == product_id)
+            .all()
+        )
+        if shards:
+            taken = self._take_from_shards(dbsession, product_id, quantity, shards)
+        elif self._take_from_product(dbsession, product_id, quantity):
+            taken = [(None, quantity)]
+        else:
+            taken = None
+        if taken is None:
+            self._count('rejected')
+            return None
+
+        expires_at = utcnow() + timedelta(seconds=self.hold_ttl)
+        holds = [
+            StockHold(product_id=product_id, user_id=user_id, shard=shard, quantity=units, expires_at=expires_at)
+            for shard, units in taken
+        ]
+        dbsession.add_all(holds)
+        dbsession.flush()
+        self._count('reserved')
+        return holds
+
+    # --- Giving stock back ---
+
+    def release(self, dbsession, user_id, product_id, quantity=None):
+        """
+        Give back up to `quantity` held units (all of them when None),
+        newest holds first. Returns how many units were released.
+        """
+        holds = (
+            dbsession.query(StockHold)
+            .filter(StockHold.user_id == user_id, StockHold.product_id == product_id)
+            .order_by(StockHold.id.desc())
+            .all()
+        )
+        remaining = quantity
+        units = Counter()
+        for hold in holds:
+            if remaining is not None and remaining <= 0:
+                break
+            take = hold.quantity if remaining is None else min(hold.quantity, remaining)
+            if take == hold.quantity:
+                dbsession.delete(hold)
+            else:
+                hold.quantity -= take
+            units[(hold.product_id, hold.shard)] += take
+            if remaining is not None:
+                remaining -= take
+        dbsession.flush()
+        _restock(dbsession, units)
+        released = sum(units.values())
+        self._count('released', released)
+        return released
+
+    def held(self, dbsession, user_id, product_ids=None):
+        """{product_id: units held} for the user, expired-but-unswept holds included."""
+        query = (
+            dbsession.query(StockHold.product_id, func.sum(StockHold.quantity))
+            .filter(StockHold.user_id == user_id)
+            .group_by(StockHold.product_id)
+        )
+        if product_ids is not None:
+            query = query.filter(StockHold.product_id.in_(list(product_ids)))
+        return {product_id: int(total) for product_id, total in query}
+
+    def consume(self, dbsession, user_id, product_ids=None):
+        """
+        Turn the user's holds into a sale: delete them without restocking.
+        Holds that expired but were not swept yet still have their units
+        taken, so they count too. Returns {product_id: units consumed}.
+        """
+        statement = delete(StockHold).where(StockHold.user_id == user_id)
+        if product_ids is not None:
+            statement = statement.where(StockHold.product_id.in_(list(product_ids)))
+        rows = dbsession.execute(
+            statement.returning(StockHold.product_id, StockHold.quantity)
+            .execution_options(synchronize_session=False)
+        ).all()
+        consumed = Counter()
+        for product_id, quantity in rows:
+            consumed[product_id] += quantity
+        return dict(consumed)
+
+    def release_expired(self, dbsession, now=None, batch_size=RELEASE_BATCH_SIZE):
+        """
+        Release one batch of expired holds with a single DELETE ... RETURNING
+        and one restocking UPDATE per (product, shard). Returns the number
+        of expired holds found; call again (ideally in a new transaction)
+        until it returns less than batch_size.
+        """
+        now = now or utcnow()
+        expired_ids = (
+            select(StockHold.id)
+            .where(StockHold.expires_at <= now)
+            .order_by(StockHold.expires_at)
+            .limit(batch_size)
+        )
+        expired_ids = list(dbsession.execute(expired_ids).scalars())
+        if expired_ids:
+            units = release_holds_where(dbsession, StockHold.id.in_(expired_ids))
+            self._count('expired', sum(units.values()))
+        return len(expired_ids)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hold_ttl': self.hold_ttl,
+                'reserved': self.reserved,
+                'rejected': self.rejected,
+                'released': self.released,
+                'expired': self.expired,
+                'shard_retries': self.shard_retries,
+            }
+
+
+# --- Sharding hot products ---
+
+def split_stock(dbsession, product_id, shards):
+    """
+    Spread a product's stock over `shards` stock_shards rows ahead of a
+    flash sale. products.stock keeps showing the total.
+    """
+    merge_stock(dbsession, product_id)
+    stock = dbsession.query(Product.stock).filter(Product.id == product_id).scalar() or 0
+    base, extra = divmod(stock, shards)
+    for shard in range(shards):
+        dbsession.add(StockShard(product_id=product_id, shard=shard, stock=base + (1 if shard < extra else 0)))
+    dbsession.flush()
+
+
+def merge_stock(dbsession, product_id):
+    """Fold a product's shards back into products.stock (after the sale)."""
+    total = (
+        dbsession.query(func.sum(StockShard.stock))
+        .filter(StockShard.product_id == product_id)
+        .scalar()
+    )
+    if total is None:
+        return
+    dbsession.query(StockShard).filter(StockShard.product_id == product_id).delete(synchronize_session=False)
+    dbsession.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock=total, version=Product.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def sync_shard_totals(dbsession):
+    """Refresh products.stock of sharded products from their shards."""
+    totals = (
+        select(func.sum(StockShard.stock))
+        .where(StockShard.product_id == Product.id)
+        .scalar_subquery()
+    )
+    return dbsession.execute(
+        update(Product)
+        .where(Product.id.in_(select(StockShard.product_id).distinct()))
+        .values(stock=totals, version=Product.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def get_stock_reservations(request):
+    """The registry's StockReservations, or None when stock_reservations.enabled is off."""
+    return getattr(request.registry, 'stock_reservations', None)
+
+
+# --- Command line: releasing expired holds ---
+
+def release_expired_holds(engine, batch_size=RELEASE_BATCH_SIZE, reservations=None):
+    """Release every expired hold, one short transaction per batch."""
+    from sqlalchemy.orm import Session
+
+    reservations = reservations or StockReservations()
+    total = 0
+    while True:
+        with Session(bind=engine) as session, session.begin():
+            released = reservations.release_expired(session, batch_size=batch_size)
+            if released:
+                sync_shard_totals(session)
+        total += released
+        if released < batch_size:
+            return total
+
+
+def main(argv=None):
+    """
+    Console entry point, for cron or a systemd timer:
+
+        ecommerce_release_holds development.ini
+        ecommerce_release_holds development.ini --batch-size 500
+    """
+    import argparse
+
+    from pyramid.paster import get_appsettings
+    from sqlalchemy import engine_from_config
+
+    parser = argparse.ArgumentParser(prog='ecommerce_release_holds', description='Release expired stock holds.')
+    parser.add_argument('config_uri', help='the app .ini file (reads sqlalchemy.url)')
+    parser.add_argument('--batch-size', type=int, default=RELEASE_BATCH_SIZE, help='holds released per transaction')
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+
+    settings = get_appsettings(args.config_uri)
+    released = release_expired_holds(engine_from_config(settings, 'sqlalchemy.'), batch_size=args.batch_size)
+    print(f'released {released} expired holds')
+    return 0
@@ -1,5 +1,5 @@
 # backend/ecommerce/schemas/cart.py
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
 from .product import ProductSchema # Assuming product.py (schema) is in the same directory
 
 class CartItemSchema(Schema):
@@ -46,21 +46,15 @@ class CartSchema(Schema):
     grand_total = fields.Method("get_grand_total", dump_only=True)
 
     def get_total_items_count(self, obj):
-        # obj is the Cart SQLAlchemy model instance
-        if obj and hasattr(obj, 'items'):
-            return sum(item.quantity for item in obj.items)
-        return 0
+        # obj is the Cart SQLAlchemy model instance; the count is stored on it
+        # (ecommerce/carts.py keeps it current), so the items are not summed here
+        return obj.item_count if obj and obj.item_count is not None else 0
 
     def get_grand_total(self, obj):
-        # obj is the Cart SQLAlchemy model instance
-        if not obj or not hasattr(obj, 'items') or not obj.items:
+        # Stored running total, rounded for display like item_total
+        if not obj or obj.grand_total is None:
             return 0.0
-        
-        total = 0.0
-        for item in obj.items:
-            if hasattr(item, 'price_at_add') and hasattr(item, 'quantity'):
-                total += item.price_at_add * item.quantity
-        return round(total, 2)
+        return round(obj.grand_total, 2)
 
 # --- Schemas for API Input (Loading/Validation) ---
 
@@ -76,4 +70,41 @@ class CartItemUpdateSchema(Schema):
     """
     Schema for validating data when a user updates the quantity of an item in the cart.
     """
-    quantity = fields.Int(required=True, validate=validate.Range(min=1, error="Quantity must be at least 1. To remove an item, use the delete endpoint."), error_messages={"required": "Quantity is required."})
\ No newline at end of file
+    quantity = fields.Int(required=True, validate=validate.Range(min=1, error="Quantity must be at least 1. To remove an item, use the delete endpoint."), error_messages={"required": "Quantity is required."})
+
+MAX_CART_OPERATIONS = 100
+
+class CartOperationSchema(Schema):
+    """
+    One step of a batched cart edit (PATCH /api/cart):
+      {"op": "add", "product_id": 3, "quantity": 2}     add to the line (created if needed)
+      {"op": "set", "item_id": 7, "quantity": 5}        set a line's quantity (0 removes it)
+      {"op": "remove", "item_id": 7}                    drop a line
+    set and remove take either item_id or product_id.
+    """
+    op = fields.Str(required=True, validate=validate.OneOf(['add', 'set', 'remove']))
+    item_id = fields.Int()
+    product_id = fields.Int()
+    quantity = fields.Int(validate=validate.Range(min=0, error="Quantity cannot be negative."))
+
+    @validates_schema
+    def check_operation(self, data, **kwargs):
+        op = data.get('op')
+        if op == 'add':
+            if 'product_id' not in data:
+                raise ValidationError('add needs a product_id.', 'product_id')
+            if not data.get('quantity'):
+                raise ValidationError('add needs a quantity of at least 1.', 'quantity')
+        elif op in ('set', 'remove'):
+            if ('item_id' in data) == ('product_id' in data):
+                raise ValidationError(f'{op} needs exactly one of item_id or product_id.', 'item_id')
+            if op == 'set' and 'quantity' not in data:
+                raise ValidationError('set needs a quantity.', 'quantity')
+
+class CartPatchSchema(Schema):
+    """Schema for PATCH /api/cart: the operations are applied in order, all or nothing."""
+    operations = fields.List(
+        fields.Nested(CartOperationSchema),
+        required=True,
+        validate=validate.Length(min=1, max=MAX_CART_OPERATIONS),
+    )
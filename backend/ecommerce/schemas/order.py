@@ -0,0 +1,37 @@
+# backend/ecommerce/schemas/order.py
+from marshmallow import Schema, fields, validate
+
+# Flat shipping prices and the tax rate shown on the checkout page
+SHIPPING_COSTS = {'standard': 4.99, 'express': 9.99}
+PAYMENT_METHODS = ('credit', 'paypal')
+TAX_RATE = 0.07
+
+class CheckoutSchema(Schema):
+    """Schema for POST /api/checkout; the cart itself is the order's content."""
+    shipping_method = fields.Str(load_default='standard', validate=validate.OneOf(list(SHIPPING_COSTS)))
+    payment_method = fields.Str(load_default='credit', validate=validate.OneOf(list(PAYMENT_METHODS)))
+
+class OrderItemSchema(Schema):
+    id = fields.Int(dump_only=True)
+    product_id = fields.Int(dump_only=True, allow_none=True)
+    product_name = fields.Str(dump_only=True)
+    quantity = fields.Int(dump_only=True)
+    unit_price = fields.Float(dump_only=True)
+    item_total = fields.Method("get_item_total", dump_only=True)
+
+    def get_item_total(self, obj):
+        return round(obj.unit_price * obj.quantity, 2)
+
+class OrderSchema(Schema):
+    id = fields.Int(dump_only=True)
+    user_id = fields.Int(dump_only=True)
+    status = fields.Str(dump_only=True)
+    shipping_method = fields.Str(dump_only=True)
+    payment_method = fields.Str(dump_only=True)
+    item_count = fields.Int(dump_only=True)
+    subtotal = fields.Float(dump_only=True)
+    shipping_cost = fields.Float(dump_only=True)
+    tax = fields.Float(dump_only=True)
+    total = fields.Float(dump_only=True)
+    created_at = fields.DateTime(dump_only=True)
+    items = fields.List(fields.Nested(OrderItemSchema), dump_only=True)
@@ -1,5 +1,5 @@
 # backend/ecommerce/schemas/product.py
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, validate, post_load
 
 class ProductSchema(Schema):
     id             = fields.Int(dump_only=True)
@@ -12,4 +12,11 @@ class ProductSchema(Schema):
     rating         = fields.Float(allow_none=True)
     sold           = fields.Int(allow_none=True)
     stock          = fields.Int(allow_none=True)
-    # category       = fields.Str(allow_none=True)
+    category       = fields.Str(allow_none=True, validate=validate.Length(max=100))
+
+    @post_load
+    def normalize_category(self, data, **kwargs):
+        # One spelling per category so the per-category counts add up
+        if data.get('category') is not None:
+            data['category'] = data['category'].strip().lower() or None
+        return data
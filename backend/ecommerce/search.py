@@ -0,0 +1,140 @@
+# search.py
+import html
+import re
+from collections import namedtuple
+
+from sqlalchemy import column, func, literal_column, or_, table
+
+from .models.product import Product
+from .pagination import keyset_page
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_STOP = '</mark>'
+# What the database's highlight functions wrap matches in: control
+# characters, so the seller's text can be escaped before they become tags
+_MATCH_START = '\x02'
+_MATCH_STOP = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_MATCH_RE = re.compile(f'([{_MATCH_START}{_MATCH_STOP}])')
+
+products_fts = table('products_fts', column('rowid'))
+
+# Row shape shared by every search backend
+SearchHit = namedtuple('SearchHit', 'Product rank name_highlight description_highlight')
+
+
+def tokenize_query(text):
+    """Lower-cased word tokens; anything else is dropped so user input can't
+    inject tsquery/FTS5 operators."""
+    return [token.lower() for token in _TOKEN_RE.findall(text or '')]
+
+
+def mark_up(text):
+    """
+    Text from a highlight function (matches between _MATCH_START and
+    _MATCH_STOP) as HTML: the text escaped, the matches wrapped in <mark>.
+    Product text is seller input, so it must never reach clients unescaped.
+    """
+    if text is None:
+        return None
+    html_parts = []
+    inside = False
+    for part in _MATCH_RE.split(text):
+        if part == _MATCH_START:
+            if not inside:
+                html_parts.append(HIGHLIGHT_START)
+            inside = True
+        elif part == _MATCH_STOP:
+            if inside:
+                html_parts.append(HIGHLIGHT_STOP)
+            inside = False
+        else:
+            html_parts.append(html.escape(part))
+    if inside:
+        html_parts.append(HIGHLIGHT_STOP)
+    return ''.join(html_parts)
+
+
+def highlight_terms(text, terms):
+    """`text` as HTML, every word whose lower-cased form is in `terms` wrapped in <mark>."""
+    if text is None:
+        return None
+    marked = _TOKEN_RE.sub(
+        lambda m: f'{_MATCH_START}{m.group(0)}{_MATCH_STOP}' if m.group(0).lower() in terms else m.group(0),
+        _MATCH_RE.sub('', text),
+    )
+    return mark_up(marked)
+
+
+def _postgresql_query(dbsession, tokens):
+    # Every word must match, as a prefix so search-as-you-type works
+    tsquery = func.to_tsquery('english', ' & '.join(f'{token}:*' for token in tokens))
+    search_vector = literal_column('products.search_vector')
+    rank = func.ts_rank_cd(search_vector, tsquery)
+    headline_options = f'StartSel={_MATCH_START},StopSel={_MATCH_STOP},HighlightAll=true'
+    snippet_options = f'StartSel={_MATCH_START},StopSel={_MATCH_STOP},MaxWords=20,MinWords=8'
+    query = dbsession.query(
+        Product,
+        rank.label('rank'),
+        func.ts_headline('english', Product.name, tsquery, headline_options).label('name_highlight'),
+        func.ts_headline('english', Product.description, tsquery, snippet_options).label('description_highlight'),
+    ).filter(search_vector.op('@@')(tsquery))
+    return query, [(rank, True), (Product.id, True)]
+
+
+def _sqlite_query(dbsession, tokens):
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    fts = literal_column('products_fts')
+    # bm25() is "lower is better"; name hits weigh more than description hits
+    bm25 = func.bm25(fts, 10.0, 1.0)
+    query = dbsession.query(
+        Product,
+        (-bm25).label('rank'),
+        func.highlight(fts, 0, _MATCH_START, _MATCH_STOP).label('name_highlight'),
+        func.snippet(fts, 1, _MATCH_START, _MATCH_STOP, '...', 16).label('description_highlight'),
+    ).join(products_fts, products_fts.c.rowid == Product.id).filter(fts.op('MATCH')(match))
+    return query, [(bm25, False), (Product.id, True)]
+
+
+def _like_query(dbsession, tokens):
+    # Fallback for databases without a full-text backend: the old unranked scan
+    filters = []
+    for token in tokens:
+        term = f'%{token}%'
+        filters.append(or_(func.lower(Product.name).like(term), func.lower(Product.description).like(term)))
+    query = dbsession.query(
+        Product,
+        literal_column('0.0').label('rank'),
+        Product.name.label('name_highlight'),
+        Product.description.label('description_highlight'),
+    ).filter(*filters)
+    return query, [(Product.id, True)]
+
+
+_BACKENDS = {
+    'postgresql': _postgresql_query,
+    'sqlite': _sqlite_query,
+}
+
+
+def search_products(dbsession, text, limit, cursor=None):
+    """
+    Ranked full-text product search.
+
+    Returns (rows, next_cursor). Each row is a SearchHit: .Product, .rank
+    (higher is more relevant) and .name_highlight/.description_highlight,
+    escaped HTML with the matched words in <mark>.
+    """
+    tokens = tokenize_query(text)
+    if not tokens:
+        return [], None
+    dialect = dbsession.get_bind().dialect.name
+    build = _BACKENDS.get(dialect, _like_query)
+    query, order = build(dbsession, tokens)
+    rows, next_cursor = keyset_page(query, order, limit, cursor)
+    hits = [
+        SearchHit(row.Product, row.rank, mark_up(row.name_highlight), mark_up(row.description_highlight))
+        for row in rows
+    ]
+    return hits, next_cursor
@@ -0,0 +1,283 @@
+# search_index.py
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+import transaction
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .models.product import Product
+from .pagination import decode_cursor, encode_cursor
+from .search import SearchHit, highlight_terms, tokenize_query
+
+# Trigram size and padding follow pg_trgm: two spaces in front, one behind
+_Q = 3
+
+
+def trigrams(term):
+    padded = f'  {term} '
+    return {padded[i:i + _Q] for i in range(len(padded) - _Q + 1)}
+
+
+def max_edits(term):
+    """How many typos we forgive for a query term of this length."""
+    if len(term) <= 3:
+        return 0
+    if len(term) <= 6:
+        return 1
+    return 2
+
+
+def edit_distance(a, b, limit):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions, so "iphnoe" -> "iphone" is one edit). Gives up and
+    returns limit + 1 as soon as every cell in a row exceeds limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _contains(sorted_ids, value):
+    i = bisect_left(sorted_ids, value)
+    return i < len(sorted_ids) and sorted_ids[i] == value
+
+
+class ProductSearchIndex:
+    """
+    In-memory inverted index over product names and descriptions, with a
+    trigram index over the vocabulary for typo-tolerant lookups.
+
+    Posting lists are sorted array('I') of product ids (4 bytes per entry).
+    Terms get a stable integer id; the trigram index maps a trigram to the
+    term ids containing it, so fuzzy matching only ever looks at the
+    vocabulary, never at the products themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._terms = []          # term id -> term
+        self._term_ids = {}       # term -> term id
+        self._postings = {}       # term id -> array('I') of product ids
+        self._trigrams = {}       # trigram -> array('I') of term ids
+        self._docs = {}           # product id -> (name term ids, all term ids)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _term_id(self, term):
+        term_id = self._term_ids.get(term)
+        if term_id is None:
+            term_id = len(self._terms)
+            self._terms.append(term)
+            self._term_ids[term] = term_id
+            self._postings[term_id] = array('I')
+            for gram in trigrams(term):
+                self._trigrams.setdefault(gram, array('I')).append(term_id)
+        return term_id
+
+    # --- Maintenance ---
+
+    def build(self, dbsession, batch_size=1000):
+        """(Re)load every product. Only meant for startup."""
+        rows = (
+            dbsession.query(Product.id, Product.name, Product.description)
+            .order_by(Product.id)
+            .yield_per(batch_size)
+        )
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self.add(row.id, row.name, row.description)
+        return len(self)
+
+    def add(self, product_id, name, description):
+        with self._lock:
+            if product_id in self._docs:
+                self.remove(product_id)
+            name_ids = sorted({self._term_id(t) for t in tokenize_query(name)})
+            all_ids = sorted(set(name_ids) | {self._term_id(t) for t in tokenize_query(description)})
+            for term_id in all_ids:
+                insort(self._postings[term_id], product_id)
+            self._docs[product_id] = (array('I', name_ids), array('I', all_ids))
+
+    update = add
+
+    def add_from_db(self, bind, product_ids, batch_size=1000):
+        """
+        Index products by id, reading them through a session of their own.
+        Used from after-commit hooks, where the request's session is done.
+        """
+        with Session(bind=bind) as session:
+            for start in range(0, len(product_ids), batch_size):
+                chunk = list(product_ids[start:start + batch_size])
+                rows = (
+                    session.query(Product.id, Product.name, Product.description)
+                    .filter(Product.id.in_(chunk))
+                )
+                for row in rows:
+                    self.add(row.id, row.name, row.description)
+
+    def remove(self, product_id):
+        with self._lock:
+            doc = self._docs.pop(product_id, None)
+            if doc is None:
+                return
+            for term_id in doc[1]:
+                posting = self._postings[term_id]
+                i = bisect_left(posting, product_id)
+                if i < len(posting) and posting[i] == product_id:
+                    del posting[i]
+
+    # --- Queries ---
+
+    def _matching_terms(self, term):
+        """term id -> weight for every vocabulary term close enough to `term`."""
+        matches = {}
+        exact = self._term_ids.get(term)
+        if exact is not None and self._postings[exact]:
+            matches[exact] = 1.0
+        if len(term) < 2:
+            return matches
+        limit = max_edits(term)
+        grams = trigrams(term)
+        # A prefix shares every trigram but the one holding the end padding.
+        # An edit touches at most q trigrams, a transposition q + 1, so a term
+        # within k of them still shares len(grams) - (q + 1) * k (q-gram lemma)
+        needed = max(1, len(grams) - max(1, (_Q + 1) * limit))
+        shared = {}
+        for gram in grams:
+            for term_id in self._trigrams.get(gram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        for term_id, count in shared.items():
+            if count < needed or term_id in matches or not self._postings[term_id]:
+                continue
+            candidate = self._terms[term_id]
+            if candidate.startswith(term):
+                # Still being typed: "ipho" should find "iphone"
+                matches[term_id] = 0.9
+            elif limit:
+                distance = edit_distance(term, candidate, limit)
+                if distance <= limit:
+                    matches[term_id] = 1.0 - distance / (len(term) + 1)
+        return matches
+
+    def search(self, text, limit, after=None):
+        """
+        Return (hits, more) where hits is a list of (product_id, score, terms)
+        best first. Every query word must match some term (exactly, as a
+        prefix or within a few typos); name matches count double. `after` is
+        the (score, product_id) of the last hit of the previous page.
+        """
+        tokens = tokenize_query(text)
+        if not tokens:
+            return [], False
+        with self._lock:
+            scores = None
+            matched_terms = {}
+            for token in tokens:
+                token_scores = {}
+                for term_id, weight in self._matching_terms(token).items():
+                    for product_id in self._postings[term_id]:
+                        name_ids = self._docs[product_id][0]
+                        score = weight * (2.0 if _contains(name_ids, term_id) else 1.0)
+                        if score > token_scores.get(product_id, 0.0):
+                            token_scores[product_id] = score
+                        matched_terms.setdefault(product_id, set()).add(self._terms[term_id])
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {pid: s + token_scores[pid] for pid, s in scores.items() if pid in token_scores}
+                if not scores:
+                    return [], False
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        if after is not None:
+            after_score, after_id = after
+            ranked = [(pid, s) for pid, s in ranked if (s, pid) < (after_score, after_id)]
+        page = ranked[:limit]
+        hits = [(pid, score, matched_terms[pid]) for pid, score in page]
+        return hits, len(ranked) > limit
+
+    def memory_stats(self):
+        with self._lock:
+            return {
+                'products': len(self._docs),
+                'terms': len(self._terms),
+                'trigrams': len(self._trigrams),
+                'posting_bytes': sum(p.itemsize * len(p) for p in self._postings.values()),
+                'trigram_bytes': sum(p.itemsize * len(p) for p in self._trigrams.values()),
+            }
+
+
+def index_search_products(index, dbsession, text, limit, cursor=None):
+    """
+    Same contract as search.search_products, but matching and ranking come
+    from the in-memory index; the database is only asked for the page's rows
+    by primary key.
+    """
+    after = None
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 2:
+            raise ValueError('Invalid cursor')
+        after = tuple(values)
+    hits, more = index.search(text, limit, after)
+    if not hits:
+        return [], None
+    ids = [product_id for product_id, _, _ in hits]
+    products = {p.id: p for p in dbsession.query(Product).filter(Product.id.in_(ids))}
+    rows = []
+    for product_id, score, terms in hits:
+        product = products.get(product_id)
+        if product is None:
+            # Deleted but the after-commit hook hasn't run yet
+            continue
+        rows.append(SearchHit(
+            product,
+            score,
+            highlight_terms(product.name, terms),
+            highlight_terms(product.description, terms),
+        ))
+    next_cursor = None
+    if more:
+        last_id, last_score, _ = hits[-1]
+        next_cursor = encode_cursor([last_score, last_id])
+    return rows, next_cursor
+
+
+def get_search_index(request):
+    """The registry's ProductSearchIndex, or None when search_index.enabled is off."""
+    return getattr(request.registry, 'search_index', None)
+
+
+def build_search_index(dbsession):
+    """Create and fill the index at startup, in its own short transaction."""
+    index = ProductSearchIndex()
+    try:
+        with transaction.manager:
+            count = index.build(dbsession)
+        print(f"[SearchIndex] Indexed {count} products: {index.memory_stats()}")
+    except SQLAlchemyError as e:
+        # Fresh database without tables yet; the views will fill it as products arrive
+        print(f"[SearchIndex] Could not build index at startup: {e}")
+    finally:
+        dbsession.remove()
+    return index
@@ -1,9 +1,18 @@
 # security.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from pyramid.decorator import reify
 from pyramid.response import Response
 from pyramid.request import Request
 from pyramid.httpexceptions import HTTPFound, HTTPUnauthorized
 import jwt
 
+from .identity import get_identity_cache, load_user
+from .models.meta import DBSession
+
 JWT_SECRET = "Secret Code"
 
 def cors_tween_factory(handler, registry):
@@ -14,24 +23,15 @@ def cors_tween_factory(handler, registry):
             response = handler(request)
         response.headers.update({
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-            'Access-Control-Allow-Headers': 'Origin, Content-Type, Authorization',
+            'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
+            'Access-Control-Allow-Headers': 'Origin, Content-Type, Authorization, If-None-Match, If-Modified-Since',
+            'Access-Control-Expose-Headers': 'ETag, Last-Modified',
         })
         return response
     return cors_tween
 
 def is_authenticated(request):
-    auth = request.headers.get('Authorization')
-    if not auth:
-        return False
-    try:
-        scheme, token = auth.split(' ', 1)
-        if scheme.lower() != 'bearer':
-            return False
-        jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return True
-    except Exception:
-        return False
+    return request.jwt_claims is not None
 
 def prevent_logged_in_user_tween_factory(handler, registry):
     def tween(request):
@@ -48,18 +48,111 @@ def prevent_logged_in_user_tween_factory(handler, registry):
     return tween
 
 def get_user_id_from_jwt(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or not auth_header.startswith("Bearer "):
-        raise HTTPUnauthorized("Missing or invalid Authorization header")
+    claims = request.jwt_claims
+    if claims is None:
+        raise HTTPUnauthorized(request.jwt_error)
+    user_id = claims.get("user_id")  # Ensure this field matches your JWT payload
+    if not user_id:
+        raise HTTPUnauthorized("Invalid token payload: user_id missing")
+    return user_id
+
+
+# --- Verifying bearer tokens once ---
+
+class VerifiedTokenCache:
+    """
+    Claims of recently verified tokens, so a client polling with the same
+    token skips the HMAC check. Bounded LRU keyed by a SHA-256 digest of
+    the token (raw tokens are never kept); an entry is only served until
+    the token's own `exp`, and tokens without one are not cached.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # digest -> (exp, claims)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token, claims):
+        exp = claims.get('exp')
+        if not isinstance(exp, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (exp, claims)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
 
-    token = auth_header.split(" ")[1]
+
+def get_jwt_cache(request):
+    """The registry's VerifiedTokenCache, or None when jwt_cache.enabled is off."""
+    return getattr(request.registry, 'jwt_cache', None)
+
+
+def verify_bearer(auth_header, cache=None):
+    """(claims, None) for a valid "Bearer <jwt>" header, else (None, reason)."""
+    scheme, _, token = (auth_header or '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None, "Missing or invalid Authorization header"
+    if cache is not None:
+        claims = cache.get(token)
+        if claims is not None:
+            return claims, None
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-        user_id = payload.get("user_id")  # Ensure this field matches your JWT payload
-        if not user_id:
-            raise HTTPUnauthorized("Invalid token payload: user_id missing")
-        return user_id
+        claims = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
     except jwt.ExpiredSignatureError:
-        raise HTTPUnauthorized("Token expired")
+        return None, "Token expired"
     except jwt.InvalidTokenError:
-        raise HTTPUnauthorized("Invalid token")
\ No newline at end of file
+        return None, "Invalid token"
+    if cache is not None:
+        cache.put(token, claims)
+    return claims, None
+
+
+class AppRequest(Request):
+    """
+    The application's request factory. Identity is resolved lazily and
+    at most once per request, however many tweens and helpers ask; being
+    class-level reified properties they cost nothing on requests that
+    never look (unlike add_request_method, which subclasses per request).
+    """
+    jwt_error = None
+
+    @reify
+    def jwt_claims(self):
+        """The bearer token's claims, or None (reason in jwt_error)."""
+        claims, self.jwt_error = verify_bearer(self.headers.get('Authorization'), get_jwt_cache(self))
+        return claims
+
+    @reify
+    def user(self):
+        """The authenticated User, loaded once per request (see identity.py), or None."""
+        user_id = (self.jwt_claims or {}).get('user_id')
+        if not user_id:
+            return None
+        return load_user(DBSession, user_id, get_identity_cache(self))
+
@@ -0,0 +1,94 @@
+# singleflight.py
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """Waited too long for another thread's in-flight call."""
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one.
+
+    The first thread to ask for a key runs the function; threads arriving
+    while it is still running wait for that result (or exception) instead of
+    issuing the same query themselves. Nothing is cached afterwards; that is
+    the product cache's job.
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0     # calls that actually ran
+        self.collapsed = 0      # calls served by someone else's run
+        self.timeouts = 0
+        self.errors = 0
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self.executions += 1
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise SingleFlightTimeout(f'Timed out waiting for {key!r}')
+            with self._lock:
+                self.collapsed += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'collapsed': self.collapsed,
+                'timeouts': self.timeouts,
+                'errors': self.errors,
+                'in_flight': len(self._calls),
+            }
+
+
+def get_single_flight(request):
+    """The registry's SingleFlight, or None when it is switched off."""
+    return getattr(request.registry, 'single_flight', None)
+
+
+def coalesce(request, key, func, *args, **kwargs):
+    """Run func through the registry's SingleFlight if there is one."""
+    single_flight = get_single_flight(request)
+    if single_flight is None:
+        return func(*args, **kwargs)
+    return single_flight.do(key, func, *args, **kwargs)
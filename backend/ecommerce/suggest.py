@@ -0,0 +1,234 @@
+# suggest.py
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+import transaction
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .models.product import Product
+from .search import tokenize_query
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+MAX_PREFIX_LENGTH = 100
+# Prefix ranges up to this size are ranked on every call (tens of µs);
+# bigger ones ("a", "ip") are ranked once and kept until a product under
+# them changes.
+SCAN_LIMIT = 256
+_SOLD_MAX = 2 ** 32 - 1
+
+
+def normalize_name(text):
+    """Lower-cased words joined by single spaces, the form names are indexed under."""
+    return ' '.join(tokenize_query(text))
+
+
+def normalize_prefix(text):
+    prefix = normalize_name(text)
+    if prefix and text[-1:].isspace():
+        # "iphone " is asking for the next word, not for "iphonex"
+        prefix += ' '
+    return prefix[:MAX_PREFIX_LENGTH]
+
+
+class ProductSuggestIndex:
+    """
+    Product names for search-as-you-type, ranked by units sold.
+
+    Normalized names are kept in one sorted list, so the names starting
+    with a prefix are the slice between two bisects. Product ids and sold
+    counts sit in array('I') columns aligned with that list; the top k of a
+    slice is a heapq.nlargest over the sold column.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._keys = []             # sorted normalized names
+        self._ids = array('I')      # product id, aligned with _keys
+        self._sold = array('I')     # units sold, aligned with _keys
+        self._names = {}            # product id -> (normalized name, display name)
+        self._top = {}              # prefix -> ranked suggestions for big ranges
+
+    def __len__(self):
+        return len(self._names)
+
+    def _position(self, product_id, key):
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        for i in range(lo, hi):
+            if self._ids[i] == product_id:
+                return i
+        raise KeyError(product_id)
+
+    def _forget_prefixes(self, key):
+        if self._top:
+            for length in range(1, min(len(key), MAX_PREFIX_LENGTH) + 1):
+                self._top.pop(key[:length], None)
+
+    # --- Maintenance ---
+
+    def build(self, dbsession, batch_size=1000):
+        """(Re)load every product. Only meant for startup."""
+        rows = (
+            dbsession.query(Product.id, Product.name, Product.sold)
+            .yield_per(batch_size)
+        )
+        with self._lock:
+            self._load((row.id, row.name, row.sold) for row in rows)
+        return len(self)
+
+    def _load(self, products):
+        """Replace the contents with (id, name, sold) rows, sorting once instead of inserting each."""
+        with self._lock:
+            self._reset()
+            entries = []
+            for product_id, name, sold in products:
+                key = normalize_name(name)
+                if key:
+                    entries.append((key, product_id, min(sold or 0, _SOLD_MAX)))
+                    self._names[product_id] = (key, name)
+            entries.sort()
+            self._keys = [key for key, _, _ in entries]
+            self._ids = array('I', (product_id for _, product_id, _ in entries))
+            self._sold = array('I', (sold for _, _, sold in entries))
+
+    def add(self, product_id, name, sold):
+        key = normalize_name(name)
+        with self._lock:
+            if product_id in self._names:
+                self.remove(product_id)
+            if not key:
+                return
+            i = bisect_right(self._keys, key)
+            self._keys.insert(i, key)
+            self._ids.insert(i, product_id)
+            self._sold.insert(i, min(sold or 0, _SOLD_MAX))
+            self._names[product_id] = (key, name)
+            self._forget_prefixes(key)
+
+    update = add
+
+    def update_sold(self, product_id, sold):
+        with self._lock:
+            entry = self._names.get(product_id)
+            if entry is None:
+                return
+            self._sold[self._position(product_id, entry[0])] = min(sold or 0, _SOLD_MAX)
+            self._forget_prefixes(entry[0])
+
+    def add_from_db(self, bind, product_ids, batch_size=1000):
+        """Index products by id through a session of their own (after-commit hooks)."""
+        with Session(bind=bind) as session:
+            for start in range(0, len(product_ids), batch_size):
+                chunk = list(product_ids[start:start + batch_size])
+                rows = (
+                    session.query(Product.id, Product.name, Product.sold)
+                    .filter(Product.id.in_(chunk))
+                )
+                for row in rows:
+                    self.add(row.id, row.name, row.sold)
+
+    def remove(self, product_id):
+        with self._lock:
+            entry = self._names.pop(product_id, None)
+            if entry is None:
+                return
+            i = self._position(product_id, entry[0])
+            del self._keys[i]
+            del self._ids[i]
+            del self._sold[i]
+            self._forget_prefixes(entry[0])
+
+    # --- Queries ---
+
+    def _rank(self, lo, hi, limit):
+        """Best-selling distinct names in [lo, hi) as (id, name, sold), best first."""
+        sold = self._sold
+        wanted = limit
+        while True:
+            positions = heapq.nlargest(wanted, range(lo, hi), key=lambda i: (sold[i], -i))
+            suggestions = []
+            seen = set()
+            for i in positions:
+                key = self._keys[i]
+                if key in seen:
+                    # Several sellers list the same thing; suggest it once
+                    continue
+                seen.add(key)
+                product_id = self._ids[i]
+                suggestions.append((product_id, self._names[product_id][1], sold[i]))
+                if len(suggestions) == limit:
+                    return suggestions
+            if len(positions) < wanted:
+                return suggestions
+            wanted *= 4
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """Up to `limit` (id, name, sold) whose normalized name starts with `prefix`."""
+        prefix = normalize_prefix(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_SUGGESTIONS)
+        with self._lock:
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_left(self._keys, prefix + '\uffff', lo)
+            if hi - lo <= SCAN_LIMIT:
+                return self._rank(lo, hi, limit)
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._top[prefix] = self._rank(lo, hi, MAX_SUGGESTIONS)
+            return top[:limit]
+
+    def memory_stats(self):
+        with self._lock:
+            return {
+                'products': len(self._names),
+                'cached_prefixes': len(self._top),
+                'column_bytes': self._ids.itemsize * len(self._ids) + self._sold.itemsize * len(self._sold),
+            }
+
+
+def db_suggest(dbsession, prefix, limit=DEFAULT_SUGGESTIONS):
+    """
+    Fallback when the index is off: best sellers whose name starts with
+    `prefix`, matched case-insensitively against the stored name.
+    """
+    prefix = prefix.lstrip().lower()[:MAX_PREFIX_LENGTH]
+    if not prefix.strip():
+        return []
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    sold = func.coalesce(Product.sold, 0)
+    rows = (
+        dbsession.query(Product.id, Product.name, sold.label('sold'))
+        .filter(func.lower(Product.name).like(escaped + '%', escape='\\'))
+        .order_by(sold.desc(), Product.id)
+        .limit(min(limit, MAX_SUGGESTIONS))
+    )
+    return [(row.id, row.name, row.sold) for row in rows]
+
+
+def get_suggest_index(request):
+    """The registry's ProductSuggestIndex, or None when suggest_index.enabled is off."""
+    return getattr(request.registry, 'suggest_index', None)
+
+
+def build_suggest_index(dbsession):
+    """Create and fill the index at startup, in its own short transaction."""
+    index = ProductSuggestIndex()
+    try:
+        with transaction.manager:
+            count = index.build(dbsession)
+        print(f"[SuggestIndex] Indexed {count} product names: {index.memory_stats()}")
+    except SQLAlchemyError as e:
+        print(f"[SuggestIndex] Could not build index at startup: {e}")
+    finally:
+        dbsession.remove()
+    return index
+
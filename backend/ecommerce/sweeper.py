@@ -0,0 +1,177 @@
+# sweeper.py
+import argparse
+import time
+from datetime import timedelta
+
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from .models.cart import Cart, CartItem
+from .models.reservation import StockHold
+from .reservations import release_holds_where, sync_shard_totals, utcnow
+
+SWEEP_BATCH_SIZE = 1000
+DEFAULT_EMPTY_MAX_AGE_HOURS = 24
+DEFAULT_STALE_MAX_AGE_DAYS = 60
+
+
+def _empty_carts(cutoff):
+    return (Cart.updated_at < cutoff, ~exists().where(CartItem.cart_id == Cart.id))
+
+
+def _stale_carts(cutoff):
+    return (Cart.updated_at < cutoff, exists().where(CartItem.cart_id == Cart.id))
+
+
+class SweepReport:
+    """Rows deleted (or, in a dry run, that would be) and how fast."""
+
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.carts = 0
+        self.items = 0
+        self.holds = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return (self.carts + self.items) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        if self.dry_run:
+            return f'would delete {self.carts} carts and {self.items} cart items ({self.elapsed:.2f}s to count)'
+        return (f'deleted {self.carts} carts and {self.items} cart items, released {self.holds} held units '
+                f'in {self.batches} batches, {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s)')
+
+
+def count_sweepable(session, criteria):
+    """(carts, cart items) matching `criteria`, for dry runs."""
+    carts = select(Cart.id).where(*criteria).subquery()
+    return (
+        session.execute(select(func.count()).select_from(carts)).scalar_one(),
+        session.execute(
+            select(func.count()).select_from(CartItem).where(CartItem.cart_id.in_(select(carts.c.id)))
+        ).scalar_one(),
+    )
+
+
+def sweep_batch(session, criteria, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Delete up to `batch_size` carts matching `criteria`, their lines and
+    their owners' stock holds. Returns (carts, items, held units released).
+    The carts are locked FOR UPDATE SKIP LOCKED (PostgreSQL; SQLite ignores
+    it), so a cart a request is adding to right now is left for next time.
+    """
+    carts = (
+        session.query(Cart.id, Cart.user_id)
+        .filter(*criteria)
+        .order_by(Cart.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not carts:
+        return 0, 0, 0
+    cart_ids = [cart.id for cart in carts]
+    items = session.execute(
+        delete(CartItem).where(CartItem.cart_id.in_(cart_ids)).execution_options(synchronize_session=False)
+    ).rowcount
+    session.execute(delete(Cart).where(Cart.id.in_(cart_ids)).execution_options(synchronize_session=False))
+    held = 0
+    if items:
+        # Whatever these users still hold was for the lines just dropped
+        held = sum(release_holds_where(session, StockHold.user_id.in_([cart.user_id for cart in carts])).values())
+        if held:
+            sync_shard_totals(session)
+    return len(cart_ids), items, held
+
+
+def sweep_carts(engine, empty_max_age=timedelta(hours=DEFAULT_EMPTY_MAX_AGE_HOURS),
+                stale_max_age=timedelta(days=DEFAULT_STALE_MAX_AGE_DAYS),
+                batch_size=SWEEP_BATCH_SIZE, dry_run=False, pause=0.0, log=print):
+    """
+    Delete abandoned carts until none are left and return a SweepReport:
+    first empty carts (GET /api/cart creates one for every visitor) not
+    touched for `empty_max_age`, then carts with items not touched for
+    `stale_max_age`. Each batch is its own short transaction locking at
+    most `batch_size` carts, so the shop keeps running while it sweeps.
+    """
+    now = utcnow()
+    passes = [('empty', _empty_carts(now - empty_max_age)), ('stale', _stale_carts(now - stale_max_age))]
+    report = SweepReport(dry_run)
+    for label, criteria in passes:
+        if dry_run:
+            with Session(bind=engine) as session:
+                carts, items = count_sweepable(session, criteria)
+            report.carts += carts
+            report.items += items
+            log(f'[CartSweeper] {label}: would delete {carts} carts and {items} cart items')
+            continue
+        while True:
+            with Session(bind=engine) as session, session.begin():
+                carts, items, held = sweep_batch(session, criteria, batch_size)
+            if not carts:
+                break
+            report.batches += 1
+            report.carts += carts
+            report.items += items
+            report.holds += held
+            log(f'[CartSweeper] {label} batch {report.batches}: {carts} carts, {items} items '
+                f'({report.rows_per_second:.0f} rows/s so far)')
+            if carts < batch_size:
+                break
+            if pause:
+                time.sleep(pause)  # give the database room between batches
+    log(f'[CartSweeper] {report}')
+    return report
+
+
+def main(argv=None):
+    """
+    Console entry point:
+
+        ecommerce_sweep_carts development.ini --dry-run
+        ecommerce_sweep_carts development.ini --stale-days 30 --batch-size 500
+    """
+    from pyramid.paster import get_appsettings
+    from sqlalchemy import engine_from_config
+
+    parser = argparse.ArgumentParser(prog='ecommerce_sweep_carts', description='Delete empty and abandoned carts.')
+    parser.add_argument('config_uri', help='the app .ini file (reads sqlalchemy.url and cart_sweeper.*)')
+    parser.add_argument('--empty-hours', type=float, help='age of an untouched empty cart before it goes')
+    parser.add_argument('--stale-days', type=float, help='age of an untouched cart with items before it goes')
+    parser.add_argument('--batch-size', type=int, help='carts deleted per transaction')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between batches')
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be deleted')
+    args = parser.parse_args(argv)
+
+    settings = get_appsettings(args.config_uri)
+    empty_hours = args.empty_hours
+    if empty_hours is None:
+        empty_hours = float(settings.get('cart_sweeper.empty_max_age_hours', DEFAULT_EMPTY_MAX_AGE_HOURS))
+    stale_days = args.stale_days
+    if stale_days is None:
+        stale_days = float(settings.get('cart_sweeper.stale_max_age_days', DEFAULT_STALE_MAX_AGE_DAYS))
+    batch_size = args.batch_size or int(settings.get('cart_sweeper.batch_size', SWEEP_BATCH_SIZE))
+    if batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+
+    sweep_carts(
+        engine_from_config(settings, 'sqlalchemy.'),
+        empty_max_age=timedelta(hours=empty_hours),
+        stale_max_age=timedelta(days=stale_days),
+        batch_size=batch_size,
+        dry_run=args.dry_run,
+        pause=args.pause,
+    )
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
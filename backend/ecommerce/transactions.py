@@ -0,0 +1,19 @@
+# transactions.py
+def run_after_commit(request, func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) once the request's transaction has committed.
+
+    In-process structures (indexes, caches) must not see writes that pyramid_tm
+    later rolls back, so views queue their updates here instead of applying
+    them straight away. Nothing runs if the transaction aborts.
+    """
+    def hook(success):
+        if not success:
+            return
+        try:
+            func(*args, **kwargs)
+        except Exception as e:
+            # The data is already committed; never turn that into an error response
+            print(f"[AfterCommit] {getattr(func, '__name__', func)} failed: {e}")
+
+    request.tm.get().addAfterCommitHook(hook)
@@ -0,0 +1,25 @@
+# upserts.py
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# insert() constructs with INSERT ... ON CONFLICT DO UPDATE ... RETURNING.
+# Carts and category counts are written with single-statement upserts, so
+# these are the databases the app runs on.
+UPSERTS = {
+    'postgresql': postgresql_insert,
+    'sqlite': sqlite_insert,
+}
+
+
+def check_upsert_support(engine):
+    """Refuse to start on a database without ON CONFLICT upserts, instead of failing on the first add-to-cart."""
+    if engine.dialect.name not in UPSERTS:
+        raise ValueError(
+            f"Unsupported sqlalchemy.url dialect '{engine.dialect.name}': "
+            f"carts need INSERT ... ON CONFLICT, use one of {', '.join(sorted(UPSERTS))}"
+        )
+
+
+def upsert(dbsession):
+    """The insert() construct with on_conflict_do_update for the session's database."""
+    return UPSERTS[dbsession.get_bind().dialect.name]
@@ -7,33 +7,75 @@ from pyramid.httpexceptions import (
     HTTPNotFound,
     HTTPUnauthorized,
     HTTPForbidden,
+    HTTPConflict,
     HTTPNoContent
 )
 from marshmallow import ValidationError
+from pyramid.settings import asbool
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm import joinedload, load_only, selectinload
 
 from ..models.meta import DBSession
 from ..models.user import User
 from ..models.product import Product
 from ..models.cart import Cart, CartItem
-from ..schemas.cart import CartSchema, CartItemAddSchema, CartItemUpdateSchema
+from ..schemas.cart import CartSchema, CartItemAddSchema, CartItemUpdateSchema, CartPatchSchema
 from ..security import get_user_id_from_jwt
+from ..cache import invalidate_products
+from ..carts import (
+    CartOperationError,
+    adjust_cart_totals,
+    apply_cart_quantities,
+    cart_summary,
+    delete_cart_items,
+    ensure_cart_id,
+    explain_rejected_add,
+    plan_cart_operations,
+    upsert_cart_item,
+)
+from ..reservations import get_stock_reservations
+
+# Product columns CartSchema's nested ProductSchema reads; the rest (search
+# columns, timestamps...) stays in the database
+CART_PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.seller, Product.description, Product.price,
+    Product.original_price, Product.image_url, Product.rating, Product.sold,
+    Product.stock, Product.category, Product.version,
+)
+
+
+# --- Helper Functions ---
+def cart_conflict(request, view_name, error):
+    """409 for a write that lost a race: a product's version moved on or a cart line vanished mid-request."""
+    request.tm.doom()
+    print(f"[{view_name}] Concurrent change, nothing written: {error}")
+    return HTTPConflict(json_body={'error': 'Your cart or its products changed during this request. Please try again.'})
+
+def cart_query(dbsession):
+    """
+    Carts with their items and products eagerly loaded: one statement for the
+    cart and one for all of its items joined to their products, however many
+    lines the cart has. Serializing the result issues no further queries.
+    """
+    return dbsession.query(Cart).options(
+        selectinload(Cart.items).joinedload(CartItem.product).load_only(*CART_PRODUCT_COLUMNS)
+    )
+
+
+def load_cart(dbsession, cart_id: int) -> Cart:
+    """Re-read a cart after a mutation, replacing whatever the session still holds."""
+    return cart_query(dbsession).populate_existing().filter(Cart.id == cart_id).one()
+
 
-# --- Helper Function ---
 def get_or_create_active_cart(dbsession, user_id: int) -> Cart:
     print(f"[CartHelper] Attempting to get/create cart for user_id: {user_id}")
-    cart = dbsession.query(Cart).filter(Cart.user_id == user_id).first()
+    cart = cart_query(dbsession).filter(Cart.user_id == user_id).first()
     if not cart:
         print(f"[CartHelper] No existing cart found for user_id: {user_id}. Creating new one.")
-        cart = Cart(user_id=user_id)
-        dbsession.add(cart)
-        try:
-            dbsession.flush()  # Flush to get cart.id
-            print(f"[CartHelper] New cart created with ID: {cart.id} for user_id: {user_id}")
-        except Exception as e:
-            print(f"[CartHelper] ERROR flushing new cart: {e}")
-            dbsession.rollback() # Rollback if flush fails
-            raise # Re-raise the exception to be caught by the view
+        # An upsert, so two first requests racing each other end up sharing one cart
+        cart = load_cart(dbsession, ensure_cart_id(dbsession, user_id))
+        print(f"[CartHelper] New cart created with ID: {cart.id} for user_id: {user_id}")
     else:
         print(f"[CartHelper] Found existing cart with ID: {cart.id} for user_id: {user_id}")
     return cart
@@ -79,6 +121,22 @@ def get_cart_view(request):
         )
 
 
+@view_config(route_name='get_cart_summary', renderer='json', request_method='GET', permission='view')
+def get_cart_summary_view(request):
+    # Polled by the navbar, so it stays quiet and never writes
+    try:
+        user_id = get_user_id_from_jwt(request)
+        if not user_id:
+            raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
+        return cart_summary(DBSession, user_id)
+    except HTTPUnauthorized as e:
+        return e
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[CartSummaryView] SQLAlchemyError: {e}")
+        return HTTPBadRequest(json_body={'error': 'Database error while retrieving cart summary.'})
+
+
 @view_config(route_name='add_item_to_cart', renderer='json', request_method='POST', permission='edit_cart')
 def add_item_to_cart_view(request):
     print("[AddItemView] Received request to add item.")
@@ -97,51 +155,32 @@ def add_item_to_cart_view(request):
         product_id = validated_data['product_id']
         quantity_to_add = validated_data['quantity']
 
-        product = DBSession.query(Product).get(product_id)
-        if not product:
-            print(f"[AddItemView] Product with ID {product_id} not found.")
-            raise HTTPNotFound(json_body={'error': f'Product with ID {product_id} not found.'})
-        print(f"[AddItemView] Product found: {product.name}, Stock: {product.stock}, Price: {product.price}")
-
-        if product.stock is not None and product.stock < quantity_to_add:
-            print(f"[AddItemView] Not enough stock for {product.name}. Available: {product.stock}, Requested: {quantity_to_add}")
-            raise HTTPBadRequest(json_body={'error': f'Not enough stock for {product.name}. Available: {product.stock}'})
+        # One upsert for the cart, one for the line (stock checked in SQL)
+        cart_id = ensure_cart_id(DBSession, user_id)
+        stock_reservations = get_stock_reservations(request)
+        if stock_reservations is not None:
+            # Flash-sale mode: the units are taken out of stock now and held
+            if stock_reservations.reserve(DBSession, user_id, product_id, quantity_to_add) is None:
+                product = DBSession.query(Product.name, Product.stock).filter(Product.id == product_id).first()
+                if not product:
+                    raise HTTPNotFound(json_body={'error': f'Product with ID {product_id} not found.'})
+                print(f"[AddItemView] Could not reserve {quantity_to_add} of product {product_id}")
+                raise HTTPBadRequest(json_body={'error': f'Not enough stock for {product.name}. Available: {product.stock}'})
+            invalidate_products(request, product_id)
+        added = upsert_cart_item(DBSession, cart_id, product_id, quantity_to_add, check_stock=stock_reservations is None)
+        if added is None:
+            if stock_reservations is not None:
+                stock_reservations.release(DBSession, user_id, product_id, quantity_to_add)
+            # Stock moved between the upsert and this check; the client can retry
+            reason, error = explain_rejected_add(DBSession, cart_id, product_id, quantity_to_add) or (
+                'stock', 'Could not add item to cart, please try again.')
+            print(f"[AddItemView] Add rejected for product {product_id} x{quantity_to_add}: {error}")
+            if reason == 'not_found':
+                raise HTTPNotFound(json_body={'error': error})
+            raise HTTPBadRequest(json_body={'error': error})
+        print(f"[AddItemView] Cart {cart_id}: item {added[0]} now has quantity {added[1]}")
 
-        cart = get_or_create_active_cart(DBSession, user_id)
-        print(f"[AddItemView] Cart ID for operation: {cart.id}")
-        
-        existing_item = DBSession.query(CartItem).filter_by(cart_id=cart.id, product_id=product_id).first()
-
-        if existing_item:
-            new_quantity = existing_item.quantity + quantity_to_add
-            print(f"[AddItemView] Existing item found. Old Qty: {existing_item.quantity}, Adding: {quantity_to_add}, New Qty: {new_quantity}")
-            if product.stock is not None and product.stock < new_quantity:
-                print(f"[AddItemView] Stock check fail for update. Stock: {product.stock}, Required: {new_quantity}")
-                raise HTTPBadRequest(json_body={'error': f'Cannot add {quantity_to_add} more of {product.name}. Total would exceed stock. In cart: {existing_item.quantity}, Available: {product.stock}'})
-            existing_item.quantity = new_quantity
-        else:
-            print(f"[AddItemView] New item. Product ID: {product_id}, Qty: {quantity_to_add}")
-            if product.stock is not None and product.stock < quantity_to_add: 
-                 print(f"[AddItemView] Stock check fail for new item. Stock: {product.stock}, Required: {quantity_to_add}")
-                 raise HTTPBadRequest(json_body={'error': f'Not enough stock for {product.name} to add to cart. Available: {product.stock}'})
-            
-            if product.price is None: 
-                print(f"[AddItemView] ERROR: Product {product.name} (ID: {product.id}) has no price defined.")
-                raise HTTPBadRequest(json_body={'error': f'Cannot add product {product.name} to cart as it has no price.'})
-
-            new_item = CartItem(
-                cart_id=cart.id,
-                product_id=product_id,
-                quantity=quantity_to_add,
-                price_at_add=product.price 
-            )
-            DBSession.add(new_item)
-            print(f"[AddItemView] New CartItem object created: {new_item}")
-        
-        DBSession.flush() 
-        print(f"[AddItemView] DBSession flushed. Cart ID: {cart.id}, User ID: {user_id}")
-        
-        refreshed_cart = DBSession.query(Cart).filter(Cart.id == cart.id).one() # .one() will raise if not found
+        refreshed_cart = load_cart(DBSession, cart_id)
         return CartSchema().dump(refreshed_cart)
 
     except ValidationError as err:
@@ -152,6 +191,8 @@ def add_item_to_cart_view(request):
         error_content = e.json if hasattr(e, 'json') else e.detail
         print(f"[AddItemView] HTTP Exception Caught: {type(e).__name__} - Detail: {e.detail} - JSON Content: {error_content}")
         return e 
+    except StaleDataError as e:
+        return cart_conflict(request, 'AddItemView', e)
     except SQLAlchemyError as e:
         DBSession.rollback()
         print(f"[AddItemView] SQLAlchemyError: {e}")
@@ -185,7 +226,8 @@ def update_cart_item_quantity_view(request):
         new_quantity = validated_data['quantity']
         print(f"[UpdateItemView] Validated new quantity: {new_quantity}")
 
-        cart_item = DBSession.query(CartItem).get(cart_item_id)
+        # Locked, so a concurrent update cannot apply its totals delta against the same old quantity
+        cart_item = DBSession.get(CartItem, cart_item_id, with_for_update=True)
         if not cart_item:
             print(f"[UpdateItemView] CartItem with ID {cart_item_id} not found.")
             raise HTTPNotFound(json_body={'error': 'Cart item not found.'})
@@ -203,10 +245,24 @@ def update_cart_item_quantity_view(request):
             raise HTTPNotFound(json_body={'error': 'Associated product not found, cannot update item.'})
         print(f"[UpdateItemView] Product found: {product.name}, Stock: {product.stock}")
 
-        if product.stock is not None and product.stock < new_quantity:
+        stock_reservations = get_stock_reservations(request)
+        if stock_reservations is not None:
+            # Hold the extra units, or hand back the ones no longer wanted
+            delta = new_quantity - cart_item.quantity
+            if delta > 0:
+                if stock_reservations.reserve(DBSession, user_id, product.id, delta) is None:
+                    print(f"[UpdateItemView] Could not reserve {delta} more of product {product.id}")
+                    raise HTTPBadRequest(json_body={'error': f'Not enough stock for {product.name}. Available: {product.stock}'})
+            elif delta < 0:
+                stock_reservations.release(DBSession, user_id, product.id, -delta)
+            if delta:
+                invalidate_products(request, product.id)
+        elif product.stock is not None and product.stock < new_quantity:
             print(f"[UpdateItemView] Stock check fail. Stock: {product.stock}, Required: {new_quantity}")
             raise HTTPBadRequest(json_body={'error': f'Not enough stock for {product.name}. Available: {product.stock}'})
 
+        change = new_quantity - cart_item.quantity
+        adjust_cart_totals(DBSession, {cart.id: (change, change * cart_item.price_at_add)})
         if new_quantity == 0: # If client can send 0 to mean delete
             DBSession.delete(cart_item)
             print(f"[UpdateItemView] CartItem {cart_item_id} quantity was 0, item deleted. Flushed.")
@@ -216,7 +272,7 @@ def update_cart_item_quantity_view(request):
         
         DBSession.flush()
 
-        refreshed_cart = DBSession.query(Cart).filter(Cart.id == cart.id).one() # .one() will raise if not found
+        refreshed_cart = load_cart(DBSession, cart.id) # .one() will raise if not found
         return CartSchema().dump(refreshed_cart)
 
     except ValueError: 
@@ -230,6 +286,8 @@ def update_cart_item_quantity_view(request):
         error_content = e.json if hasattr(e, 'json') else e.detail
         print(f"[UpdateItemView] HTTP Exception Caught: {type(e).__name__} - Detail: {e.detail} - JSON Content: {error_content}")
         return e
+    except StaleDataError as e:
+        return cart_conflict(request, 'UpdateItemView', e)
     except SQLAlchemyError as e:
         DBSession.rollback()
         print(f"[UpdateItemView] SQLAlchemyError: {e}")
@@ -237,4 +295,182 @@ def update_cart_item_quantity_view(request):
     except Exception as e:
         DBSession.rollback()
         print(f"[UpdateItemView] UNHANDLED EXCEPTION: {type(e).__name__} - {e}")
-        return HTTPBadRequest(json_body={'error': 'Could not update cart item due to a server error.'})
\ No newline at end of file
+        return HTTPBadRequest(json_body={'error': 'Could not update cart item due to a server error.'})
+
+
+@view_config(route_name='patch_cart', renderer='json', request_method='PATCH', permission='edit_cart')
+def patch_cart_view(request):
+    """
+    Apply a list of add/set/remove operations (schemas.cart.CartPatchSchema)
+    in one transaction and return the resulting cart. Reads are one query
+    for the cart's lines and one for the products involved; writes are at
+    most one DELETE, one UPDATE and one INSERT, except that without stock
+    reservations each growing line is its own stock-guarded upsert. Any
+    failing operation leaves the cart untouched.
+    """
+    print("[PatchCartView] Received request.")
+    try:
+        user_id = get_user_id_from_jwt(request)
+        if not user_id:
+            print("[PatchCartView] Auth failed.")
+            raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
+
+        operations = CartPatchSchema().load(request.json_body)['operations']
+        print(f"[PatchCartView] User {user_id} sent {len(operations)} operations")
+
+        # Only operations naming a product can create lines, and so a cart
+        creates = any(op['op'] != 'remove' and 'product_id' in op and op.get('quantity') for op in operations)
+        if creates:
+            cart_id = ensure_cart_id(DBSession, user_id)
+        else:
+            cart_id = DBSession.query(Cart.id).filter(Cart.user_id == user_id).scalar()
+
+        lines = {}
+        if cart_id is not None:
+            lines = {
+                row.product_id: (row.id, row.quantity, row.price_at_add)
+                for row in DBSession.query(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.price_at_add)
+                .filter(CartItem.cart_id == cart_id)
+                .with_for_update()  # the totals deltas below are computed from these quantities
+            }
+        by_item = {line[0]: product_id for product_id, line in lines.items()}
+        product_ids = {op['product_id'] for op in operations if 'product_id' in op}
+        product_ids.update(by_item[op['item_id']] for op in operations if op.get('item_id') in by_item)
+        products = {
+            row.id: row
+            for row in DBSession.query(Product.id, Product.name, Product.price, Product.stock)
+            .filter(Product.id.in_(product_ids))
+        }
+
+        quantities, last_index = plan_cart_operations(operations, lines, products)
+
+        if cart_id is None:
+            # Nothing but removals and no cart to remove from
+            return CartSchema().dump(get_or_create_active_cart(DBSession, user_id))
+
+        # Without reservations growing lines are written with the stock check
+        # in the statement itself; holds are taken after the write otherwise
+        stock_reservations = get_stock_reservations(request)
+        changes, short = apply_cart_quantities(
+            DBSession, cart_id, lines, quantities, products, check_stock=stock_reservations is None)
+        if short is not None:
+            # All or nothing: pyramid_tm rolls back every write made above
+            request.tm.doom()
+            product = DBSession.query(Product.name, Product.stock).filter(Product.id == short).one()
+            raise CartOperationError(
+                last_index[short], f'Not enough stock for {product.name}. Available: {product.stock}')
+        print(f"[PatchCartView] Cart {cart_id}: {len(changes)} lines changed")
+
+        if stock_reservations is not None and changes:
+            for product_id, change in sorted(changes.items()):
+                if change < 0:
+                    stock_reservations.release(DBSession, user_id, product_id, -change)
+                elif stock_reservations.reserve(DBSession, user_id, product_id, change) is None:
+                    # All or nothing: pyramid_tm rolls back every write made above
+                    request.tm.doom()
+                    product = products[product_id]
+                    raise CartOperationError(
+                        last_index[product_id], f'Not enough stock for {product.name}. Available: {product.stock}')
+            invalidate_products(request, *changes)
+
+        return CartSchema().dump(load_cart(DBSession, cart_id))
+
+    except ValidationError as err:
+        print(f"[PatchCartView] Validation Error: {err.messages}")
+        return HTTPBadRequest(json_body={'errors': err.messages})
+    except CartOperationError as e:
+        print(f"[PatchCartView] Operation {e.index} rejected: {e.message}")
+        error = {'error': e.message, 'operation': e.index}
+        return HTTPNotFound(json_body=error) if e.not_found else HTTPBadRequest(json_body=error)
+    except HTTPUnauthorized as e:
+        return e
+    except StaleDataError as e:
+        return cart_conflict(request, 'PatchCartView', e)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[PatchCartView] SQLAlchemyError: {e}")
+        return HTTPBadRequest(json_body={'error': 'Database error updating cart.'})
+    except Exception as e:
+        DBSession.rollback()
+        print(f"[PatchCartView] UNHANDLED EXCEPTION: {type(e).__name__} - {e}")
+        return HTTPBadRequest(json_body={'error': 'Could not update cart due to a server error.'})
+
+
+def _release_deleted_lines(request, user_id, deleted):
+    """Hand back the stock held for cart lines that were just deleted."""
+    stock_reservations = get_stock_reservations(request)
+    if stock_reservations is None or not deleted:
+        return
+    for line in deleted:
+        stock_reservations.release(DBSession, user_id, line.product_id, line.quantity)
+    invalidate_products(request, *[line.product_id for line in deleted])
+
+
+def _cart_after_delete(request, user_id):
+    # ?summary=1 answers with the navbar numbers instead of the whole cart
+    if asbool(request.params.get('summary', False)):
+        return cart_summary(DBSession, user_id)
+    return CartSchema().dump(get_or_create_active_cart(DBSession, user_id))
+
+
+@view_config(route_name='remove_cart_item', renderer='json', request_method='DELETE', permission='edit_cart')
+def remove_cart_item_view(request):
+    print("[RemoveItemView] Received request.")
+    try:
+        user_id = get_user_id_from_jwt(request)
+        if not user_id:
+            print("[RemoveItemView] Auth failed.")
+            raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
+        cart_item_id = int(request.matchdict['item_id'])
+
+        deleted = delete_cart_items(DBSession, user_id, cart_item_id)
+        if not deleted:
+            # Failure path only: say whether the line is missing or someone else's
+            if DBSession.query(CartItem.id).filter(CartItem.id == cart_item_id).first():
+                print(f"[RemoveItemView] Forbidden: CartItem {cart_item_id} does not belong to user {user_id}.")
+                raise HTTPForbidden(json_body={'error': 'This cart item does not belong to you.'})
+            print(f"[RemoveItemView] CartItem with ID {cart_item_id} not found.")
+            raise HTTPNotFound(json_body={'error': 'Cart item not found.'})
+        print(f"[RemoveItemView] CartItem {cart_item_id} removed for user {user_id}.")
+
+        _release_deleted_lines(request, user_id, deleted)
+        return _cart_after_delete(request, user_id)
+
+    except ValueError:
+        print("[RemoveItemView] ValueError: Invalid cart_item_id format.")
+        return HTTPBadRequest(json_body={'error': 'Invalid cart item ID format.'})
+    except (HTTPUnauthorized, HTTPNotFound, HTTPForbidden) as e:
+        error_content = e.json if hasattr(e, 'json') else e.detail
+        print(f"[RemoveItemView] HTTP Exception Caught: {type(e).__name__} - Detail: {e.detail} - JSON Content: {error_content}")
+        return e
+    except StaleDataError as e:
+        return cart_conflict(request, 'RemoveItemView', e)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[RemoveItemView] SQLAlchemyError: {e}")
+        return HTTPBadRequest(json_body={'error': 'Database error removing cart item.'})
+
+
+@view_config(route_name='clear_cart', renderer='json', request_method='DELETE', permission='edit_cart')
+def clear_cart_view(request):
+    print("[ClearCartView] Received request.")
+    try:
+        user_id = get_user_id_from_jwt(request)
+        if not user_id:
+            print("[ClearCartView] Auth failed.")
+            raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
+
+        deleted = delete_cart_items(DBSession, user_id)
+        print(f"[ClearCartView] Removed {len(deleted)} lines for user {user_id}.")
+
+        _release_deleted_lines(request, user_id, deleted)
+        return _cart_after_delete(request, user_id)
+
+    except HTTPUnauthorized as e:
+        return e
+    except StaleDataError as e:
+        return cart_conflict(request, 'ClearCartView', e)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[ClearCartView] SQLAlchemyError: {e}")
+        return HTTPBadRequest(json_body={'error': 'Database error clearing cart.'})
@@ -0,0 +1,18 @@
+# views/category.py
+from pyramid.view import view_config
+
+from ..models.meta import DBSession
+from ..models.category import Category
+
+
+@view_config(route_name='get_categories', renderer='json', request_method='GET')
+def get_categories(request):
+    # Counts are kept up to date by the product views, this is a scan of a tiny table
+    categories = (
+        DBSession.query(Category.name, Category.product_count)
+        .filter(Category.product_count > 0)
+        .order_by(Category.name)
+        .all()
+    )
+    request.response.cache_control = 'public, max-age=60'
+    return [{'name': c.name, 'count': c.product_count} for c in categories]
@@ -0,0 +1,36 @@
+# views/metrics.py
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.view import view_config
+
+from ..cache import get_product_cache
+from ..identity import get_identity_cache
+from ..passwords import get_password_hasher
+from ..search_index import get_search_index
+from ..reservations import get_stock_reservations
+from ..security import get_jwt_cache
+from ..singleflight import get_single_flight
+from ..suggest import get_suggest_index
+
+
+@view_config(route_name='metrics', renderer='json', request_method='GET')
+def metrics_view(request):
+    if not request.registry.metrics_enabled:
+        # Internal counters; only served where the deployment opted in
+        return HTTPNotFound(json_body={'error': 'Not found.'})
+    product_cache = get_product_cache(request)
+    search_index = get_search_index(request)
+    single_flight = get_single_flight(request)
+    suggest_index = get_suggest_index(request)
+    stock_reservations = get_stock_reservations(request)
+    jwt_cache = get_jwt_cache(request)
+    identity_cache = get_identity_cache(request)
+    return {
+        'product_cache': product_cache.stats() if product_cache is not None else None,
+        'search_index': search_index.memory_stats() if search_index is not None else None,
+        'suggest_index': suggest_index.memory_stats() if suggest_index is not None else None,
+        'stock_reservations': stock_reservations.stats() if stock_reservations is not None else None,
+        'single_flight': single_flight.stats() if single_flight is not None else None,
+        'jwt_cache': jwt_cache.stats() if jwt_cache is not None else None,
+        'identity_cache': identity_cache.stats() if identity_cache is not None else None,
+        'password_hasher': get_password_hasher(request).stats(),
+    }
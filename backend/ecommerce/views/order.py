@@ -0,0 +1,68 @@
+# views/order.py
+from pyramid.view import view_config
+from pyramid.httpexceptions import HTTPBadRequest, HTTPConflict, HTTPUnauthorized
+from marshmallow import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
+
+from ..models.meta import DBSession
+from ..schemas.order import CheckoutSchema, OrderSchema
+from ..security import get_user_id_from_jwt
+from ..cache import invalidate_products
+from ..orders import CheckoutError, place_order
+from ..reservations import get_stock_reservations
+from ..suggest import get_suggest_index
+from ..transactions import run_after_commit
+
+
+@view_config(route_name='checkout', renderer='json', request_method='POST', permission='edit_cart')
+def checkout_view(request):
+    """
+    Turn the caller's cart into an order in one transaction: the cart is
+    emptied, stock is taken for every line with a single UPDATE and the
+    order is written. Any failure (empty cart, missing stock) rolls all of
+    it back, leaving the cart as it was.
+    """
+    print("[CheckoutView] Received request.")
+    try:
+        user_id = get_user_id_from_jwt(request)
+        if not user_id:
+            print("[CheckoutView] Auth failed.")
+            raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
+
+        options = CheckoutSchema().load(request.json_body if request.body else {})
+        order, sold = place_order(
+            DBSession, user_id, options['shipping_method'], options['payment_method'],
+            stock_reservations=get_stock_reservations(request),
+        )
+        print(f"[CheckoutView] Order {order.id} placed for user {user_id}: {order.item_count} items, total {order.total}")
+
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            for product_id, product_sold in sold.items():
+                run_after_commit(request, suggest_index.update_sold, product_id, product_sold)
+        invalidate_products(request, *sold)
+
+        request.response.status = 201
+        return OrderSchema().dump(order)
+
+    except ValidationError as err:
+        print(f"[CheckoutView] Validation Error: {err.messages}")
+        return HTTPBadRequest(json_body={'errors': err.messages})
+    except CheckoutError as e:
+        # The cart lines were already deleted in this transaction; put them back
+        request.tm.doom()
+        print(f"[CheckoutView] Checkout rejected for user {user_id}: {e.message}")
+        if not e.shortages:
+            return HTTPBadRequest(json_body={'error': e.message})
+        return HTTPConflict(json_body={'error': e.message, 'shortages': e.shortages})
+    except HTTPUnauthorized as e:
+        return e
+    except StaleDataError as e:
+        request.tm.doom()
+        print(f"[CheckoutView] Concurrent change, nothing written: {e}")
+        return HTTPConflict(json_body={'error': 'Your cart or its products changed during checkout. Please try again.'})
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[CheckoutView] SQLAlchemyError: {e}")
+        return HTTPBadRequest(json_body={'error': 'Database error during checkout.'})
@@ -1,6 +1,8 @@
 # backend/ecommerce/views/product.py
+import csv
 import json
-from ..models.user import User
+import logging
+from functools import partial
 from pyramid.view import view_config
 from pyramid.response import Response
 from ..models.meta import DBSession
@@ -11,9 +13,32 @@ from pyramid.httpexceptions import HTTPUnauthorized, HTTPForbidden, HTTPNotFound
 from ..security import get_user_id_from_jwt
 from sqlalchemy import cast, String
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from sqlalchemy import or_
-from sqlalchemy import func
-from ..models.cart import CartItem
+from sqlalchemy import func, literal_column, select, true
+from pyramid.settings import asbool
+from ..carts import delete_product_lines
+from ..pagination import MAX_PAGE_SIZE, keyset_page, parse_limit
+from ..search import search_products
+from ..exporter import export_statement, iter_export, parse_watermark
+from ..categories import adjust_category_counts, category_delta
+from ..reservations import delete_product_stock_rows
+from ..importer import ProductImporter, import_format, iter_csv_records, iter_ndjson_records, iter_text_lines
+from ..search_index import get_search_index, index_search_products
+from ..suggest import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, db_suggest, get_suggest_index
+from ..transactions import run_after_commit
+from ..cache import get_product_cache, invalidate_products
+from ..singleflight import SingleFlightTimeout, coalesce
+from ..conditional import (
+    conditional_json_response,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+    validators,
+)
+
+log = logging.getLogger(__name__)
+
 
 @view_config(route_name='create_product', renderer='json', request_method='POST')
 def create_product(request):
@@ -25,18 +50,27 @@ def create_product(request):
         data = request.json_body
         product_data = ProductSchema().load(data)  # Deserialize and validate data
         
-        user_id = get_user_id_from_jwt(request)
-        user = DBSession.query(User).get(user_id)
+        user = request.user
         if not user:
             return HTTPUnauthorized(json_body={'error': 'User not authenticated'})
         
         product_data['seller'] = user.username
+        product_data['seller_id'] = user.id
         # Create a new product object and save to DB
         product = Product(**product_data)
         DBSession.add(product)
         DBSession.flush()  # Save product and get its ID
+        adjust_category_counts(DBSession, category_delta(None, product.category))
         print(f"Product {product.name} added successfully with ID {product.id}")
 
+        search_index = get_search_index(request)
+        if search_index is not None:
+            run_after_commit(request, search_index.add, product.id, product.name, product.description)
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            run_after_commit(request, suggest_index.add, product.id, product.name, product.sold)
+        invalidate_products(request, product.id)
+
         # Return the serialized product data
         return ProductSchema().dump(product)
     except ValidationError as err:
@@ -60,28 +94,255 @@ def create_product(request):
 
 
 
-@view_config(route_name='get_products', renderer='json', request_method='GET')
-def products_api_view(request):
-    products = DBSession.query(Product).all()
-
-    # Serialize product objects into dictionaries
-    result = []
-    for p in products:
-        result.append({
-            'id': p.id,
-            'name': p.name,
-            'price': p.price,
-            'originalPrice': p.original_price,
-            'image': p.image_url or '/api/placeholder/300/200',
-            'rating': p.rating,
-            'sold': p.sold,
-            'seller' : p.seller,
-            'stock' : p.stock
-        })
+# Public field name -> column, for list endpoints that take ?fields=
+PRODUCT_LIST_COLUMNS = {
+    'id': Product.id,
+    'name': Product.name,
+    'price': Product.price,
+    'originalPrice': Product.original_price,
+    'image': Product.image_url,
+    'rating': Product.rating,
+    'sold': Product.sold,
+    'seller': Product.seller,
+    'stock': Product.stock,
+    'description': Product.description,
+    'category': Product.category,
+}
+# description is a Text blob, list views only get it when asking for it
+DEFAULT_LIST_FIELDS = ['id', 'name', 'price', 'originalPrice', 'image', 'rating', 'sold', 'seller', 'stock', 'category']
+
+# Keyset orderings; the trailing id keeps each one total so cursors are stable
+# Each one is backed by an index in models/product.py. The coalesce default is
+# literal SQL: bound as a parameter, coalesce(sold, ?) no longer matches the
+# indexed expression and the database sorts the whole table instead
+PRODUCT_SORTS = {
+    'id': [(Product.id, False)],
+    'sold': [(func.coalesce(Product.sold, literal_column('0')), True), (Product.id, True)],
+    'price': [(Product.price, False), (Product.id, False)],
+    'price_desc': [(Product.price, True), (Product.id, True)],
+    'rating': [(func.coalesce(Product.rating, literal_column('0')), True), (Product.id, True)],
+}
+
+IN_STOCK = Product.stock > 0
+ON_SALE = Product.original_price > Product.price
+
+
+def _float_param(params, name):
+    raw = params.get(name)
+    if raw in (None, ''):
+        return None
+    try:
+        return float(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def parse_product_filters(params):
+    """WHERE clauses for ?category, min_price, max_price, min_rating, in_stock and on_sale."""
+    filters = []
+    category = params.get('category', '').strip().lower()
+    if category:
+        filters.append(Product.category == category)
+    min_price = _float_param(params, 'min_price')
+    if min_price is not None:
+        filters.append(Product.price >= min_price)
+    max_price = _float_param(params, 'max_price')
+    if max_price is not None:
+        filters.append(Product.price <= max_price)
+    min_rating = _float_param(params, 'min_rating')
+    if min_rating is not None:
+        filters.append(Product.rating >= min_rating)
+    if asbool(params.get('in_stock', False)):
+        filters.append(IN_STOCK)
+    if asbool(params.get('on_sale', False)):
+        filters.append(ON_SALE)
+    return filters
+
+
+def product_facets_subquery(filters):
+    """One-row aggregate over every product matching `filters` (ignoring pagination)."""
+    return (
+        select(
+            func.count().label('facet_total'),
+            func.count().filter(IN_STOCK).label('facet_in_stock'),
+            func.count().filter(ON_SALE).label('facet_on_sale'),
+            func.count().filter(Product.rating >= 4).label('facet_rating_4_up'),
+            func.min(Product.price).label('facet_min_price'),
+            func.max(Product.price).label('facet_max_price'),
+        )
+        .where(*filters)
+        .subquery('facets')
+    )
+
 
+def _facets_from_row(row):
+    return {
+        'total': row.facet_total,
+        'in_stock': row.facet_in_stock,
+        'on_sale': row.facet_on_sale,
+        'rating_4_up': row.facet_rating_4_up,
+        'price': {'min': row.facet_min_price, 'max': row.facet_max_price},
+    }
+
+
+def parse_fields(raw):
+    if not raw:
+        return list(DEFAULT_LIST_FIELDS)
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in PRODUCT_LIST_COLUMNS:
+            raise ValueError(f"Unknown field '{name}'")
+        if name not in fields:
+            fields.append(name)
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def serialize_product_row(row, fields):
+    result = {}
+    for name in fields:
+        value = getattr(row, PRODUCT_LIST_COLUMNS[name].key)
+        if name == 'image':
+            value = value or '/api/placeholder/300/200'
+        result[name] = value
     return result
 
 
+def _product_list_payload(params, fields, sort, limit, filters):
+    # Only the requested columns are selected, no ORM objects are built.
+    # version is only selected for the ETag, it isn't part of the payload.
+    query = DBSession.query(
+        *[PRODUCT_LIST_COLUMNS[name] for name in fields],
+        Product.version.label('_version'),
+    ).filter(*filters)
+
+    # Without limit/cursor keep the old plain-list response the frontend expects
+    if 'limit' not in params and 'cursor' not in params:
+        rows = query.all()
+        payload = [serialize_product_row(row, fields) for row in rows]
+        etag = make_etag('products', sorted(params.items()), [(row.id, row._version) for row in rows])
+        return payload, validators(etag)
+
+    facets_subquery = None
+    if asbool(params.get('facets', False)):
+        # Cross join the one-row aggregate so the counts come back with the page
+        facets_subquery = product_facets_subquery(filters)
+        query = query.join(facets_subquery, true()).add_columns(*facets_subquery.c)
+
+    rows, next_cursor = keyset_page(query, PRODUCT_SORTS[sort], limit, params.get('cursor'))
+    payload = {
+        'items': [serialize_product_row(row, fields) for row in rows],
+        'next_cursor': next_cursor,
+    }
+    if facets_subquery is not None:
+        facets_row = rows[0] if rows else DBSession.query(*facets_subquery.c).one()
+        payload['facets'] = _facets_from_row(facets_row)
+
+    etag = make_etag(
+        'products', sorted(params.items()),
+        [(row.id, row._version) for row in rows], next_cursor, payload.get('facets'),
+    )
+    return payload, validators(etag)
+
+
+@view_config(route_name='import_products', renderer='json', request_method='POST')
+def import_products(request):
+    """Bulk create products from a CSV or NDJSON body, one product per row."""
+    user = request.user
+    if not user:
+        return HTTPUnauthorized(json_body={'error': 'User not authenticated'})
+
+    body_format = import_format(request)
+    if body_format is None:
+        request.response.status = 415
+        return {'error': 'Send text/csv or application/x-ndjson (or pass ?format=csv|ndjson).'}
+
+    # Read the body as a stream; rows are validated and inserted batch by batch
+    lines = iter_text_lines(request.body_file)
+    records = iter_csv_records(lines) if body_format == 'csv' else iter_ndjson_records(lines)
+    importer = ProductImporter(DBSession, user.username, user.id)
+    try:
+        report = importer.run(records)
+    except UnicodeDecodeError:
+        request.response.status = 400
+        return {'error': 'The file must be UTF-8 encoded.'}
+    except csv.Error as e:
+        request.response.status = 400
+        return {'error': f'Malformed CSV: {e}'}
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        log.error("Import by user %s failed: %s", user.id, e)
+        request.response.status = 500
+        return {'error': 'A database error occurred while importing products.'}
+
+    log.info("User %s imported %d products, %d rows rejected", user.id, report['inserted'], report['failed'])
+
+    if importer.product_ids:
+        invalidate_products(request)
+        search_index = get_search_index(request)
+        if search_index is not None:
+            run_after_commit(request, search_index.add_from_db, DBSession.get_bind(), importer.product_ids)
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            run_after_commit(request, suggest_index.add_from_db, DBSession.get_bind(), importer.product_ids)
+    return report
+
+
+@view_config(route_name='export_products', renderer='json', request_method='GET')
+def export_products(request):
+    """Stream the whole catalog (or what changed since a watermark) as NDJSON or CSV."""
+    export_format = request.params.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        request.response.status = 400
+        return {'error': "format must be 'ndjson' or 'csv'"}
+    try:
+        since, after_id = parse_watermark(request.params)
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+
+    statement = export_statement(since, after_id)
+    response = Response(
+        app_iter=iter_export(DBSession.get_bind(), statement, export_format),
+        content_type='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        charset='utf-8',
+    )
+    response.content_disposition = f'attachment; filename="products.{export_format}"'
+    return response
+
+
+@view_config(route_name='get_products', renderer='json', request_method='GET')
+def products_api_view(request):
+    params = request.params
+    try:
+        fields = parse_fields(params.get('fields'))
+        sort = params.get('sort', 'id')
+        if sort not in PRODUCT_SORTS:
+            raise ValueError(f"Unknown sort '{sort}'")
+        limit = parse_limit(params.get('limit'))
+        filters = parse_product_filters(params)
+
+        load = partial(_product_list_payload, params, fields, sort, limit, filters)
+        product_cache = get_product_cache(request)
+        # Concurrent misses for the same page share one query
+        if product_cache is None:
+            payload, page_validators = coalesce(request, ('list', tuple(sorted(params.items()))), load)
+            return conditional_json_response(request, page_validators, payload=payload)
+        key = product_cache.list_key(params)
+        page_validators, body = coalesce(request, key, product_cache.get_or_load, key, load)
+        return conditional_json_response(request, page_validators, body=body)
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+    except SingleFlightTimeout:
+        request.response.status = 503
+        return {'error': 'The server is busy, please try again.'}
+
+
 
 def get_product_by_id(request, product_id):
     product = request.dbsession.query(Product).filter(Product.id == int(product_id)).first()
@@ -91,17 +352,27 @@ def get_product_by_id(request, product_id):
 
 
 
-@view_config(route_name='get_product_detail', renderer='json', request_method='GET')
-def product_detail_api_view(request):
-    product_id = request.matchdict.get('product_id')
+def _product_detail_validators(product_id):
+    row = (
+        DBSession.query(Product.version, Product.updated_at)
+        .filter(Product.id == int(product_id))
+        .first()
+    )
+    if not row:
+        return None
+    return validators(f'product-{int(product_id)}-v{row.version}', row.updated_at)
+
 
+def _product_detail_payload(product_id):
     product = DBSession.query(Product).filter(Product.id == int(product_id)).first()
 
     if not product:
-        request.response.status = 404
-        return {"error": "Product not found"}
+        return None
+    return _serialize_product_detail(product)
 
-    return {
+
+def _serialize_product_detail(product):
+    payload = {
         'id': product.id,
         'name': product.name,
         'price': product.price,
@@ -113,6 +384,159 @@ def product_detail_api_view(request):
         'description': product.description,
         'stock': product.stock
     }
+    return payload, validators(f'product-{product.id}-v{product.version}', product.updated_at)
+
+
+# products.id is a 32-bit INTEGER column
+MAX_PRODUCT_ID = 2 ** 31 - 1
+
+
+def parse_product_id(raw):
+    """The id from a /api/products/{product_id} URL. Raises ValueError unless it is one."""
+    if not raw or not raw.isascii() or not raw.isdigit() or int(raw) > MAX_PRODUCT_ID:
+        raise ValueError('Invalid product ID format.')
+    return int(raw)
+
+
+@view_config(route_name='get_product_detail', renderer='json', request_method='GET')
+def product_detail_api_view(request):
+    # Checked before anything else: the cache key and the queries need an integer
+    try:
+        product_id = parse_product_id(request.matchdict.get('product_id'))
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+
+    product_cache = get_product_cache(request)
+    try:
+        if product_cache is None:
+            # Revalidation only needs the version, not the whole row
+            if request.if_none_match or request.if_modified_since:
+                current = _product_detail_validators(product_id)
+                if current is not None and is_not_modified(request, current):
+                    return not_modified_response(request, current)
+            # Concurrent misses for a hot product (flash sales) share one query
+            loaded = coalesce(request, ('detail', product_id), _product_detail_payload, product_id)
+        else:
+            key = product_cache.detail_key(product_id)
+            loaded = coalesce(
+                request, key,
+                product_cache.get_or_load, key, partial(_product_detail_payload, product_id),
+            )
+    except SingleFlightTimeout:
+        request.response.status = 503
+        return {'error': 'The server is busy, please try again.'}
+
+    if loaded is None:
+        request.response.status = 404
+        return {"error": "Product not found"}
+
+    if product_cache is None:
+        payload, product_validators = loaded
+        return conditional_json_response(request, product_validators, payload=payload)
+    product_validators, body = loaded
+    return conditional_json_response(request, product_validators, body=body)
+
+
+MAX_BATCH_IDS = 100
+
+
+def parse_product_ids(raw):
+    """Product ids from a list or an "1,2,3" string, duplicates dropped, order kept."""
+    if isinstance(raw, str):
+        raw = [part for part in raw.split(',') if part.strip()]
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('ids must be a non-empty list of product ids')
+    product_ids = []
+    seen = set()
+    for value in raw:
+        try:
+            product_id = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid product id {value!r}')
+        if product_id not in seen:
+            seen.add(product_id)
+            product_ids.append(product_id)
+    if len(product_ids) > MAX_BATCH_IDS:
+        raise ValueError(f'At most {MAX_BATCH_IDS} ids per request')
+    return product_ids
+
+
+def _product_detail_payloads(product_ids):
+    """{product id: (payload, validators)} for the ids that exist, in one IN query."""
+    products = DBSession.query(Product).filter(Product.id.in_(product_ids))
+    return {product.id: _serialize_product_detail(product) for product in products}
+
+
+def _product_batch_response(request, product_ids):
+    product_cache = get_product_cache(request)
+    if product_cache is None:
+        loaded = {
+            product_id: (product_validators, json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+            for product_id, (payload, product_validators) in _product_detail_payloads(product_ids).items()
+        }
+    else:
+        keys = {product_cache.detail_key(product_id): product_id for product_id in product_ids}
+        found = product_cache.get_or_load_many(
+            list(keys),
+            lambda missing: {
+                product_cache.detail_key(product_id): loaded
+                for product_id, loaded in _product_detail_payloads([keys[key] for key in missing]).items()
+            },
+        )
+        loaded = {keys[key]: value for key, value in found.items()}
+
+    # Cached entries are already JSON, so the envelope is stitched together as bytes
+    bodies = [loaded[product_id][1] for product_id in product_ids if product_id in loaded]
+    missing = [product_id for product_id in product_ids if product_id not in loaded]
+    body = b''.join([
+        b'{"items":[', b','.join(bodies), b'],"missing":',
+        json.dumps(missing, separators=(',', ':')).encode('utf-8'), b'}',
+    ])
+    etag = make_etag('batch', [loaded[product_id][0]['etag'] for product_id in product_ids if product_id in loaded], missing)
+    return conditional_json_response(request, validators(etag), body=body)
+
+
+@view_config(route_name='get_products_batch', renderer='json', request_method='GET')
+def get_products_batch(request):
+    try:
+        product_ids = parse_product_ids(request.params.get('ids', ''))
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+    log.debug("Batch lookup of %d products", len(product_ids))
+    try:
+        return _product_batch_response(request, product_ids)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        log.error("Batch lookup of %d products failed: %s", len(product_ids), e)
+        request.response.status = 500
+        return {'error': 'A database error occurred while fetching products.'}
+
+
+@view_config(route_name='post_products_batch', renderer='json', request_method='POST')
+def post_products_batch(request):
+    try:
+        body = request.json_body
+    except ValueError:
+        request.response.status = 400
+        return {'error': 'Invalid JSON body'}
+    try:
+        product_ids = parse_product_ids(body.get('ids') if isinstance(body, dict) else None)
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+    log.debug("Batch lookup of %d products", len(product_ids))
+    try:
+        return _product_batch_response(request, product_ids)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        log.error("Batch lookup of %d products failed: %s", len(product_ids), e)
+        request.response.status = 500
+        return {'error': 'A database error occurred while fetching products.'}
+
+
+SELLER_LIST_FIELDS = ['id', 'name', 'price', 'image', 'rating', 'sold', 'seller', 'stock']
 
 
 @view_config(route_name='get_seller_products', renderer='json', request_method='GET')
@@ -121,38 +545,46 @@ def get_seller_products(request):
     if not user_id:
         return HTTPUnauthorized(json_body={"error": "Unauthorized"})
 
-    user = DBSession.query(User).get(user_id)
-    if not user:
-        return HTTPUnauthorized(json_body={"error": "User not found"})
+    params = request.params
+    try:
+        fields = parse_fields(params.get('fields')) if params.get('fields') else list(SELLER_LIST_FIELDS)
+        sort = params.get('sort', 'id')
+        if sort not in PRODUCT_SORTS:
+            raise ValueError(f"Unknown sort '{sort}'")
+        limit = parse_limit(params.get('limit'))
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
 
-    username = user.username
     print(f"DEBUG: User ID from token: {user_id}")
-    print(f"DEBUG: Username from DB: '{username}' (len={len(username)})")
-
-    # Query products by seller username exactly
-    products = DBSession.query(Product).filter(Product.seller == username).all()
-
-    print(f"DEBUG: Number of products found: {len(products)}")
-    for p in products:
-        print(f"DEBUG: Product ID={p.id}, Seller='{p.seller}', Name='{p.name}'")
-
-    result = []
-    for p in products:
-        result.append({
-            'id': p.id,
-            'name': p.name,
-            'price': p.price,
-            'image': p.image_url or '/api/placeholder/300/200',
-            'rating': p.rating,
-            'sold': p.sold,
-            'seller': p.seller,
-            'stock': p.stock
-        })
 
-    return result
+    # Products are linked to their seller by id (ix_products_seller_id_id), no User lookup needed
+    query = (
+        DBSession.query(*[PRODUCT_LIST_COLUMNS[name] for name in fields])
+        .filter(Product.seller_id == user_id)
+    )
 
+    # Without limit/cursor keep the plain list the seller dashboard expects
+    if 'limit' not in params and 'cursor' not in params:
+        rows = query.order_by(Product.id).all()
+        print(f"DEBUG: Number of products found: {len(rows)}")
+        return [serialize_product_row(row, fields) for row in rows]
 
-# NEW
+    try:
+        rows, next_cursor = keyset_page(query, PRODUCT_SORTS[sort], limit, params.get('cursor'))
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
+
+    print(f"DEBUG: Number of products found: {len(rows)}")
+    return {
+        'items': [serialize_product_row(row, fields) for row in rows],
+        'next_cursor': next_cursor,
+    }
+
+
+# Products are versioned (models/product.py): a write based on a stale read fails with StaleDataError
+PRODUCT_CONFLICT = 'This product was changed by someone else. Reload it and try again.'
 
 
 @view_config(route_name='edit_product', renderer='json', request_method='PUT')
@@ -163,24 +595,34 @@ def edit_product(request):
         if not user_id:
             return HTTPUnauthorized(json_body={'error': 'Authentication required'})
 
-        user = DBSession.query(User).get(user_id)
-        if not user:
-            return HTTPUnauthorized(json_body={'error': 'User not found'})
-
         product = DBSession.query(Product).filter(Product.id == int(product_id)).first()
         if not product:
             return HTTPNotFound(json_body={'error': 'Product not found'})
 
-        if product.seller != user.username:
+        if product.seller_id != user_id:
             return HTTPForbidden(json_body={'error': 'You are not authorized to edit this product'})
 
         data = request.json_body
         product_data = ProductSchema().load(data, partial=True)
 
+        old_category = product.category
         for key, value in product_data.items():
             setattr(product, key, value)
 
         DBSession.flush() # Commit changes to the database
+        adjust_category_counts(DBSession, category_delta(old_category, product.category))
+
+        search_index = get_search_index(request)
+        if search_index is not None and ('name' in product_data or 'description' in product_data):
+            run_after_commit(request, search_index.update, product.id, product.name, product.description)
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            if 'name' in product_data:
+                run_after_commit(request, suggest_index.update, product.id, product.name, product.sold)
+            elif 'sold' in product_data:
+                run_after_commit(request, suggest_index.update_sold, product.id, product.sold)
+        invalidate_products(request, product.id)
+
         return ProductSchema().dump(product)
 
     except ValidationError as err:
@@ -190,6 +632,16 @@ def edit_product(request):
             content_type='application/json',
             charset='utf-8'
         )
+    except StaleDataError:
+        # products.version moved on since we read the row (another edit, a
+        # sale, a seller rename); abort the transaction, the client can retry
+        request.tm.doom()
+        return Response(
+            body=json.dumps({'error': PRODUCT_CONFLICT}),
+            status=409,
+            content_type='application/json',
+            charset='utf-8'
+        )
     except SQLAlchemyError as e:
         DBSession.rollback() # Rollback in case of DB error
         return Response(
@@ -221,12 +673,7 @@ def delete_product(request):
             print("DEBUG: delete_product - Authentication failed. No user_id from JWT.")
             raise HTTPUnauthorized(json_body={'error': 'Authentication required'})
         
-        user = DBSession.query(User).get(user_id)
-        if not user:
-            print(f"DEBUG: delete_product - Authenticated user_id {user_id} not found in DB.")
-            raise HTTPUnauthorized(json_body={'error': 'Authenticated user not found'})
-        
-        print(f"DEBUG: delete_product - Authenticated user: {user.username} (ID: {user.id})")
+        print(f"DEBUG: delete_product - Authenticated user ID: {user_id}")
 
         # 2. Validate product_id format
         try:
@@ -245,16 +692,14 @@ def delete_product(request):
         print(f"DEBUG: delete_product - Product found: {product.name}, Seller: {product.seller}")
 
         # 4. Authorize: Check if the logged-in user is the seller of the product
-        if product.seller != user.username:
-            print(f"DEBUG: delete_product - Forbidden. User '{user.username}' is not the seller of product '{product.name}' (seller: '{product.seller}').")
+        if product.seller_id != user_id:
+            print(f"DEBUG: delete_product - Forbidden. User {user_id} is not the seller of product '{product.name}' (seller_id: {product.seller_id}).")
             raise HTTPForbidden(json_body={'error': 'You are not authorized to delete this product.'})
 
-        # 5. Delete associated CartItems first to avoid foreign key constraint errors
-        #    The `synchronize_session` strategy might need adjustment based on your specific setup or errors.
-        #    'fetch' is generally safe but can be less performant on many rows.
-        #    'evaluate' might work if no complex ORM state is involved with CartItem.
-        #    False can sometimes lead to issues if the session has pending changes on those items.
-        deleted_cart_item_count = DBSession.query(CartItem).filter(CartItem.product_id == int_product_id).delete(synchronize_session='fetch')
+        # 5. Delete associated CartItems first to avoid foreign key constraint errors,
+        #    taking them off the totals of the carts that held them
+        deleted_cart_item_count = delete_product_lines(DBSession, [int_product_id])
+        delete_product_stock_rows(DBSession, [int_product_id])
         if deleted_cart_item_count > 0:
             print(f"DEBUG: delete_product - Deleted {deleted_cart_item_count} associated cart items for product ID {int_product_id}.")
             DBSession.flush() # Flush deletion of cart items
@@ -270,7 +715,16 @@ def delete_product(request):
         # 6. Now delete the product itself
         DBSession.delete(product)
         DBSession.flush() 
+        adjust_category_counts(DBSession, category_delta(product.category, None))
         print(f"DEBUG: delete_product - Product with ID {int_product_id} ({product.name}) marked for deletion and flushed.")
+
+        search_index = get_search_index(request)
+        if search_index is not None:
+            run_after_commit(request, search_index.remove, int_product_id)
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            run_after_commit(request, suggest_index.remove, int_product_id)
+        invalidate_products(request, int_product_id)
         
         # pyramid_tm will handle commit on successful request completion
         return HTTPNoContent()
@@ -279,6 +733,11 @@ def delete_product(request):
         error_content = e.json if hasattr(e, 'json') else e.detail
         print(f"DEBUG: delete_product - HTTP Exception Caught: {type(e).__name__} - {error_content}")
         return e
+    except StaleDataError:
+        request.tm.doom()
+        print(f"DEBUG: delete_product - Product {product_id_str} changed since it was read, asking the client to retry.")
+        request.response.status = 409
+        return {'error': PRODUCT_CONFLICT}
     except SQLAlchemyError as e:
         DBSession.rollback() 
         # CRITICAL: Log the actual SQLAlchemyError 'e' to understand the root cause
@@ -294,6 +753,30 @@ def delete_product(request):
         return {'error': 'An unexpected error occurred while deleting the product.'}
     
 
+def _search_payload(search_index, text, limit, cursor):
+    # Ranked search: the in-memory index when enabled, otherwise
+    # tsvector/GIN on PostgreSQL, FTS5 on SQLite (see ecommerce/search.py)
+    search = search_products
+    if search_index is not None:
+        search = partial(index_search_products, search_index)
+    rows, next_cursor = search(DBSession, text, limit, cursor)
+
+    results = []
+    for row in rows:
+        item = ProductSchema().dump(row.Product)
+        item['rank'] = row.rank
+        item['highlight'] = {
+            'name': row.name_highlight,
+            'description': row.description_highlight,
+        }
+        results.append(item)
+    etag = make_etag(
+        'search', text.lower(), limit, cursor,
+        [(row.Product.id, row.Product.version) for row in rows], next_cursor,
+    )
+    return results, next_cursor, validators(etag)
+
+
 @view_config(route_name='search_products', renderer='json', request_method='GET')
 def search_products_view(request):
     search_query_param = request.params.get('q', '').strip() # Get 'q' query parameter
@@ -305,22 +788,34 @@ def search_products_view(request):
         print("[SearchView] Search query is empty. Returning empty list.")
         return [] 
 
+    paginated = 'limit' in request.params or 'cursor' in request.params
     try:
-        # Prepare for a case-insensitive LIKE search
-        # For PostgreSQL, you can use .ilike()
-        # For SQLite and other DBs, using lower() on both sides is more portable
-        search_term_for_like = f"%{search_query_param.lower()}%"
-        
-        products = DBSession.query(Product).filter(
-            or_(
-                func.lower(Product.name).like(search_term_for_like),
-                func.lower(Product.description).like(search_term_for_like),
-            )
-        ).all()
-        
-        print(f"[SearchView] Found {len(products)} products for query '{search_query_param}'")
-        return ProductSchema(many=True).dump(products)
+        limit = parse_limit(request.params.get('limit'))
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
 
+    try:
+        cursor = request.params.get('cursor')
+        page_size = limit if paginated else MAX_PAGE_SIZE
+        # Identical searches running at the same time share one query
+        results, next_cursor, result_validators = coalesce(
+            request,
+            ('search', search_query_param.lower(), page_size, cursor),
+            _search_payload, get_search_index(request), search_query_param, page_size, cursor,
+        )
+
+        print(f"[SearchView] Found {len(results)} products for query '{search_query_param}'")
+        # The Search page takes a plain list of the best matches
+        payload = results if not paginated else {'items': results, 'next_cursor': next_cursor}
+        return conditional_json_response(request, result_validators, payload=payload)
+
+    except SingleFlightTimeout:
+        request.response.status = 503
+        return {'error': 'The server is busy, please try again.'}
+    except ValueError as e:
+        request.response.status = 400
+        return {'error': str(e)}
     except SQLAlchemyError as e:
         DBSession.rollback()
         print(f"[SearchView] SQLAlchemyError during product search: {e}")
@@ -330,3 +825,32 @@ def search_products_view(request):
         print(f"[SearchView] Unexpected error during product search: {e}")
         request.response.status = 500
         return {'error': 'An unexpected error occurred while searching for products.'}
+
+
+@view_config(route_name='search_suggest', renderer='json', request_method='GET')
+def search_suggest_view(request):
+    # Called on every keystroke: no per-request logging, no ORM objects
+    prefix = request.params.get('prefix', '')
+    try:
+        limit = int(request.params.get('limit', DEFAULT_SUGGESTIONS))
+    except ValueError:
+        request.response.status = 400
+        return {'error': 'limit must be an integer'}
+    if limit < 1 or limit > MAX_SUGGESTIONS:
+        request.response.status = 400
+        return {'error': f'limit must be between 1 and {MAX_SUGGESTIONS}'}
+
+    try:
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            suggestions = suggest_index.suggest(prefix, limit)
+        else:
+            suggestions = db_suggest(DBSession, prefix, limit)
+    except SQLAlchemyError as e:
+        DBSession.rollback()
+        print(f"[SuggestView] SQLAlchemyError during suggestions: {e}")
+        request.response.status = 500
+        return {'error': 'A database error occurred while fetching suggestions.'}
+
+    request.response.cache_control = 'public, max-age=60'
+    return [{'id': product_id, 'name': name, 'sold': sold} for product_id, name, sold in suggestions]
@@ -1,6 +1,7 @@
 # views/user.py
 import json
 import jwt
+from collections import Counter
 from datetime import datetime, timedelta
 
 from ..views import imagekit
@@ -8,13 +9,35 @@ from pyramid.view import view_config
 from pyramid.response import Response
 from pyramid.httpexceptions import HTTPFound, HTTPNoContent, HTTPUnauthorized
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from marshmallow import ValidationError
 
 from ..models.meta import DBSession
 from ..models.user import User
 from ..models.product import Product
+from ..carts import delete_product_lines
 from ..schemas.user import UserSignupSchema, UserLoginSchema, UserUpdatePasswordSchema, UserSchema
 from ..security import is_authenticated, JWT_SECRET, get_user_id_from_jwt
+from ..search_index import get_search_index
+from ..suggest import get_suggest_index
+from ..transactions import run_after_commit
+from ..cache import invalidate_products
+from ..identity import forget_user
+from ..passwords import PasswordHasherBusy, get_password_hasher
+from ..categories import adjust_category_counts
+from ..reservations import delete_product_stock_rows, release_user_holds
+
+
+def password_hasher_busy():
+    # Login storms get turned away here rather than tying up every worker thread
+    response = Response(
+        body=json.dumps({'error': 'Too many password checks in progress, please try again in a moment.'}),
+        status=503,
+        content_type='application/json',
+        charset='utf-8'
+    )
+    response.headers['Retry-After'] = '1'
+    return response
 
 
 def create_jwt_token(user_id):
@@ -42,7 +65,7 @@ def signup_view(request):
         user = User(
             username=attrs['username'],
             email=attrs['email'],
-            password=User.hash_password(attrs['password'])
+            password=get_password_hasher(request).hash(attrs['password'])
         )
         DBSession.add(user)
         DBSession.flush()
@@ -54,6 +77,8 @@ def signup_view(request):
             content_type='application/json',
             charset='utf-8'
         )
+    except PasswordHasherBusy:
+        return password_hasher_busy()
     except ValidationError as ve:
         return Response(
             body=json.dumps({'error': ve.messages}),
@@ -72,7 +97,8 @@ def login_view(request):
         data = request.json_body
         creds = UserLoginSchema().load(data)
         user = DBSession.query(User).filter_by(email=creds['email']).first()
-        if user and user.verify_password(creds['password']):
+        # Also brings the stored hash up to the configured bcrypt cost
+        if user and get_password_hasher(request).verify_and_upgrade(user, creds['password']):
             token = create_jwt_token(user.id)
             return {
                 'token': token,
@@ -85,6 +111,8 @@ def login_view(request):
             content_type='application/json',
             charset='utf-8'
         )
+    except PasswordHasherBusy:
+        return password_hasher_busy()
     except ValidationError as ve:
         return Response(
             body=json.dumps({'error': ve.messages}),
@@ -104,7 +132,7 @@ def get_user_profile(request):
         print("DEBUG: User not authenticated for profile fetch.") # <--- ADD THIS
         return HTTPUnauthorized(json_body={'error': 'Authentication required'})
 
-    user = DBSession.query(User).get(user_id)
+    user = request.user
     if not user:
         print(f"DEBUG: User with ID {user_id} not found in DB during profile fetch.") # <--- ADD THIS
         return HTTPUnauthorized(json_body={'error': 'User not found'})
@@ -120,7 +148,7 @@ def update_user_profile(request):
     if not user_id:
         return HTTPUnauthorized(json_body={'error': 'Authentication required'})
 
-    user = DBSession.query(User).get(user_id)
+    user = request.user
     if not user:
         return HTTPUnauthorized(json_body={'error': 'User not found'})
 
@@ -145,9 +173,23 @@ def update_user_profile(request):
                     content_type='application/json'
                 )
 
+        old_username = user.username
+
         # Apply updates to the user object
         for key, value in updated_data.items():
             setattr(user, key, value)
+        forget_user(request, user.id)
+
+        if user.username != old_username:
+            # Products keep the seller's name for display; ownership is by seller_id.
+            # A bulk UPDATE skips the ORM, so bump version for the ETags ourselves.
+            product_ids = [pid for (pid,) in DBSession.query(Product.id).filter(Product.seller_id == user.id)]
+            if product_ids:
+                DBSession.query(Product).filter(Product.id.in_(product_ids)).update(
+                    {Product.seller: user.username, Product.version: Product.version + 1},
+                    synchronize_session=False,
+                )
+                invalidate_products(request, *product_ids)
         
         DBSession.flush() # Commit changes to the database
         return UserSchema().dump(user)
@@ -184,7 +226,7 @@ def update_user_password(request):
     if not user_id:
         return HTTPUnauthorized(json_body={'error': 'Authentication required'})
 
-    user = DBSession.query(User).get(user_id)
+    user = request.user
     if not user:
         return HTTPUnauthorized(json_body={'error': 'User not found'})
 
@@ -192,7 +234,8 @@ def update_user_password(request):
         data = request.json_body
         attrs = UserUpdatePasswordSchema().load(data)
         # Verify current password using the method in your User model
-        if not user.verify_password(attrs['current_password']):
+        hasher = get_password_hasher(request)
+        if not hasher.verify(attrs['current_password'], user.password):
             return Response(
                 body=json.dumps({'errors': {'current_password': ['Invalid current password.']}}),
                 status=401, # 401 Unauthorized for incorrect credentials
@@ -201,10 +244,12 @@ def update_user_password(request):
             )
         
         # Hash and update new password
-        user.password = User.hash_password(attrs['new_password'])
+        user.password = hasher.hash(attrs['new_password'])
         DBSession.flush()
         return {'message': 'Password updated successfully.'}
 
+    except PasswordHasherBusy:
+        return password_hasher_busy()
     except ValidationError as err:
         return Response(
             body=json.dumps({'errors': err.messages}),
@@ -238,14 +283,22 @@ def delete_account(request):
     if not user_id:
         return HTTPUnauthorized(json_body={'error': 'Authentication required'})
 
-    user = DBSession.query(User).get(user_id)
+    user = request.user
     if not user:
         return HTTPUnauthorized(json_body={'error': 'User not found'})
 
     try:
-        products_to_delete = DBSession.query(Product).filter(Product.seller == user.username).all()
+        products_to_delete = DBSession.query(Product).filter(Product.seller_id == user.id).all()
+        product_ids = [product.id for product in products_to_delete]
+        if product_ids:
+            # Same as delete_product: cart lines pointing at these products go first
+            delete_product_lines(DBSession, product_ids)
+            delete_product_stock_rows(DBSession, product_ids)
+        # Units this user was holding on other sellers' products go back on sale
+        if release_user_holds(DBSession, user.id):
+            invalidate_products(request)
         for product in products_to_delete:
-            if product.imagekit_file_id:
+            if getattr(product, 'imagekit_file_id', None):
                 try:
                     imagekit.delete_file(product.imagekit_file_id)
                     print(f"ImageKit image {product.imagekit_file_id} deleted for product {product.id}.")
@@ -253,11 +306,35 @@ def delete_account(request):
                     print(f"WARNING: Failed to delete ImageKit image {product.imagekit_file_id} during account deletion: {ik_err}")
             DBSession.delete(product) # Delete the product record from your DB
         DBSession.flush() # Flush product deletions before user deletion to avoid foreign key issues
+        adjust_category_counts(DBSession, Counter({
+            category: -count
+            for category, count in Counter(product.category for product in products_to_delete).items()
+        }))
+
+        search_index = get_search_index(request)
+        if search_index is not None:
+            for product_id in product_ids:
+                run_after_commit(request, search_index.remove, product_id)
+        suggest_index = get_suggest_index(request)
+        if suggest_index is not None:
+            for product_id in product_ids:
+                run_after_commit(request, suggest_index.remove, product_id)
+        invalidate_products(request, *product_ids)
 
         DBSession.delete(user) # Delete the user record itself
+        forget_user(request, user.id)
         DBSession.flush()
         return HTTPNoContent() # 204 No Content for successful deletion
 
+    except StaleDataError:
+        # One of the user's products changed (sale, edit) between loading and deleting it
+        request.tm.doom()
+        return Response(
+            body=json.dumps({'error': 'Your products changed while deleting your account. Please try again.'}),
+            status=409,
+            content_type='application/json',
+            charset='utf-8'
+        )
     except SQLAlchemyError as e:
         DBSession.rollback() # Rollback on database error
         return Response(
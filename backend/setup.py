@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name='ecommerce',
     version='0.1',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     install_requires=[
         'pyramid',
         'waitress',
@@ -14,9 +14,16 @@ setup(
         'marshmallow',
         # add other dependencies you use
     ],
+    extras_require={
+        'redis': ['redis'],
+    },
     entry_points={
         'paste.app_factory': [
             'main = ecommerce:main',
         ],
+        'console_scripts': [
+            'ecommerce_sweep_carts = ecommerce.sweeper:main',
+            'ecommerce_release_holds = ecommerce.reservations:main',
+        ],
     },
 )
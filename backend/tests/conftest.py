@@ -0,0 +1,81 @@
+import contextlib
+
+import pytest
+from sqlalchemy import event
+from webtest import TestApp
+
+from ecommerce import main
+from ecommerce.models.meta import Base, DBSession
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """
+    Build the app against a fresh SQLite file. Keyword arguments are .ini
+    settings on top of the test defaults (cheap bcrypt).
+    """
+    engines = []
+
+    def make(**settings):
+        DBSession.remove()
+        app = main({}, **{
+            'sqlalchemy.url': f"sqlite:///{tmp_path / 'test.db'}",
+            'passwords.bcrypt_rounds': '4',
+            **settings,
+        })
+        engines.append(DBSession.get_bind())
+        Base.metadata.create_all(engines[-1])
+        return TestApp(app)
+
+    yield make
+    DBSession.remove()
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def signup():
+    """Sign a user up, log them in and return their Authorization header."""
+    def signup(app, username='alice1', email='alice@example.com', password='password1'):
+        app.post_json('/signup', {'username': username, 'email': email, 'password': password})
+        token = app.post_json('/login', {'email': email, 'password': password}).json['token']
+        return {'Authorization': f'Bearer {token}'}
+    return signup
+
+
+class StatementLog(list):
+    """SQL statements seen while the count_statements block was open."""
+
+    @property
+    def count(self):
+        return len(self)
+
+
+@pytest.fixture
+def count_statements():
+    """
+    Context manager counting the statements the app sends to the database:
+
+        with count_statements() as statements:
+            app.get('/api/cart', headers=auth)
+        assert statements.count == 2, statements
+    """
+    @contextlib.contextmanager
+    def count_statements():
+        engine = DBSession.get_bind()
+        statements = StatementLog()
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+    return count_statements
@@ -0,0 +1,209 @@
+import pytest
+from sqlalchemy import create_mock_engine, event, select, update
+from sqlalchemy.orm import Session
+
+from ecommerce.carts import check_cart_totals
+from ecommerce.models.cart import Cart
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+from ecommerce.upserts import check_upsert_support
+
+LARGE_CART = 25
+
+
+@pytest.fixture
+def shop(app, signup):
+    """An app with a seller, a buyer and LARGE_CART + 1 products in stock."""
+    seller = signup(app, 'seller1', 'seller@example.com')
+    for i in range(LARGE_CART + 1):
+        app.post_json('/api/products', {'name': f'Product {i}', 'description': 'd', 'price': 10 + i, 'stock': 50},
+                      headers=seller)
+    return app, signup(app, 'buyer1', 'buyer@example.com')
+
+
+def fill_cart(app, auth, lines):
+    for product_id in range(1, lines + 1):
+        app.post_json('/api/cart/items', {'product_id': product_id, 'quantity': 1}, headers=auth)
+    return app.get('/api/cart', headers=auth).json
+
+
+def cart_request_counts(app, auth, count_statements, lines):
+    """Statements run by each cart request against a cart of `lines` lines."""
+    cart = fill_cart(app, auth, lines)
+    assert len(cart['items']) == lines
+    item_id = cart['items'][0]['id']
+    requests = {
+        'get': lambda: app.get('/api/cart', headers=auth),
+        'add': lambda: app.post_json('/api/cart/items', {'product_id': LARGE_CART + 1, 'quantity': 1}, headers=auth),
+        'update': lambda: app.put_json(f'/api/cart/items/{item_id}', {'quantity': 2}, headers=auth),
+        'patch': lambda: app.patch_json('/api/cart', {'operations': [{'op': 'set', 'item_id': item_id, 'quantity': 3}]},
+                                        headers=auth),
+        'summary': lambda: app.get('/api/cart/summary', headers=auth),
+    }
+    counts = {}
+    for name, request in requests.items():
+        with count_statements() as statements:
+            request()
+        counts[name] = statements.count
+    return counts
+
+
+def test_cart_requests_run_a_constant_number_of_statements(shop, signup, count_statements):
+    app, auth = shop
+    small = cart_request_counts(app, auth, count_statements, 1)
+    app.delete('/api/cart', headers=auth)
+    large = cart_request_counts(app, auth, count_statements, LARGE_CART)
+    assert small == large
+    assert small['get'] <= 3
+
+
+def test_cart_serializes_every_line(shop):
+    app, auth = shop
+    cart = fill_cart(app, auth, 3)
+    assert [item['product']['name'] for item in cart['items']] == ['Product 0', 'Product 1', 'Product 2']
+    assert cart['total_items_count'] == 3
+    assert cart['grand_total'] == 33.0
+
+
+def test_startup_refuses_databases_without_upserts():
+    engine = create_mock_engine('mysql://', executor=None)
+    with pytest.raises(ValueError, match="Unsupported sqlalchemy.url dialect 'mysql'"):
+        check_upsert_support(engine)
+
+
+def test_adding_twice_grows_one_line(shop):
+    app, buyer = shop
+    for _ in range(2):
+        app.post_json('/api/cart/items', {'product_id': 1, 'quantity': 2}, headers=buyer)
+    cart = app.get('/api/cart', headers=buyer).json
+    assert [item['quantity'] for item in cart['items']] == [4]
+
+
+def test_patch_cannot_grow_a_line_past_stock(shop):
+    app, buyer = shop
+    fill_cart(app, buyer, 1)
+    response = app.patch_json('/api/cart', {'operations': [
+        {'op': 'set', 'product_id': 2, 'quantity': 1},
+        {'op': 'set', 'product_id': 1, 'quantity': 51},
+    ]}, headers=buyer, status=400)
+    assert response.json['operation'] == 1
+    assert [item['quantity'] for item in app.get('/api/cart', headers=buyer).json['items']] == [1]
+
+
+def test_patch_stock_check_happens_in_the_write(shop):
+    # Stock sells out between the view's product read and its write: the
+    # write itself must refuse the line (the view used to check in Python)
+    app, buyer = shop
+    item_id = fill_cart(app, buyer, 1)['items'][0]['id']
+    engine = DBSession.get_bind()
+    pending = [True]
+
+    def sell_out(conn, cursor, statement, parameters, context, executemany):
+        if pending and statement.startswith('INSERT INTO cart_items'):
+            pending.pop()
+            with engine.begin() as other:
+                other.execute(update(Product).where(Product.id == 1).values(stock=2))
+
+    event.listen(engine, 'before_cursor_execute', sell_out)
+    try:
+        response = app.patch_json('/api/cart', {'operations': [{'op': 'set', 'item_id': item_id, 'quantity': 10}]},
+                                  headers=buyer, status=400)
+    finally:
+        event.remove(engine, 'before_cursor_execute', sell_out)
+    assert response.json['error'] == 'Not enough stock for Product 0. Available: 2'
+    assert [item['quantity'] for item in app.get('/api/cart', headers=buyer).json['items']] == [1]
+
+
+def cart_rows():
+    with DBSession.get_bind().connect() as connection:
+        return connection.execute(select(Cart.user_id, Cart.item_count, Cart.grand_total)).all()
+
+
+def test_summary_without_a_cart_creates_none(shop, count_statements):
+    app, buyer = shop
+    with count_statements() as statements:
+        assert app.get('/api/cart/summary', headers=buyer).json == {'total_items_count': 0, 'grand_total': 0.0}
+    assert not [s for s in statements if not s.startswith('SELECT')], statements
+    assert cart_rows() == []
+
+
+def test_removing_someone_elses_line_is_forbidden(shop, signup):
+    app, buyer = shop
+    item_id = fill_cart(app, buyer, 2)['items'][0]['id']
+    other = signup(app, 'other1', 'other@example.com')
+    app.delete(f'/api/cart/items/{item_id}', headers=other, status=403)
+    app.delete('/api/cart/items/99999', headers=other, status=404)
+    cart = app.get('/api/cart', headers=buyer).json
+    assert [item['id'] for item in cart['items']][0] == item_id
+    assert cart['total_items_count'] == 2
+
+
+def test_remove_and_clear_update_the_totals(shop):
+    app, buyer = shop
+    cart = fill_cart(app, buyer, 3)
+    cart = app.delete(f"/api/cart/items/{cart['items'][1]['id']}", headers=buyer).json
+    assert (cart['total_items_count'], cart['grand_total']) == (2, 22.0)
+    assert app.get('/api/cart/summary', headers=buyer).json == {'total_items_count': 2, 'grand_total': 22.0}
+    cart = app.delete('/api/cart', headers=buyer).json
+    assert (cart['items'], cart['total_items_count'], cart['grand_total']) == ([], 0, 0.0)
+    assert app.get('/api/cart/summary', headers=buyer).json == {'total_items_count': 0, 'grand_total': 0.0}
+    # Clearing an empty cart is fine too
+    app.delete('/api/cart', headers=buyer)
+
+
+def assert_totals_match_lines(app, auth):
+    """The stored totals agree with the lines, in the database and in what the API reports."""
+    with Session(bind=DBSession.get_bind()) as session:
+        assert check_cart_totals(session) == []
+    cart = app.get('/api/cart', headers=auth).json
+    count = sum(item['quantity'] for item in cart['items'])
+    total = round(sum(item['item_total'] for item in cart['items']), 2)
+    assert (cart['total_items_count'], cart['grand_total']) == (count, total)
+    assert app.get('/api/cart/summary', headers=auth).json == {'total_items_count': count, 'grand_total': total}
+    return count, total
+
+
+def test_stored_totals_follow_every_cart_change(shop):
+    app, buyer = shop
+    app.post_json('/api/cart/items', {'product_id': 1, 'quantity': 2}, headers=buyer)
+    app.post_json('/api/cart/items', {'product_id': 2, 'quantity': 1}, headers=buyer)
+    app.post_json('/api/cart/items', {'product_id': 1, 'quantity': 1}, headers=buyer)
+    assert assert_totals_match_lines(app, buyer) == (4, 41.0)
+
+    items = app.get('/api/cart', headers=buyer).json['items']
+    app.put_json(f"/api/cart/items/{items[1]['id']}", {'quantity': 5}, headers=buyer)
+    assert assert_totals_match_lines(app, buyer) == (8, 85.0)
+
+    app.patch_json('/api/cart', {'operations': [
+        {'op': 'add', 'product_id': 3, 'quantity': 2},
+        {'op': 'set', 'item_id': items[0]['id'], 'quantity': 1},
+        {'op': 'remove', 'item_id': items[1]['id']},
+    ]}, headers=buyer)
+    assert assert_totals_match_lines(app, buyer) == (3, 34.0)
+
+    app.delete(f"/api/cart/items/{items[0]['id']}", headers=buyer)
+    assert assert_totals_match_lines(app, buyer) == (2, 24.0)
+
+    app.delete('/api/cart', headers=buyer)
+    assert assert_totals_match_lines(app, buyer) == (0, 0.0)
+
+    fill_cart(app, buyer, 2)
+    app.post_json('/api/checkout', {}, headers=buyer, status=201)
+    assert assert_totals_match_lines(app, buyer) == (0, 0.0)
+
+
+def test_check_cart_totals_repairs_drift(shop, signup):
+    app, buyer = shop
+    fill_cart(app, buyer, 2)
+    other = signup(app, 'other1', 'other@example.com')
+    fill_cart(app, other, 1)
+    with DBSession.get_bind().begin() as connection:
+        buyer_cart = connection.execute(select(Cart.id).order_by(Cart.id)).scalars().first()
+        connection.execute(update(Cart).where(Cart.id == buyer_cart).values(item_count=7, grand_total=1.5))
+
+    with Session(bind=DBSession.get_bind()) as session:
+        assert check_cart_totals(session) == [(buyer_cart, 7, 2, 1.5, 21.0)]
+    with Session(bind=DBSession.get_bind()) as session, session.begin():
+        assert len(check_cart_totals(session, repair=True)) == 1
+    assert assert_totals_match_lines(app, buyer) == (2, 21.0)
+    assert assert_totals_match_lines(app, other) == (1, 10.0)
@@ -0,0 +1,60 @@
+import transaction
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ecommerce.categories import rebuild_category_counts
+from ecommerce.models.category import Category
+from ecommerce.models.meta import DBSession
+
+
+def create_product(app, auth, category):
+    product = {'name': 'Thing', 'description': 'd', 'price': 1.0, 'category': category}
+    return app.post_json('/api/products', product, headers=auth).json['id']
+
+
+def counts(app):
+    return {category['name']: category['count'] for category in app.get('/api/categories').json}
+
+
+def stored_counts():
+    with Session(bind=DBSession.get_bind()) as session:
+        return dict(session.query(Category.name, Category.product_count).filter(Category.product_count > 0))
+
+
+def test_counts_follow_product_changes(app, signup):
+    alice = signup(app, 'alice1', 'alice@example.com')
+    bob = signup(app, 'bob111', 'bob@example.com')
+    lamp = create_product(app, alice, ' Home ')
+    create_product(app, alice, 'home')
+    create_product(app, alice, 'office')
+    create_product(app, alice, None)
+    create_product(app, bob, 'home')
+    assert counts(app) == {'home': 3, 'office': 1}
+
+    app.put_json(f'/api/products/{lamp}', {'category': 'Office'}, headers=alice)
+    assert counts(app) == {'home': 2, 'office': 2}
+    app.put_json(f'/api/products/{lamp}', {'price': 2.0}, headers=alice)
+    assert counts(app) == {'home': 2, 'office': 2}
+
+    app.delete(f'/api/products/{lamp}', headers=alice)
+    assert counts(app) == {'home': 2, 'office': 1}
+
+    app.delete('/api/user/account', headers=alice)
+    assert counts(app) == {'home': 1}
+
+
+def test_rebuild_matches_the_incremental_counts(app, signup):
+    seller = signup(app, 'seller1', 'seller@example.com')
+    ids = [create_product(app, seller, category) for category in ('home', 'home', 'garden', 'toys', None)]
+    app.put_json(f'/api/products/{ids[0]}', {'category': 'garden'}, headers=seller)
+    app.delete(f'/api/products/{ids[3]}', headers=seller)
+    incremental = stored_counts()
+    assert incremental == {'home': 1, 'garden': 2}
+
+    # Drift, as a raw SQL edit would leave it
+    with DBSession.get_bind().begin() as connection:
+        connection.execute(update(Category).where(Category.name == 'home').values(product_count=99))
+
+    with transaction.manager:
+        assert rebuild_category_counts(DBSession) == 2
+    assert stored_counts() == incremental
@@ -0,0 +1,83 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import update
+
+from ecommerce.exporter import EXPORT_FIELDS
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+
+
+@pytest.fixture
+def seller(app, signup):
+    return signup(app, 'seller1', 'seller@example.com')
+
+
+def create_products(app, seller, count):
+    return [
+        app.post_json('/api/products', {'name': f'Product {i}', 'description': 'd', 'price': 10.0 + i, 'stock': i},
+                      headers=seller).json['id']
+        for i in range(count)
+    ]
+
+
+def export(app, **params):
+    response = app.get('/api/products/export', params)
+    assert response.content_type == 'application/x-ndjson'
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def resume_from(app, row):
+    return export(app, since=row['updated_at'], after_id=row['id'])
+
+
+def test_ndjson_export(app, seller):
+    ids = create_products(app, seller, 3)
+    rows = export(app)
+    assert [row['id'] for row in rows] == ids
+    assert list(rows[0]) == EXPORT_FIELDS
+    assert rows[2]['name'] == 'Product 2' and rows[2]['price'] == 12.0 and rows[2]['seller'] == 'seller1'
+
+
+def test_csv_export(app, seller):
+    ids = create_products(app, seller, 3)
+    response = app.get('/api/products/export', {'format': 'csv'})
+    assert response.content_type == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row['id']) for row in rows] == ids
+    assert rows[1]['name'] == 'Product 1' and rows[1]['stock'] == '1'
+
+
+@pytest.mark.parametrize('params', [{'format': 'xml'}, {'since': 'yesterday'}, {'after_id': 'x'}])
+def test_export_rejects_bad_parameters(app, params):
+    app.get('/api/products/export', params, status=400)
+
+
+def test_watermark_resumes_without_skipping_or_repeating(app, seller):
+    ids = create_products(app, seller, 3)
+    first_run = export(app, since='2000-01-01T00:00:00')
+    assert [row['id'] for row in first_run] == ids
+    # Resuming from any row returns exactly the rows after it...
+    for position, row in enumerate(first_run):
+        assert [r['id'] for r in resume_from(app, row)] == ids[position + 1:]
+
+    # ...and from the end, exactly what changed since
+    app.put_json(f'/api/products/{ids[0]}', {'price': 1.0}, headers=seller)
+    ids += create_products(app, seller, 1)
+    changes = resume_from(app, first_run[-1])
+    assert [row['id'] for row in changes] == [ids[0], ids[3]]
+    assert changes[0]['price'] == 1.0
+    assert resume_from(app, changes[-1]) == []
+
+
+def test_watermark_breaks_timestamp_ties_by_id(app, seller):
+    ids = create_products(app, seller, 3)
+    with DBSession.get_bind().begin() as connection:
+        connection.execute(update(Product).values(updated_at=datetime(2026, 1, 1, 12, 0, 0)))
+    rows = export(app, since='2000-01-01T00:00:00')
+    assert [row['id'] for row in rows] == ids
+    assert [row['id'] for row in resume_from(app, rows[0])] == ids[1:]
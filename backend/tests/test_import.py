@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from ecommerce import importer
+
+
+@pytest.fixture
+def seller(app, signup):
+    return signup(app, 'seller1', 'seller@example.com')
+
+
+def import_body(app, auth, body, content_type, **kwargs):
+    return app.post('/api/products/import', body.encode('utf-8'), headers={**auth, 'Content-Type': content_type},
+                    **kwargs)
+
+
+def product_names(app, seller):
+    return [product['name'] for product in app.get('/api/seller/products', headers=seller).json]
+
+
+def test_csv_import_keeps_good_rows_and_reports_bad_ones(app, seller):
+    body = (
+        '﻿name,description,price,stock,category\n'
+        'Lamp,Warm light,19.5,3,Home\n'
+        'Chair,Comfortable,not a price,1,\n'
+        'Desk,,120,1,\n'
+        'Mug,Big,4,,Kitchen,extra\n'
+        'Pen,Blue,1.5,,\n'
+    )
+    report = import_body(app, seller, body, 'text/csv').json
+    assert report['inserted'] == 2 and report['failed'] == 3
+    assert not report['errors_truncated']
+    assert [(error['row'], sorted(error['errors'])) for error in report['errors']] == [
+        (2, ['price']), (3, ['description']), (4, ['_row']),
+    ]
+    assert product_names(app, seller) == ['Lamp', 'Pen']
+    lamp = app.get('/api/get-products').json[0]
+    assert lamp['seller'] == 'seller1'
+    assert app.get('/api/categories').json[0]['name'] == 'home'
+
+
+def test_ndjson_import(app, seller):
+    lines = [
+        json.dumps({'name': 'Lamp', 'description': 'Warm light', 'price': 19.5}),
+        '',
+        '{"name": "Broken"',
+        json.dumps(['not', 'an', 'object']),
+        json.dumps({'name': 'Chair', 'description': 'Comfortable'}),
+        json.dumps({'name': 'Pen', 'description': 'Blue', 'price': 1.5}),
+    ]
+    report = import_body(app, seller, '\n'.join(lines) + '\n', 'application/x-ndjson').json
+    assert (report['inserted'], report['failed']) == (2, 3)
+    # Blank lines are not rows
+    assert [error['row'] for error in report['errors']] == [2, 3, 4]
+    assert 'price' in report['errors'][2]['errors']
+    assert product_names(app, seller) == ['Lamp', 'Pen']
+
+
+def test_error_report_is_capped_but_counts_are_exact(app, seller, monkeypatch):
+    monkeypatch.setattr(importer, 'MAX_REPORTED_ERRORS', 3)
+    body = 'name,description,price\n' + 'Bad,row,x\n' * 10 + 'Good,row,1\n'
+    report = import_body(app, seller, body, 'text/csv').json
+    assert (report['inserted'], report['failed']) == (1, 10)
+    assert [error['row'] for error in report['errors']] == [1, 2, 3]
+    assert report['errors_truncated']
+
+
+def test_rows_are_inserted_in_batches(app, seller, count_statements):
+    body = 'name,description,price\n' + ''.join(f'P{i},d,{i + 1}\n' for i in range(20))
+    with count_statements() as statements:
+        assert import_body(app, seller, body, 'text/csv').json['inserted'] == 20
+    assert len([s for s in statements if s.startswith('INSERT INTO products')]) == 1, statements
+    assert product_names(app, seller) == [f'P{i}' for i in range(20)]
+
+
+def test_format_from_query_string(app, seller):
+    body = json.dumps({'name': 'Lamp', 'description': 'd', 'price': 1}) + '\n'
+    response = app.post('/api/products/import?format=ndjson', body.encode('utf-8'),
+                        headers={**seller, 'Content-Type': 'application/octet-stream'})
+    assert response.json['inserted'] == 1
+
+
+def test_import_rejections(app, seller):
+    import_body(app, {}, 'name\n', 'text/csv', status=401)
+    import_body(app, seller, 'name\n', 'application/xml', status=415)
+    response = app.post('/api/products/import', b'name,description,price\n\xff,d,1\n',
+                         headers={**seller, 'Content-Type': 'text/csv'}, status=400)
+    assert 'UTF-8' in response.json['error']
@@ -0,0 +1,9 @@
+def test_metrics_are_off_by_default(app):
+    app.get('/api/metrics', status=404)
+
+
+def test_metrics_when_enabled(make_app):
+    app = make_app(**{'metrics.enabled': 'true', 'product_cache.backend': 'memory'})
+    metrics = app.get('/api/metrics').json
+    assert metrics['product_cache'] is not None
+    assert metrics['password_hasher']['rounds'] == 4
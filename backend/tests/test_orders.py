@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from ecommerce.models.cart import CartItem
+from ecommerce.models.meta import DBSession
+from ecommerce.models.order import Order, OrderItem
+from ecommerce.models.product import Product
+from ecommerce.models.reservation import StockHold, StockShard
+from ecommerce.reservations import release_expired_holds, split_stock, sync_shard_totals, utcnow
+
+LAMP, DESK = 1, 2
+
+
+@pytest.fixture(params=['plain', 'reservations', 'sharded'])
+def shop(request, make_app, signup):
+    """
+    An app with two products (10 lamps at 20.00, 5 desks at 100.00) and a
+    buyer, checking out plain stock, stock held on add-to-cart, or held
+    stock with the lamps spread over shards. Returns (app, buyer, mode).
+    """
+    app = make_app(**{'stock_reservations.enabled': 'false' if request.param == 'plain' else 'true'})
+    seller = signup(app, 'seller1', 'seller@example.com')
+    for name, price, stock in (('Lamp', 20.0, 10), ('Desk', 100.0, 5)):
+        app.post_json('/api/products', {'name': name, 'description': 'd', 'price': price, 'stock': stock},
+                      headers=seller)
+    if request.param == 'sharded':
+        with Session(bind=DBSession.get_bind()) as session, session.begin():
+            split_stock(session, LAMP, 3)
+    return app, signup(app, 'buyer1', 'buyer@example.com'), request.param
+
+
+def add(app, auth, product_id, quantity):
+    app.post_json('/api/cart/items', {'product_id': product_id, 'quantity': quantity}, headers=auth)
+
+
+def state():
+    """Everything a checkout may change."""
+    with DBSession.get_bind().connect() as connection:
+        def scalar(statement):
+            return connection.execute(statement).scalar_one()
+        return {
+            'products': [tuple(row) for row in connection.execute(
+                select(Product.id, Product.stock, Product.sold).order_by(Product.id))],
+            'shards': scalar(select(func.coalesce(func.sum(StockShard.stock), 0))),
+            'held': scalar(select(func.coalesce(func.sum(StockHold.quantity), 0))),
+            'cart': [tuple(row) for row in connection.execute(
+                select(CartItem.product_id, CartItem.quantity).order_by(CartItem.product_id))],
+            'orders': scalar(select(func.count()).select_from(Order)),
+            'order_items': scalar(select(func.count()).select_from(OrderItem)),
+        }
+
+
+def test_checkout_takes_stock_and_counts_sales(shop):
+    app, buyer, mode = shop
+    add(app, buyer, LAMP, 2)
+    add(app, buyer, DESK, 1)
+    add(app, buyer, LAMP, 1)
+
+    order = app.post_json('/api/checkout', {'shipping_method': 'express'}, headers=buyer, status=201).json
+    assert (order['item_count'], order['subtotal'], order['shipping_cost'], order['tax']) == (4, 160.0, 9.99, 11.2)
+    assert order['total'] == 181.19
+    assert [(item['product_name'], item['quantity'], item['unit_price']) for item in order['items']] == [
+        ('Lamp', 3, 20.0), ('Desk', 1, 100.0),
+    ]
+
+    if mode == 'sharded':
+        # Sharded stock only reaches products.stock when the totals are synced
+        assert state()['shards'] == 7
+        with Session(bind=DBSession.get_bind()) as session, session.begin():
+            sync_shard_totals(session)
+    after = state()
+    assert after['products'] == [(LAMP, 7, 3), (DESK, 4, 1)]
+    assert after['held'] == 0
+    assert after['cart'] == []
+    assert (after['orders'], after['order_items']) == (1, 2)
+    assert app.get('/api/products/1').json['sold'] == 3
+    assert app.get('/api/cart/summary', headers=buyer).json['total_items_count'] == 0
+
+
+def test_shortage_is_a_409_that_changes_nothing(shop):
+    app, buyer, mode = shop
+    add(app, buyer, LAMP, 1)
+    add(app, buyer, DESK, 3)
+    engine = DBSession.get_bind()
+    if mode != 'plain':
+        # The holds run out and the desks sell to someone else meanwhile
+        with engine.begin() as connection:
+            connection.execute(update(StockHold).values(expires_at=utcnow() - timedelta(seconds=1)))
+        release_expired_holds(engine)
+    with engine.begin() as connection:
+        connection.execute(update(Product).where(Product.id == DESK).values(stock=2))
+    before = state()
+
+    response = app.post_json('/api/checkout', {}, headers=buyer, status=409)
+    assert response.json['error'] == 'Not enough stock for Desk. Available: 2'
+    assert response.json['shortages'] == [{'product_id': DESK, 'name': 'Desk', 'requested': 3, 'available': 2}]
+    assert state() == before
+    assert before['cart'] == [(LAMP, 1), (DESK, 3)] and before['orders'] == 0
+
+
+def test_empty_cart_is_a_400(shop):
+    app, buyer, _ = shop
+    before = state()
+    assert app.post_json('/api/checkout', {}, headers=buyer, status=400).json['error'] == 'Your cart is empty.'
+    add(app, buyer, LAMP, 1)
+    app.post_json('/api/checkout', {}, headers=buyer, status=201)
+    app.post_json('/api/checkout', {}, headers=buyer, status=400)
+    assert state()['orders'] == before['orders'] + 1
+
+
+def test_checkout_validates_its_options(shop):
+    app, buyer, _ = shop
+    add(app, buyer, LAMP, 1)
+    response = app.post_json('/api/checkout', {'shipping_method': 'teleport'}, headers=buyer, status=400)
+    assert 'shipping_method' in response.json['errors']
+    app.post_json('/api/checkout', {}, status=401)
+    assert state()['cart'] == [(LAMP, 1)]
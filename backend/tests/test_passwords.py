@@ -0,0 +1,128 @@
+import threading
+from types import SimpleNamespace
+
+import bcrypt
+import pytest
+from sqlalchemy import select
+from webtest import TestApp
+
+from ecommerce import passwords
+from ecommerce.models.meta import DBSession
+from ecommerce.models.user import User
+from ecommerce.passwords import PasswordHasher, PasswordHasherBusy, bcrypt_rounds
+
+CREDENTIALS = {'email': 'alice@example.com', 'password': 'password1'}
+
+
+def stored_hash():
+    with DBSession.get_bind().connect() as connection:
+        return connection.execute(select(User.password)).scalar_one()
+
+
+class Gate:
+    """Holds password checks back between hold() and release(), so they pile up."""
+
+    def __init__(self):
+        self.held = False
+        self.opened = threading.Event()
+
+    def hold(self):
+        self.held = True
+
+    def release(self):
+        self.opened.set()
+
+
+@pytest.fixture
+def slow_checks(monkeypatch):
+    gate = Gate()
+    checkpw = bcrypt.checkpw
+
+    def gated_checkpw(*args):
+        if gate.held:
+            gate.opened.wait(10)
+        return checkpw(*args)
+
+    monkeypatch.setattr(passwords.bcrypt, 'checkpw', gated_checkpw)
+    return gate
+
+
+def wait_for_pending(hasher, count):
+    while hasher.stats()['pending'] < count:
+        threading.Event().wait(0.01)
+
+
+def test_third_concurrent_login_is_turned_away(make_app, signup, slow_checks):
+    app = make_app(**{'passwords.workers': '1', 'passwords.max_pending': '2'})
+    signup(app)
+    hasher = app.app.registry.password_hasher
+    slow_checks.hold()
+
+    # Two logins take both slots: one on the worker, one queued behind it
+    responses = []
+    logins = [threading.Thread(target=lambda: responses.append(TestApp(app.app).post_json('/login', CREDENTIALS)))
+              for _ in range(2)]
+    for login in logins:
+        login.start()
+    wait_for_pending(hasher, 2)
+
+    response = app.post_json('/login', CREDENTIALS, status=503)
+    assert response.headers['Retry-After'] == '1'
+    assert 'try again' in response.json['error']
+
+    slow_checks.release()
+    for login in logins:
+        login.join()
+    assert [r.status_int for r in responses] == [200, 200]
+    assert hasher.stats()['rejected'] == 1
+    app.post_json('/login', CREDENTIALS, status=200)
+
+
+def test_hasher_admits_max_pending_operations(slow_checks):
+    hasher = PasswordHasher(rounds=4, workers=0, max_pending=2)
+    hashed = bcrypt.hashpw(b'password1', bcrypt.gensalt(4)).decode('utf-8')
+    checks = [threading.Thread(target=hasher.verify, args=('password1', hashed)) for _ in range(2)]
+    slow_checks.hold()
+    for check in checks:
+        check.start()
+    wait_for_pending(hasher, 2)
+
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash('password1')
+    slow_checks.release()
+    for check in checks:
+        check.join()
+    assert bcrypt_rounds(hasher.hash('password1')) == 4
+    assert (hasher.stats()['completed'], hasher.stats()['rejected']) == (3, 1)
+
+
+def test_verify_and_upgrade_rehashes_other_costs():
+    hasher = PasswordHasher(rounds=5, workers=0)
+    user = SimpleNamespace(password=bcrypt.hashpw(b'password1', bcrypt.gensalt(4)).decode('utf-8'))
+    old = user.password
+
+    assert not hasher.verify_and_upgrade(user, 'wrong-password')
+    assert user.password == old
+
+    assert hasher.verify_and_upgrade(user, 'password1')
+    assert bcrypt_rounds(user.password) == 5 and user.password != old
+    assert hasher.verify('password1', user.password)
+
+    upgraded = user.password
+    assert hasher.verify_and_upgrade(user, 'password1')
+    assert user.password == upgraded
+    assert hasher.stats()['rehashed'] == 1
+
+
+def test_login_upgrades_the_stored_hash(make_app, signup):
+    signup(make_app())
+    assert bcrypt_rounds(stored_hash()) == 4
+
+    # Same database, bcrypt cost raised
+    app = make_app(**{'passwords.bcrypt_rounds': '5'})
+    app.post_json('/login', {**CREDENTIALS, 'password': 'wrong-password'}, status=401)
+    assert bcrypt_rounds(stored_hash()) == 4
+    app.post_json('/login', CREDENTIALS, status=200)
+    assert bcrypt_rounds(stored_hash()) == 5
+    app.post_json('/login', CREDENTIALS, status=200)
+    assert app.app.registry.password_hasher.stats()['rehashed'] == 1
@@ -0,0 +1,147 @@
+import pytest
+from sqlalchemy import event, update
+
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+from ecommerce.views.product import MAX_BATCH_IDS
+
+
+@pytest.fixture
+def seller(app, signup):
+    return signup(app, 'seller1', 'seller@example.com')
+
+
+def create_product(app, auth, **fields):
+    product = {'name': 'Phone', 'description': 'A phone', 'price': 99.0, 'stock': 5, **fields}
+    return app.post_json('/api/products', product, headers=auth).json
+
+
+@pytest.mark.parametrize('cache_backend', ['none', 'memory'])
+@pytest.mark.parametrize('product_id', ['abc', '1.5', '-1', '99999999999999999999'])
+def test_product_detail_rejects_malformed_ids(make_app, cache_backend, product_id):
+    app = make_app(**{'product_cache.backend': cache_backend})
+    response = app.get(f'/api/products/{product_id}', status=400)
+    assert response.json == {'error': 'Invalid product ID format.'}
+
+
+@pytest.mark.parametrize('cache_backend', ['none', 'memory'])
+def test_product_detail(make_app, signup, cache_backend):
+    app = make_app(**{'product_cache.backend': cache_backend})
+    product = create_product(app, signup(app))
+    assert app.get(f"/api/products/{product['id']}").json['name'] == 'Phone'
+    app.get('/api/products/12345', status=404)
+
+
+@pytest.fixture
+def concurrent_write():
+    """
+    Bump a product's version from another connection right before the app's
+    next statement starting with `prefix`, as if another request committed
+    between the app's read and its first write.
+    """
+    listeners = []
+
+    def arm(prefix, product_id):
+        engine = DBSession.get_bind()
+        pending = [product_id]
+
+        def bump(conn, cursor, statement, parameters, context, executemany):
+            if pending and statement.startswith(prefix):
+                with engine.begin() as other:
+                    other.execute(update(Product).where(Product.id == pending.pop()).values(version=Product.version + 1))
+
+        event.listen(engine, 'before_cursor_execute', bump)
+        listeners.append((engine, bump))
+
+    yield arm
+    for engine, bump in listeners:
+        event.remove(engine, 'before_cursor_execute', bump)
+
+
+def test_edit_of_a_product_changed_meanwhile_is_a_conflict(app, seller, concurrent_write):
+    product = create_product(app, seller)
+    concurrent_write('UPDATE products', product['id'])
+    response = app.put_json(f"/api/products/{product['id']}", {'price': 80.0}, headers=seller, status=409)
+    assert 'changed by someone else' in response.json['error']
+    # Nothing was written, and a retry on the fresh row goes through
+    assert app.get(f"/api/products/{product['id']}").json['price'] == 99.0
+    assert app.put_json(f"/api/products/{product['id']}", {'price': 80.0}, headers=seller).json['price'] == 80.0
+
+
+def test_delete_of_a_product_changed_meanwhile_is_a_conflict(app, seller, concurrent_write):
+    product = create_product(app, seller)
+    concurrent_write('DELETE', product['id'])
+    app.delete(f"/api/products/{product['id']}", headers=seller, status=409)
+    app.get(f"/api/products/{product['id']}", status=200)
+    app.delete(f"/api/products/{product['id']}", headers=seller)
+    app.get(f"/api/products/{product['id']}", status=404)
+
+
+@pytest.mark.parametrize('query, index', [
+    ('sort=sold', 'ix_products_sold_id'),
+    ('sort=rating', 'ix_products_rating_id'),
+    ('sort=price_desc', 'ix_products_price_id'),
+    ('in_stock=1&sort=sold', 'ix_products_in_stock_sold_id'),
+    ('on_sale=1', 'ix_products_on_sale_id'),
+])
+def test_listing_sorts_and_filters_read_their_index(app, query, index):
+    engine = DBSession.get_bind()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        app.get(f'/api/get-products?limit=24&{query}')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    statement, parameters = next(s for s in statements if 'FROM products' in s[0])
+    with engine.connect() as connection:
+        plan = ' / '.join(row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters))
+    assert index in plan and 'TEMP B-TREE' not in plan, plan
+
+
+@pytest.fixture(params=['none', 'memory'])
+def catalog(request, make_app, signup):
+    """An app (with and without the product cache) and the ids of three products."""
+    app = make_app(**{'product_cache.backend': request.param})
+    seller = signup(app, 'seller1', 'seller@example.com')
+    return app, [create_product(app, seller, name=f'Product {i}')['id'] for i in range(3)]
+
+
+def get_batch(app, ids, method, status=200):
+    if method == 'GET':
+        return app.get('/api/products', {'ids': ','.join(str(i) for i in ids)}, status=status)
+    return app.post_json('/api/products/batch', {'ids': ids}, status=status)
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_batch_returns_products_in_request_order(catalog, method):
+    app, (first, second, third) = catalog
+    for _ in range(2):  # the second round comes from the cache when there is one
+        body = get_batch(app, [third, 999, first, third, second], method).json
+        assert [item['id'] for item in body['items']] == [third, first, second]
+        assert body['items'][0]['name'] == 'Product 2'
+        assert body['missing'] == [999]
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+@pytest.mark.parametrize('ids', [[], ['abc'], [1, None], list(range(1, 102))])
+def test_batch_rejects_bad_ids(catalog, method, ids):
+    app, _ = catalog
+    assert 'error' in get_batch(app, ids, method, status=400).json
+
+
+def test_batch_takes_up_to_the_cap(catalog):
+    app, ids = catalog
+    body = get_batch(app, ids + list(range(1000, 1000 + MAX_BATCH_IDS - len(ids))), 'POST').json
+    assert len(body['items']) == 3 and len(body['missing']) == MAX_BATCH_IDS - 3
+    # Duplicates don't count toward the cap
+    assert get_batch(app, ids * 50, 'GET').json['missing'] == []
+
+
+def test_batch_post_needs_a_json_object(catalog):
+    app, _ = catalog
+    app.post('/api/products/batch', b'not json', content_type='application/json', status=400)
+    app.post_json('/api/products/batch', [1, 2], status=400)
@@ -0,0 +1,124 @@
+import threading
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from webtest import TestApp
+
+from ecommerce.models.cart import CartItem
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+from ecommerce.models.reservation import StockHold, StockShard
+from ecommerce.reservations import StockReservations, release_expired_holds, split_stock, utcnow
+
+STOCK = 30
+BUYERS = 6
+
+
+@pytest.fixture
+def flash_sale(make_app, signup):
+    """An app holding stock on add-to-cart, one product with STOCK units and BUYERS buyers."""
+    app = make_app(**{'stock_reservations.enabled': 'true'})
+    seller = signup(app, 'seller1', 'seller@example.com')
+    product = {'name': 'Hot phone', 'description': 'Limited run', 'price': 99.0, 'stock': STOCK}
+    product_id = app.post_json('/api/products', product, headers=seller).json['id']
+    buyers = [signup(app, f'buyer{i}', f'buyer{i}@example.com') for i in range(BUYERS)]
+    return app, product_id, buyers
+
+
+def rush(app, product_id, buyers):
+    """
+    Every buyer adds one unit at a time from its own thread until the
+    product is sold out. Returns the units each buyer got into their cart.
+    """
+    added = [0] * len(buyers)
+
+    def buyer(i):
+        client = TestApp(app.app)
+        while True:
+            response = client.post_json(
+                '/api/cart/items', {'product_id': product_id, 'quantity': 1}, headers=buyers[i], expect_errors=True,
+            )
+            if response.status_int == 200:
+                added[i] += 1
+            elif 'Not enough stock' in response.json.get('error', ''):
+                return
+            # Anything else (SQLite's write lock timing out, a 409) is retried
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(len(buyers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return added
+
+
+@pytest.mark.parametrize('shards', [0, 4])
+def test_concurrent_buyers_never_oversell(flash_sale, shards):
+    app, product_id, buyers = flash_sale
+    engine = DBSession.get_bind()
+    if shards:
+        with Session(bind=engine) as session, session.begin():
+            split_stock(session, product_id, shards)
+
+    added = rush(app, product_id, buyers)
+
+    with Session(bind=engine) as session:
+        held = session.query(func.sum(StockHold.quantity)).filter(StockHold.product_id == product_id).scalar()
+        in_carts = session.query(func.sum(CartItem.quantity)).filter(CartItem.product_id == product_id).scalar()
+        if shards:
+            left = session.query(func.sum(StockShard.stock)).filter(StockShard.product_id == product_id).scalar()
+        else:
+            left = session.query(Product.stock).filter(Product.id == product_id).scalar()
+        negative = (session.query(StockShard).filter(StockShard.stock < 0).count()
+                    + session.query(Product).filter(Product.stock < 0).count())
+    # Sold out exactly: every unit is held by exactly one cart line, none twice
+    assert sum(added) == held == in_carts == STOCK
+    assert left == 0
+    assert not negative
+
+    # Expired holds go back to stock
+    with Session(bind=engine) as session, session.begin():
+        session.execute(update(StockHold).values(expires_at=utcnow() - timedelta(seconds=1)))
+    assert release_expired_holds(engine) == STOCK  # one unit per hold
+    with Session(bind=engine) as session:
+        assert session.query(StockHold).count() == 0
+        assert session.query(Product.stock).filter(Product.id == product_id).scalar() == STOCK
+
+
+@pytest.mark.parametrize('shards', [0, 4])
+def test_concurrent_reserve_calls_never_oversell(flash_sale, shards):
+    # Straight at StockReservations, one hold per transaction and nothing
+    # else in it: through the app, the cart upsert that comes first already
+    # serializes SQLite writers, which would hide a check-then-write race
+    app, product_id, buyers = flash_sale
+    engine = DBSession.get_bind()
+    if shards:
+        with Session(bind=engine) as session, session.begin():
+            split_stock(session, product_id, shards)
+    reservations = StockReservations()
+    held = [0] * BUYERS
+
+    def buyer(i):
+        while True:
+            try:
+                with Session(bind=engine) as session, session.begin():
+                    if reservations.reserve(session, i + 2, product_id, 1) is None:
+                        return
+            except OperationalError:
+                continue  # SQLite's write lock timed out; nothing was taken
+            held[i] += 1
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(BUYERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with Session(bind=engine) as session:
+        assert session.query(func.sum(StockHold.quantity)).scalar() == sum(held) == STOCK
+        assert session.query(Product).filter(Product.stock < 0).count() == 0
+        assert session.query(StockShard).filter(StockShard.stock < 0).count() == 0
+    assert reservations.stats()['reserved'] == STOCK
@@ -0,0 +1,63 @@
+import pytest
+
+
+@pytest.fixture(params=['false', 'true'], ids=['fts', 'index'])
+def shop(request, make_app, signup):
+    """An app searching through FTS5 or the in-memory index, and a seller."""
+    app = make_app(**{'search_index.enabled': request.param})
+    return app, signup(app, 'seller1', 'seller@example.com')
+
+
+def add_products(app, seller, *products):
+    ids = []
+    for name, description in products:
+        product = {'name': name, 'description': description, 'price': 10.0, 'stock': 5}
+        ids.append(app.post_json('/api/products', product, headers=seller).json['id'])
+    return ids
+
+
+def search(app, query, **params):
+    return app.get('/api/search/products', {'q': query, **params}).json
+
+
+def test_name_matches_rank_above_description_matches(shop):
+    app, seller = shop
+    in_description, in_name, unrelated = add_products(
+        app, seller,
+        ('Desk', 'A desk to put your lamp on'),
+        ('Desk lamp', 'Bright and small'),
+        ('Chair', 'Comfortable'),
+    )
+    results = search(app, 'lamp')
+    assert [item['id'] for item in results] == [in_name, in_description]
+    assert results[0]['rank'] >= results[1]['rank']
+
+
+def test_cursor_pages_cover_every_match_once(shop):
+    app, seller = shop
+    ids = add_products(app, seller, *[(f'Lamp {i}', 'lamp ' * (i + 1)) for i in range(7)])
+    add_products(app, seller, ('Chair', 'Comfortable'))
+    everything = [item['id'] for item in search(app, 'lamp')]
+    assert sorted(everything) == sorted(ids)
+
+    paged, cursor = [], None
+    while True:
+        page = search(app, 'lamp', limit=3, **({'cursor': cursor} if cursor else {}))
+        paged += [item['id'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert paged == everything
+
+
+def test_bad_cursor_is_a_400(shop):
+    app, _ = shop
+    app.get('/api/search/products', {'q': 'lamp', 'cursor': 'nonsense'}, status=400)
+
+
+def test_highlights_escape_the_product_text(shop):
+    app, seller = shop
+    add_products(app, seller, ('<img src=x onerror=alert(1)> lamp', 'A <b>bright</b> lamp & shade'))
+    highlight = search(app, 'lamp')[0]['highlight']
+    assert highlight['name'] == '&lt;img src=x onerror=alert(1)&gt; <mark>lamp</mark>'
+    assert highlight['description'] == 'A &lt;b&gt;bright&lt;/b&gt; <mark>lamp</mark> &amp; shade'
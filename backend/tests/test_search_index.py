@@ -0,0 +1,71 @@
+import pytest
+
+from ecommerce.search_index import ProductSearchIndex, edit_distance
+
+
+@pytest.fixture
+def index():
+    index = ProductSearchIndex()
+    index.add(1, 'Apple iPhone 15', 'A phone with a great camera')
+    index.add(2, 'Wireless charger', 'Charges any phone, iPhone included')
+    index.add(3, 'Desk lamp', 'Warm light')
+    return index
+
+
+def ids(hits):
+    return [product_id for product_id, _, _ in hits]
+
+
+@pytest.mark.parametrize('a, b, distance', [
+    ('iphone', 'iphone', 0),
+    ('iphnoe', 'iphone', 1),   # adjacent transposition is one edit
+    ('ipone', 'iphone', 1),
+    ('charjer', 'charger', 1),
+    ('lamp', 'desk', 3),       # past the limit: limit + 1
+])
+def test_edit_distance(a, b, distance):
+    assert edit_distance(a, b, 2) == distance
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('iphone', [1, 2]),    # name match ranks above description match
+    ('iphnoe', [1, 2]),    # transposed letters
+    ('charjer', [2]),      # one substitution
+    ('ipho', [1, 2]),      # prefix while typing
+    ('lamp warm', [3]),    # every word must match
+    ('lmp', []),           # three letters or fewer: no typos forgiven
+    ('zebra', []),
+])
+def test_search_matches_and_ranks(index, query, expected):
+    hits, more = index.search(query, 10)
+    assert ids(hits) == expected
+    assert not more
+
+
+def test_exact_match_scores_above_typo(index):
+    index.add(4, 'Iphnoe stand', '')
+    hits, _ = index.search('iphone', 10)
+    scores = {product_id: score for product_id, score, _ in hits}
+    assert scores[1] > scores[4]
+
+
+def test_update_and_remove(index):
+    index.update(3, 'Floor lamp', 'Tall')
+    assert ids(index.search('desk', 10)[0]) == []
+    assert ids(index.search('floor', 10)[0]) == [3]
+    index.remove(1)
+    index.remove(1)  # removing twice is harmless
+    assert ids(index.search('iphone', 10)[0]) == [2]
+    assert len(index) == 2
+
+
+def test_pages_resume_after_the_last_hit(index):
+    for product_id in range(10, 15):
+        index.add(product_id, f'Phone case {product_id}', '')
+    everything = ids(index.search('phone', 100)[0])
+    first, more = index.search('phone', 3)
+    assert more
+    last_id, last_score, _ = first[-1]
+    rest, more = index.search('phone', 100, after=(last_score, last_id))
+    assert not more
+    assert ids(first) + ids(rest) == everything
@@ -0,0 +1,92 @@
+import time
+
+import jwt
+import pytest
+
+from ecommerce import security
+from ecommerce.security import JWT_SECRET, VerifiedTokenCache, verify_bearer
+
+
+def make_token(**claims):
+    return jwt.encode({'user_id': 1, **claims}, JWT_SECRET, algorithm='HS256')
+
+
+@pytest.fixture
+def decodes(monkeypatch):
+    """Count the jwt.decode calls (signature checks) made by the app."""
+    calls = []
+    real_decode = jwt.decode
+
+    def decode(*args, **kwargs):
+        calls.append(args[0])
+        return real_decode(*args, **kwargs)
+
+    monkeypatch.setattr(security.jwt, 'decode', decode)
+    return calls
+
+
+def test_cache_serves_claims_until_exp():
+    cache = VerifiedTokenCache(max_entries=2)
+    fresh, stale = make_token(exp=time.time() + 60), make_token(exp=time.time() - 1)
+    cache.put(fresh, {'user_id': 1, 'exp': time.time() + 60})
+    cache.put(stale, {'user_id': 1, 'exp': time.time() - 1})
+    cache.put(make_token(), {'user_id': 1})   # no exp: never cached
+
+    assert cache.get(fresh)['user_id'] == 1
+    assert cache.get(stale) is None
+    assert cache.stats() == {'entries': 1, 'max_entries': 2, 'hits': 1, 'misses': 1}
+
+
+def test_cache_is_a_bounded_lru():
+    cache = VerifiedTokenCache(max_entries=2)
+    tokens = [make_token(n=n, exp=time.time() + 60) for n in range(3)]
+    cache.put(tokens[0], {'exp': time.time() + 60})
+    cache.put(tokens[1], {'exp': time.time() + 60})
+    cache.get(tokens[0])
+    cache.put(tokens[2], {'exp': time.time() + 60})
+    assert cache.get(tokens[1]) is None
+    assert cache.get(tokens[0]) is not None and cache.get(tokens[2]) is not None
+
+
+def test_expired_token_is_refused_even_when_cached(app, signup):
+    signup(app)
+    token = make_token(exp=int(time.time()) - 1)
+    cache = app.app.registry.jwt_cache
+    # Cached while it was still valid
+    cache._entries[cache._key(token)] = (time.time() - 1, {'user_id': 1, 'exp': time.time() - 1})
+
+    response = app.get('/api/cart/summary', headers={'Authorization': f'Bearer {token}'}, status=401)
+    assert 'Token expired' in response.text
+    assert cache.stats()['entries'] == 0
+    assert verify_bearer(f'Bearer {token}', cache) == (None, 'Token expired')
+
+
+def test_tampered_signature_never_reaches_the_cache(app, signup, decodes):
+    auth = signup(app)
+    app.get('/api/cart/summary', headers=auth)
+    cache = app.app.registry.jwt_cache
+    before = cache.stats()
+
+    header, payload, signature = auth['Authorization'].split(' ')[1].split('.')
+    tampered = '.'.join([header, payload, ('A' if signature[0] != 'A' else 'B') + signature[1:]])
+    for _ in range(2):
+        response = app.get('/api/cart/summary', headers={'Authorization': f'Bearer {tampered}'}, status=401)
+        assert 'Invalid token' in response.text
+
+    after = cache.stats()
+    assert (after['entries'], after['hits']) == (before['entries'], before['hits'])
+    assert decodes.count(tampered) == 2
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_token_is_decoded_once_per_request(make_app, signup, decodes, cached):
+    app = make_app(**{'jwt_cache.enabled': str(cached).lower()})
+    auth = signup(app)
+    decodes.clear()
+
+    # The tweens and the view all ask for the claims; only the first decodes
+    app.get('/api/cart/summary', headers=auth)
+    assert len(decodes) == 1
+    app.get('/api/cart/summary', headers=auth)
+    app.post_json('/api/cart/items', {'product_id': 1, 'quantity': 1}, headers=auth, status=404)
+    assert len(decodes) == (1 if cached else 3)
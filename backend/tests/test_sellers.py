@@ -0,0 +1,62 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+MIGRATIONS = Path(__file__).resolve().parents[1] / 'alembic' / 'versions'
+
+
+def create_product(app, auth, name='Lamp'):
+    product = {'name': name, 'description': 'd', 'price': 10.0, 'stock': 5}
+    return app.post_json('/api/products', product, headers=auth).json
+
+
+def test_ownership_follows_seller_id_across_a_rename(app, signup):
+    seller = signup(app, 'seller1', 'seller@example.com')
+    other = signup(app, 'other1', 'other@example.com')
+    product = create_product(app, seller)
+    url = f"/api/products/{product['id']}"
+    app.put_json(url, {'price': 1.0}, headers=other, status=403)
+    app.delete(url, headers=other, status=403)
+
+    app.put_json('/api/user/profile', {'username': 'seller2'}, headers=seller)
+    assert app.get(url).json['seller'] == 'seller2'
+    assert [p['id'] for p in app.get('/api/seller/products', headers=seller).json] == [product['id']]
+
+    # Someone taking the old name gets nothing of the seller's
+    newcomer = signup(app, 'seller1', 'newcomer@example.com')
+    assert app.get('/api/seller/products', headers=newcomer).json == []
+    app.put_json(url, {'price': 1.0}, headers=newcomer, status=403)
+
+    assert app.put_json(url, {'price': 12.0}, headers=seller).json['price'] == 12.0
+    app.delete(url, headers=seller)
+    app.get(url, status=404)
+
+
+def test_seller_id_migration_backfills_from_seller_name(tmp_path):
+    pytest.importorskip('alembic')
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+
+    spec = importlib.util.spec_from_file_location(
+        'product_seller_id', MIGRATIONS / '18_10_2026_12_00_00_product_seller_id.py')
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrate.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql('CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL)')
+        connection.exec_driver_sql('CREATE TABLE products (id INTEGER PRIMARY KEY, name VARCHAR, seller VARCHAR)')
+        connection.exec_driver_sql("INSERT INTO users (id, username) VALUES (7, 'alice'), (8, 'bob')")
+        connection.exec_driver_sql(
+            "INSERT INTO products (id, name, seller) VALUES (1, 'a', 'alice'), (2, 'b', 'bob'), "
+            "(3, 'c', 'alice'), (4, 'd', 'gone')")
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+    with engine.connect() as connection:
+        rows = connection.execute(text('SELECT id, seller_id FROM products ORDER BY id')).all()
+        indexes = [row[1] for row in connection.exec_driver_sql('PRAGMA index_list(products)')]
+    engine.dispose()
+    assert [tuple(row) for row in rows] == [(1, 7), (2, 8), (3, 7), (4, None)]
+    assert 'ix_products_seller_id_id' in indexes
@@ -0,0 +1,59 @@
+from ecommerce.suggest import SCAN_LIMIT, ProductSuggestIndex, normalize_prefix
+
+
+def names(suggestions):
+    return [name for _, name, _ in suggestions]
+
+
+def test_normalize_prefix():
+    assert normalize_prefix('  iPhone') == 'iphone'
+    assert normalize_prefix('iphone ') == 'iphone '
+    assert normalize_prefix('!!') == ''
+
+
+def test_suggestions_are_best_sellers_first():
+    index = ProductSuggestIndex()
+    index.add(1, 'iPhone case', 10)
+    index.add(2, 'iPhone 15', 500)
+    index.add(3, 'iPad', 50)
+    index.add(4, 'Lamp', 1000)
+    assert names(index.suggest('ip')) == ['iPhone 15', 'iPad', 'iPhone case']
+    assert names(index.suggest('iphone ')) == ['iPhone 15', 'iPhone case']
+    assert names(index.suggest('ip', limit=1)) == ['iPhone 15']
+    assert index.suggest('zz') == []
+
+
+def test_duplicate_names_are_suggested_once():
+    index = ProductSuggestIndex()
+    index.add(1, 'USB cable', 5)
+    index.add(2, 'usb  Cable', 9)
+    index.add(3, 'USB hub', 1)
+    assert index.suggest('usb') == [(2, 'usb  Cable', 9), (3, 'USB hub', 1)]
+
+
+def test_add_update_sold_and_remove():
+    index = ProductSuggestIndex()
+    index.add(1, 'Desk lamp', 10)
+    index.add(2, 'Desk chair', 20)
+    index.update_sold(1, 30)
+    assert names(index.suggest('desk')) == ['Desk lamp', 'Desk chair']
+    index.update(1, 'Floor lamp', 30)
+    assert names(index.suggest('desk')) == ['Desk chair']
+    index.remove(2)
+    index.remove(2)
+    assert index.suggest('desk') == []
+    assert names(index.suggest('fl')) == ['Floor lamp']
+    assert len(index) == 1
+
+
+def test_cached_prefix_rankings_follow_changes():
+    # Ranges bigger than SCAN_LIMIT are ranked once and cached per prefix
+    index = ProductSuggestIndex()
+    for product_id in range(1, SCAN_LIMIT + 10):
+        index.add(product_id, f'Cable {product_id}', product_id)
+    assert names(index.suggest('c', limit=1)) == [f'Cable {SCAN_LIMIT + 9}']
+    index.update_sold(1, 10 ** 6)
+    assert names(index.suggest('c', limit=1)) == ['Cable 1']
+    index.remove(1)
+    index.add(SCAN_LIMIT + 100, 'Camera', 10 ** 7)
+    assert names(index.suggest('c', limit=2)) == ['Camera', f'Cable {SCAN_LIMIT + 9}']
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from ecommerce.models.cart import Cart, CartItem
+from ecommerce.models.meta import DBSession
+from ecommerce.models.product import Product
+from ecommerce.models.reservation import StockHold
+from ecommerce.reservations import utcnow
+from ecommerce.sweeper import sweep_carts
+
+STOCK = 50
+
+
+@pytest.fixture
+def carts(make_app, signup):
+    """
+    Carts of every kind, with stock held on add-to-cart: five empty ones
+    untouched for two days, one empty from today, three with items
+    untouched for 90 days and one with items from 10 days ago.
+    Returns (app, {kind: [user ids]}).
+    """
+    app = make_app(**{'stock_reservations.enabled': 'true'})
+    seller = signup(app, 'seller1', 'seller@example.com')
+    for name in ('Lamp', 'Desk'):
+        app.post_json('/api/products', {'name': name, 'description': 'd', 'price': 10.0, 'stock': STOCK},
+                      headers=seller)
+    ages = {'old_empty': (5, timedelta(days=2)), 'new_empty': (1, None),
+            'stale': (3, timedelta(days=90)), 'recent': (1, timedelta(days=10))}
+    users = {}
+    for kind, (count, age) in ages.items():
+        users[kind] = []
+        for i in range(count):
+            auth = signup(app, f'{kind}{i}', f'{kind}{i}@example.com')
+            if kind.endswith('empty'):
+                app.get('/api/cart', headers=auth)
+            else:
+                for product_id in (1, 2):
+                    app.post_json('/api/cart/items', {'product_id': product_id, 'quantity': 2}, headers=auth)
+            user_id = app.get('/api/user/profile', headers=auth).json['id']
+            users[kind].append(user_id)
+            if age is not None:
+                with DBSession.get_bind().begin() as connection:
+                    connection.execute(update(Cart).where(Cart.user_id == user_id).values(updated_at=utcnow() - age))
+    return app, users
+
+
+def table_state():
+    with DBSession.get_bind().connect() as connection:
+        return {
+            'cart_users': set(connection.execute(select(Cart.user_id)).scalars()),
+            'items': connection.execute(select(func.count()).select_from(CartItem)).scalar_one(),
+            'held': connection.execute(select(func.coalesce(func.sum(StockHold.quantity), 0))).scalar_one(),
+            'stock': connection.execute(select(Product.stock).order_by(Product.id)).scalars().all(),
+        }
+
+
+def test_dry_run_only_counts(carts):
+    before = table_state()
+    report = sweep_carts(DBSession.get_bind(), dry_run=True, log=lambda line: None)
+    assert (report.carts, report.items, report.batches) == (8, 6, 0)
+    assert table_state() == before
+
+
+def test_sweep_deletes_abandoned_carts_in_batches_and_releases_holds(carts):
+    app, users = carts
+    logged = []
+    report = sweep_carts(DBSession.get_bind(), batch_size=2, log=logged.append)
+    # Empty: 2 + 2 + 1, stale: 2 + 1
+    assert (report.carts, report.items, report.holds, report.batches) == (8, 6, 12, 5)
+    assert len([line for line in logged if ' batch ' in line]) == 5
+
+    state = table_state()
+    assert state['cart_users'] == set(users['new_empty'] + users['recent'])
+    assert state['items'] == 2
+    # Only the recent cart's 2 + 2 units are still held
+    assert state['held'] == 4
+    assert state['stock'] == [STOCK - 2, STOCK - 2]
+
+    again = sweep_carts(DBSession.get_bind(), batch_size=2, log=lambda line: None)
+    assert (again.carts, again.batches) == (0, 0)
@@ -0,0 +1,78 @@
+import pytest
+
+
+def user_lookups(statements):
+    """The statements loading a user by id, i.e. request.user's query."""
+    return [s for s in statements if s.startswith('SELECT users.') and 'WHERE users.id = ?' in s]
+
+
+@pytest.fixture(params=[False, True], ids=['uncached', 'cached'])
+def account(request, make_app, signup):
+    """(app, auth, cached) with identity_cache.enabled off or on."""
+    app = make_app(**{'identity_cache.enabled': str(request.param).lower()})
+    return app, signup(app), request.param
+
+
+def endpoint_counts(app, auth, count_statements):
+    """(statements, user lookups) run by each authenticated endpoint, each after a warming request."""
+    requests = {
+        'profile': lambda: app.get('/api/user/profile', headers=auth),
+        'rename': lambda: app.put_json('/api/user/profile', {'username': 'alice22'}, headers=auth),
+        'password': lambda: app.put_json('/api/user/password',
+                                         {'current_password': 'password1', 'new_password': 'password2'}, headers=auth),
+        'create_product': lambda: app.post_json('/api/products', {'name': 'Lamp', 'description': 'd', 'price': 1.0,
+                                                                  'stock': 1}, headers=auth),
+        'delete_account': lambda: app.delete('/api/user/account', headers=auth),
+    }
+    counts = {}
+    for name, request in requests.items():
+        app.get('/api/user/profile', headers=auth)
+        with count_statements() as statements:
+            request()
+        counts[name] = (statements.count, len(user_lookups(statements)))
+    return counts
+
+
+def test_request_user_is_looked_up_once_per_request(account, count_statements):
+    app, auth, cached = account
+    counts = endpoint_counts(app, auth, count_statements)
+    lookups = {name: count[1] for name, count in counts.items()}
+    if cached:
+        # Only the password change still reads the row, for the hash
+        assert lookups == {'profile': 0, 'rename': 0, 'password': 1, 'create_product': 0, 'delete_account': 0}
+    else:
+        assert set(lookups.values()) == {1}
+
+
+def test_identity_cache_saves_one_statement_per_endpoint(make_app, signup, count_statements):
+    counts = {}
+    for cached in (False, True):
+        app = make_app(**{'identity_cache.enabled': str(cached).lower()})
+        counts[cached] = endpoint_counts(app, signup(app), count_statements)
+    saved = {name: counts[False][name][0] - counts[True][name][0] for name in counts[False]}
+    assert saved == {'profile': 1, 'rename': 1, 'password': 0, 'create_product': 1, 'delete_account': 1}
+
+
+def test_rename_drops_the_cached_identity(account, count_statements):
+    app, auth, cached = account
+    app.get('/api/user/profile', headers=auth)
+    app.put_json('/api/user/profile', {'username': 'alice22'}, headers=auth)
+
+    with count_statements() as statements:
+        assert app.get('/api/user/profile', headers=auth).json['username'] == 'alice22'
+    assert len(user_lookups(statements)) == 1
+    if cached:
+        identity_cache = app.app.registry.identity_cache
+        assert identity_cache.get(1)['username'] == 'alice22'
+
+
+def test_deleted_account_is_not_served_from_the_cache(account):
+    app, auth, cached = account
+    app.get('/api/user/profile', headers=auth)
+    app.delete('/api/user/account', headers=auth)
+
+    app.get('/api/user/profile', headers=auth, status=401)
+    app.post_json('/api/products', {'name': 'Lamp', 'description': 'd', 'price': 1.0, 'stock': 1},
+                  headers=auth, status=401)
+    if cached:
+        assert app.app.registry.identity_cache.stats()['entries'] == 0